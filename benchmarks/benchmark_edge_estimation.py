@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from edge_estimation import ClusterModel, SolarEstimator, MINUTES_PER_DAY
+
+# Number of days of the synthetic stream of readings
+DAYS = 7
+
+
+def make_model(capacity=4.0):
+    """
+    This method creates a cluster model with a bell-shaped clear-sky profile between 6:00 and 20:00.
+
+    :param capacity: the capacity of the cluster
+
+    :return:         the synthetic model
+    """
+    minutes = np.arange(MINUTES_PER_DAY)
+    profile = np.clip(np.sin(np.pi * (minutes - 360) / 840), 0, None) * 0.85
+    return ClusterModel(capacity, np.tile(profile, (12, 1)))
+
+
+def make_stream(model, days=DAYS, clearness=0.7, seed=0):
+    """
+    This method creates a synthetic stream of MAINS readings: a noisy consumption minus the production of a sky with
+    constant clearness.
+
+    :param model:     the cluster model of the installation
+    :param days:      the number of days of the stream
+    :param clearness: the clearness of the sky
+    :param seed:      the seed of the random generator
+
+    :return:          the local times, the MAINS readings and the true production
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2024-06-01', periods=days * MINUTES_PER_DAY, freq='min')
+    production = clearness * model.capacity * model.profiles[times.month - 1, times.hour * 60 + times.minute]
+    consumption = 1.0 + 0.1 * rng.standard_normal(len(times))
+    return times.to_pydatetime(), consumption - production, production
+
+
+def main():
+    model = make_model()
+    times, mains, production = make_stream(model)
+    estimator = SolarEstimator(model)
+
+    # Measure the latency of each reading and the memory that the estimator allocates
+    latencies = np.empty(len(times))
+    estimates = np.empty(len(times))
+    tracemalloc.start()
+    for i, (timestamp, reading) in enumerate(zip(times, mains)):
+        start = time.perf_counter()
+        estimates[i], _ = estimator.update(timestamp, float(reading))
+        latencies[i] = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Evaluate the estimates of the last day, after the estimator has converged
+    last_day = slice(-MINUTES_PER_DAY, None)
+    error = np.abs(estimates[last_day] - production[last_day]).mean()
+
+    print(f'readings: {len(times)}')
+    print(f'latency per reading: median {np.median(latencies) * 1e6:.1f} us, '
+          f'p99 {np.percentile(latencies, 99) * 1e6:.1f} us')
+    print(f'model size: {(model.profiles.nbytes + model.cumulative.nbytes) / 1024:.1f} KB, '
+          f'peak traced memory: {peak / 1024:.1f} KB')
+    print(f'mean absolute error of the last day: {error:.3f} kW')
+
+
+if __name__ == '__main__':
+    main()
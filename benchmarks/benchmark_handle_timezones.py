@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from useful_methods import handle_timezones
+
+# Months under examination: two months with a DST transition and one without
+MONTHS = {'march (DST starts)': ('2024-03-01', '2024-03-31 23:59'),
+          'november (DST ends)': ('2024-11-01', '2024-11-30 23:59'),
+          'april (no DST)': ('2024-04-01', '2024-04-30 23:59')}
+
+# Number of repetitions of each measurement
+REPEATS = 20
+
+
+def make_month(start, stop, shuffled=False, seed=0):
+    """
+    This method creates one month of synthetic 1-minute solar data with a naive local time index, as in the raw files.
+
+    :param start:    the first minute of the month
+    :param stop:     the last minute of the month
+    :param shuffled: whether to shuffle the rows and add duplicated minutes, to exercise the sort/duplicate path
+    :param seed:     the seed of the random generator
+
+    :return:         the synthetic dataframe
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, stop, freq='min', name='localminute')
+
+    if shuffled:
+        index = index.append(index[rng.integers(0, len(index), 100)])
+        index = index[rng.permutation(len(index))]
+
+    return pd.DataFrame({'SOLAR': rng.random(len(index))}, index=index)
+
+
+def benchmark(data, timezone):
+    """
+    This method measures the time that handle_timezones takes on a dataframe.
+
+    :param data:     the dataframe under examination
+    :param timezone: the target timezone
+
+    :return:         the best duration (in seconds) over the repetitions
+    """
+    durations = []
+    for _ in range(REPEATS):
+        copy = data.copy()
+        start = time.perf_counter()
+        handle_timezones(copy, timezone)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    for name, (start, stop) in MONTHS.items():
+        for shuffled in (False, True):
+            data = make_month(start, stop, shuffled)
+            for timezone in ('America/Chicago', 'America/Los_Angeles'):
+                seconds = benchmark(data, timezone)
+                print(f"{name:22s} {'shuffled' if shuffled else 'sorted':8s} {timezone:20s} "
+                      f"{seconds * 1000:8.2f} ms {len(data) / seconds / 1e6:8.2f} M rows/s")
+
+
+if __name__ == '__main__':
+    main()
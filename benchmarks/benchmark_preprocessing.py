@@ -0,0 +1,227 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import preprocessing
+from parallel_processing import run_in_parallel
+from useful_methods import handle_timezones, get_sunrise_sunset_series, map_sunrise_sunset_to_index, \
+    zero_out_solar_between_sunrise_sunset, correct_solar_zeros_between_sunrise_sunset
+from sanitization import sanitize, SIGNAL_RULES
+from sunrise_sunset_cache import SunriseSunsetCache
+from quantile_sketch import QuantileSketch
+from capacity_estimation import CAPACITY_QUANTILE
+from synthetic_data import make_solar_data, write_fleet
+
+# Path of the stored results of all the runs
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'preprocessing.csv')
+
+# Timezone of the synthetic installation
+TIMEZONE = 'America/Los_Angeles'
+
+# Number of repetitions of each measurement
+REPEATS = 5
+
+
+def get_version():
+    """
+    This method returns the git revision of the code under examination.
+
+    :return: the short hash of the revision (with '+' if there are uncommitted changes), or 'unknown'
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, text=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return revision + ('+' if dirty.strip() else '')
+
+
+def measure(function, setup):
+    """
+    This method measures the best duration and the peak memory of a stage.
+
+    :param function: the stage, called with the result of setup
+    :param setup:    a function that prepares a fresh input of the stage (not measured)
+
+    :return:         the best duration (in seconds) over the repetitions and the peak memory (in MB) of one run
+    """
+    durations = []
+    for _ in range(REPEATS):
+        argument = setup()
+        start = time.perf_counter()
+        function(argument)
+        durations.append(time.perf_counter() - start)
+
+    # Measure the memory in a separate run, because tracing slows the stage down
+    argument = setup()
+    tracemalloc.start()
+    function(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(durations), peak / 2 ** 20
+
+
+def get_stages(raw, directory):
+    """
+    This method prepares the stages under examination on the same synthetic data.
+
+    :param raw:       the synthetic raw data
+    :param directory: a temporary directory for the stages that read files
+
+    :return:          a dictionary mapping the name of each stage to its function and its setup
+    """
+
+    # Prepare the inputs of each stage with the previous stages
+    sanitized = raw.copy()
+    sanitize(sanitized, {'SOLAR': SIGNAL_RULES['SOLAR']})
+    localized = handle_timezones(sanitized.copy(), TIMEZONE)
+    days = localized.index.normalize().tz_localize(None).unique()
+    sunrise, sunset = map_sunrise_sunset_to_index(localized.index, get_sunrise_sunset_series(days, TIMEZONE))
+    zeroed = zero_out_solar_between_sunrise_sunset(localized.copy(), sunrise, sunset)
+    positive = zeroed['SOLAR'][zeroed['SOLAR'] > 0]
+
+    # Write the raw data as a raw file for the end-to-end stage
+    path = os.path.join(directory, 'installation_SOLAR_synthetic.parquet')
+    raw.to_parquet(path)
+    preprocessing.sun_times_cache = SunriseSunsetCache()
+
+    return {
+        'sanitize': (lambda data: sanitize(data, {'SOLAR': SIGNAL_RULES['SOLAR']}), raw.copy),
+        'handle_timezones': (lambda data: handle_timezones(data, TIMEZONE), sanitized.copy),
+        'sunrise_sunset': (lambda dates: get_sunrise_sunset_series(dates, TIMEZONE), lambda: days),
+        'zero_out_solar': (lambda data: zero_out_solar_between_sunrise_sunset(data, sunrise, sunset), localized.copy),
+        'correct_solar_zeros': (lambda data: correct_solar_zeros_between_sunrise_sunset(data, sunrise, sunset),
+                                zeroed.copy),
+        'capacity_exact_quantile': (lambda values: values.quantile(CAPACITY_QUANTILE), lambda: positive),
+        'capacity_sketch': (lambda values: QuantileSketch().add(values).quantile(CAPACITY_QUANTILE),
+                            lambda: zeroed['SOLAR'].to_numpy()),
+        'clean_solar_file': (lambda file: preprocessing.clean_solar_file(file, TIMEZONE), lambda: path),
+    }
+
+
+def benchmark_fleet(installations, workers, directory):
+    """
+    This method measures the preprocessing of a synthetic fleet of installations, from the raw files to the cleaned
+    dataset.
+
+    :param installations: the number of installations
+    :param workers:       the number of worker processes
+    :param directory:     a temporary directory for the raw files and the cleaned dataset
+
+    :return:              the duration (in seconds) and the number of cleaned rows
+    """
+    root = os.path.join(directory, 'raw')
+    fleet = write_fleet(root, installations)
+
+    # Build one task per installation with its raw files
+    tasks = {}
+    for installation, timezone in zip(fleet['installation'], fleet['timezone']):
+        files = sorted(os.path.join(root, installation, name) for name in os.listdir(os.path.join(root, installation)))
+        tasks[installation] = (installation, timezone, files)
+
+    # Write the cleaned dataset, the cache and the manifest in the temporary directory
+    cwd = os.getcwd()
+    os.chdir(directory)
+    os.makedirs('data', exist_ok=True)
+    try:
+        start = time.perf_counter()
+        report = run_in_parallel(preprocessing.preprocess_installation, tasks, workers=workers,
+                                 initializer=preprocessing.initialize_worker,
+                                 initargs=(preprocessing.SUN_TIMES_CACHE_PATH,), verbose=False)
+        seconds = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+
+    return seconds, int(report['rows'].sum())
+
+
+def compare_with_previous(results, previous, threshold):
+    """
+    This method compares the results of the run with the last run of another version.
+
+    :param results:   the results of the run
+    :param previous:  the stored results of all the previous runs
+    :param threshold: the slowdown ratio above which a stage is reported as a regression
+
+    :return:          the results with the duration of the previous version and the slowdown ratio
+    """
+    other = previous[previous['version'] != results['version'].iloc[0]]
+    if other.empty:
+        return results
+
+    # Keep the last run of the last other version
+    last = other[other['version'] == other['version'].iloc[-1]].drop_duplicates(['stage', 'days'], keep='last')
+    comparison = results.merge(last[['stage', 'days', 'version', 'seconds']], on=['stage', 'days'], how='left',
+                               suffixes=('', '_previous'))
+    comparison['slowdown'] = comparison['seconds'] / comparison['seconds_previous']
+
+    for _, row in comparison[comparison['slowdown'] > threshold].iterrows():
+        print(f"REGRESSION {row['stage']} ({row['days']} days): {row['slowdown']:.2f}x slower than "
+              f"{row['version_previous']}")
+
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the preprocessing stages on synthetic 1-minute data.')
+    parser.add_argument('--days', type=int, nargs='+', default=[7, 31, 365], help='sizes of the data in days')
+    parser.add_argument('--stages', nargs='+', help='stages to benchmark (all by default)')
+    parser.add_argument('--fleet', type=int, default=0, help='number of synthetic installations to preprocess')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes of the fleet run')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio reported as a regression')
+    parser.add_argument('--no-store', action='store_true', help='do not store the results')
+    args = parser.parse_args()
+
+    version = get_version()
+    run_at = pd.Timestamp.now().isoformat(timespec='seconds')
+
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for days in args.days:
+
+            # Create the synthetic data, starting before the end of the DST in November
+            start = pd.Timestamp('2024-11-03') - pd.Timedelta(days=days // 2)
+            raw = make_solar_data(start, start + pd.Timedelta(days=days) - pd.Timedelta(minutes=1), seed=days)
+
+            for stage, (function, setup) in get_stages(raw, directory).items():
+                if args.stages and stage not in args.stages:
+                    continue
+                seconds, peak = measure(function, setup)
+                records.append({'run_at': run_at, 'version': version, 'stage': stage, 'days': days,
+                                'rows': len(raw), 'seconds': seconds, 'rows_per_second': len(raw) / seconds,
+                                'peak_mb': peak})
+                print(f'{stage:24s} {days:4d} days {seconds * 1000:10.2f} ms {len(raw) / seconds / 1e6:8.2f} M rows/s '
+                      f'{peak:8.1f} MB')
+
+        # Preprocess a synthetic fleet of installations end to end
+        if args.fleet:
+            seconds, rows = benchmark_fleet(args.fleet, args.workers, directory)
+            records.append({'run_at': run_at, 'version': version, 'stage': f'fleet_{args.workers}_workers',
+                            'days': args.fleet, 'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds,
+                            'peak_mb': np.nan})
+            print(f'fleet of {args.fleet} installations ({args.workers} workers) {seconds:.2f} s '
+                  f'{rows / seconds / 1e6:8.2f} M rows/s')
+
+    results = pd.DataFrame(records)
+
+    # Compare with the previous version and store the results
+    previous = pd.read_csv(RESULTS_PATH) if os.path.exists(RESULTS_PATH) else pd.DataFrame(columns=results.columns)
+    compare_with_previous(results, previous, args.threshold)
+    if not args.no_store:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        results.to_csv(RESULTS_PATH, mode='a', header=not os.path.exists(RESULTS_PATH), index=False)
+
+
+if __name__ == '__main__':
+    main()
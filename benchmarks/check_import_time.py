@@ -0,0 +1,76 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Directory of the modules under examination
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import-time budget of each entry point (in milliseconds) and the heavy modules that it must not import
+IMPORT_BUDGETS = {
+    'cli': (50, ('numpy', 'pandas', 'pyarrow', 'sklearn', 'matplotlib')),
+    'edge_estimation': (250, ('pandas', 'pyarrow', 'sklearn', 'matplotlib')),
+    # The streaming cleaner keeps pandas: it localizes and yields pd.Timestamps, and it shares the sanitization
+    # rules and the sunrise/sunset cache of the batch cleaning, which are built on pandas
+    'streaming_cleaning': (1000, ('sklearn', 'matplotlib')),
+    'preprocessing': (1500, ('sklearn', 'matplotlib')),
+    'preprocessing_mains': (1500, ('sklearn', 'matplotlib')),
+    'fleet_batch': (1500, ('sklearn', 'matplotlib')),
+    'clustering_of_capacities': (1500, ('sklearn', 'matplotlib')),
+}
+
+# Number of cold imports of each module
+REPEATS = 5
+
+
+def measure_import(module):
+    """
+    This method imports a module in a fresh interpreter and measures the import with -X importtime.
+
+    :param module: the module under examination
+
+    :return:       the cumulative import time of the module (in milliseconds) and the set of the imported modules
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             f'import sys, {module}; print(" ".join(sys.modules))'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+
+    # Find the line of the module itself, whose second field is the cumulative time in microseconds
+    cumulative = None
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1])
+
+    return cumulative / 1000, set(result.stdout.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of the entry points against their budget.')
+    parser.add_argument('--modules', nargs='+', default=list(IMPORT_BUDGETS), help='entry points to check')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help='cold imports of each module')
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        budget, forbidden = IMPORT_BUDGETS[module]
+
+        # Keep the best of the cold imports, to leave out the noise of the machine
+        measurements = [measure_import(module) for _ in range(args.repeats)]
+        milliseconds = min(milliseconds for milliseconds, _ in measurements)
+        imported = sorted(name for name in forbidden if name in measurements[0][1])
+
+        status = 'ok'
+        if milliseconds > budget:
+            status = 'OVER BUDGET'
+            failures.append(module)
+        if imported:
+            status = f"imports {', '.join(imported)}"
+            failures.append(module)
+        print(f'{module:28s} {milliseconds:8.1f} ms (budget {budget:5d} ms) {status}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
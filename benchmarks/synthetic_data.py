@@ -0,0 +1,120 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from solar_position import compute_solar_elevation
+from useful_methods import DEFAULT_TIMEZONE, TIMEZONE_COORDINATES
+
+
+def make_solar_data(start, stop, capacity=5.0, timezone='America/Chicago', cloudiness=0.3, gap_rate=0.002,
+                    missing_rate=0.01, seed=0):
+    """
+    This method creates realistic 1-minute solar measurements with a naive local time index, as in the raw files: a
+    clear-sky curve that follows the solar elevation, passing clouds, sensor dropouts (runs of zeros in the daylight),
+    missing values and small negative readings at night.
+
+    :param start:        the first minute of the data (local time)
+    :param stop:         the last minute of the data (local time)
+    :param capacity:     the capacity of the installation (kW)
+    :param timezone:     the timezone whose reference city is the location of the installation
+    :param cloudiness:   the mean attenuation of the production by the clouds (0 for clear sky)
+    :param gap_rate:     the probability that a dropout starts at a minute
+    :param missing_rate: the probability that a minute is missing (NaN)
+    :param seed:         the seed of the random generator
+
+    :return:             the dataframe with the 'SOLAR' column
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, stop, freq='min', name='localminute')
+    n = len(index)
+
+    # Compute the clear-sky production from the elevation of the sun (the raw times are in the default timezone)
+    local = index.tz_localize(DEFAULT_TIMEZONE, ambiguous=np.zeros(n, dtype=bool), nonexistent=pd.Timedelta(hours=1))
+    latitude, longitude = TIMEZONE_COORDINATES.get(timezone, TIMEZONE_COORDINATES[DEFAULT_TIMEZONE])
+    elevation = compute_solar_elevation(local, latitude, longitude)
+    solar = capacity * 0.85 * np.clip(np.sin(np.radians(elevation)), 0, None) ** 1.2
+
+    # Attenuate the production with clouds that pass over a few minutes (an AR(1) process)
+    if cloudiness > 0:
+        noise = rng.standard_normal(n)
+        clouds = np.empty(n)
+        clouds[0] = noise[0]
+        for i in range(1, n):
+            clouds[i] = 0.97 * clouds[i - 1] + 0.25 * noise[i]
+        solar *= 1 - cloudiness * (1 / (1 + np.exp(-2 * clouds)))
+
+    # Add small negative readings at night and the measurement noise
+    solar += np.where(solar > 0, 0.01 * rng.standard_normal(n), -0.005 * rng.random(n))
+
+    # Add dropouts (runs of 1 to 30 zeros) and missing values
+    starts = np.flatnonzero(rng.random(n) < gap_rate)
+    for gap_start, length in zip(starts, rng.integers(1, 31, len(starts))):
+        solar[gap_start:gap_start + length] = 0
+    solar[rng.random(n) < missing_rate] = np.nan
+
+    return pd.DataFrame({'SOLAR': solar}, index=index)
+
+
+def make_mains_data(solar, base_load=1.0, seed=0):
+    """
+    This method creates the mains measurements that correspond to solar measurements: a consumption with a daily
+    pattern and spikes, minus the solar production.
+
+    :param solar:     the solar measurements
+    :param base_load: the mean consumption (kW)
+    :param seed:      the seed of the random generator
+
+    :return:          the dataframe with the 'MAINS' column
+    """
+    rng = np.random.default_rng(seed)
+    n = len(solar)
+    hours = np.asarray(solar.index.hour + solar.index.minute / 60)
+    consumption = base_load * (1 + 0.5 * np.sin(np.pi * (hours - 6) / 12) ** 2) + 0.2 * rng.random(n)
+    consumption[rng.random(n) < 0.001] = 60.0
+    return pd.DataFrame({'MAINS': consumption - np.nan_to_num(solar['SOLAR'].to_numpy())}, index=solar.index)
+
+
+def write_fleet(root, installations=10, months=('2024-03', '2024-11'), timezones=None, mains=False, seed=0):
+    """
+    This method writes the raw files of a synthetic fleet of installations with the layout of the dataset
+    (one directory per installation and one file per month and signal).
+
+    :param root:          the directory of the synthetic dataset
+    :param installations: the number of installations
+    :param months:        the months of the files (by default two months with a DST transition)
+    :param timezones:     the timezones of the installations (by default all the timezones of the dataset in turn)
+    :param mains:         whether to write the mains (IDD) files as well
+    :param seed:          the seed of the random generator
+
+    :return:              a dataframe with the installation, the timezone and the capacity of each installation
+    """
+    rng = np.random.default_rng(seed)
+    timezones = list(TIMEZONE_COORDINATES) if timezones is None else list(timezones)
+
+    fleet = []
+    for i in range(installations):
+        installation = f'installation{i}'
+        timezone = timezones[i % len(timezones)]
+        capacity = float(rng.choice([2.0, 4.0, 8.0]) * rng.uniform(0.8, 1.2))
+        directory = os.path.join(root, installation)
+        os.makedirs(directory, exist_ok=True)
+
+        for j, month in enumerate(months):
+            start = pd.Timestamp(f'{month}-01')
+            stop = start + pd.offsets.MonthEnd(0) + pd.Timedelta(hours=23, minutes=59)
+            period = f"{start.strftime('%Y%m%d')}_{stop.strftime('%Y%m%d')}"
+
+            solar = make_solar_data(start, stop, capacity, timezone, cloudiness=rng.uniform(0, 0.6),
+                                    seed=seed + 1000 * i + j)
+            solar.to_parquet(os.path.join(directory, f'{installation}_SOLAR_{period}.parquet'))
+            if mains:
+                make_mains_data(solar, seed=seed + 1000 * i + j).to_parquet(
+                    os.path.join(directory, f'{installation}_{period}_IDD.parquet'))
+
+        fleet.append((installation, timezone, capacity))
+
+    return pd.DataFrame(fleet, columns=['installation', 'timezone', 'capacity'])
@@ -0,0 +1,205 @@
+import bisect
+import json
+
+import numpy as np
+import pandas as pd
+
+# Path where the fitted clusters of the capacities are stored
+CLUSTERS_PATH = 'data//capacity_clusters.json'
+
+# Number of installations above which the clusters are fitted with MiniBatchKMeans instead of the exact method
+EXACT_CLUSTERING_LIMIT = 50000
+
+
+def _segment_costs(sums, squares, starts, stop):
+    """
+    This method computes the sum of the squared deviations of the sorted values in the segments [start, stop).
+
+    :param sums:    the cumulative sums of the sorted values (with a leading 0)
+    :param squares: the cumulative sums of the squared sorted values (with a leading 0)
+    :param starts:  the first indices of the segments
+    :param stop:    the end index of the segments
+
+    :return:        the cost of each segment
+    """
+    counts = stop - starts
+    totals = sums[stop] - sums[starts]
+    return squares[stop] - squares[starts] - totals * totals / counts
+
+
+def fit_optimal_1d(values, n_clusters=3):
+    """
+    This method finds the optimal k-means clustering of one-dimensional values. The clusters of sorted values are
+    contiguous, so the clustering is a dynamic program over the sorted values, solved layer by layer with the divide
+    and conquer optimization (the optimal split points are monotone), in O(k n log n).
+
+    :param values:     the values under examination
+    :param n_clusters: the number of clusters
+
+    :return:           the sorted centers of the clusters
+    """
+    values = np.sort(np.asarray(values, dtype=float))
+    n = len(values)
+    n_clusters = min(n_clusters, len(np.unique(values)))
+    if n_clusters < 1:
+        raise ValueError('At least one value is needed to fit the clusters')
+
+    # Center the values to keep the cumulative sums precise
+    shifted = values - values.mean()
+    sums = np.concatenate(([0.0], np.cumsum(shifted)))
+    squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+
+    # Cost of the first cluster ending at each index, and the start of the last cluster of each optimal solution
+    costs = np.full(n + 1, np.inf)
+    costs[1:] = _segment_costs(sums, squares, np.zeros(n, dtype=np.int64), np.arange(1, n + 1))
+    splits = np.zeros((n_clusters, n + 1), dtype=np.int64)
+
+    for layer in range(1, n_clusters):
+        previous = costs
+        costs = np.full(n + 1, np.inf)
+
+        # Compute the middle stop of each range with the candidate starts that its optimum allows
+        stack = [(layer + 1, n, layer, n - 1)]
+        while stack:
+            low, high, first, last = stack.pop()
+            if low > high:
+                continue
+            middle = (low + high) // 2
+            starts = np.arange(first, min(last, middle - 1) + 1)
+            candidates = previous[starts] + _segment_costs(sums, squares, starts, middle)
+            best = int(np.argmin(candidates))
+            costs[middle] = candidates[best]
+            splits[layer, middle] = starts[best]
+            stack.append((low, middle - 1, first, starts[best]))
+            stack.append((middle + 1, high, starts[best], last))
+
+    # Walk the split points back from the end of the values
+    centers = []
+    stop = n
+    for layer in range(n_clusters - 1, -1, -1):
+        start = splits[layer, stop]
+        centers.append(values[start:stop].mean())
+        stop = start
+
+    return np.array(centers[::-1])
+
+
+def fit_minibatch_1d(values, n_clusters=3, batch_size=4096):
+    """
+    This method clusters one-dimensional values with MiniBatchKMeans, for fleets too large for the exact method.
+
+    :param values:     the values under examination
+    :param n_clusters: the number of clusters
+    :param batch_size: the number of values of each mini batch
+
+    :return:           the sorted centers of the clusters
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=42, n_init=3)
+    kmeans.fit(np.asarray(values, dtype=float).reshape(-1, 1))
+    return np.sort(kmeans.cluster_centers_.ravel())
+
+
+class CapacityClusters:
+    """
+    This class holds the fitted clusters of the capacities. In one dimension the clusters of the nearest centers are
+    intervals, so the clusters are kept as their sorted centers and the boundaries between them, and a capacity is
+    assigned with a binary search over the k - 1 boundaries. The clusters are numbered from the smallest to the
+    largest capacities.
+    """
+
+    def __init__(self, centers):
+        """
+        :param centers: the centers of the clusters
+        """
+        self.centers = np.sort(np.asarray(centers, dtype=float))
+        self.boundaries = ((self.centers[:-1] + self.centers[1:]) / 2).tolist()
+
+    @classmethod
+    def fit(cls, capacities, n_clusters=3, method='auto', batch_size=4096):
+        """
+        This method fits the clusters of the capacities.
+
+        :param capacities: the capacities under examination
+        :param n_clusters: the number of clusters
+        :param method:     'exact', 'minibatch' or 'auto' (exact up to EXACT_CLUSTERING_LIMIT capacities)
+        :param batch_size: the number of values of each mini batch of the 'minibatch' method
+
+        :return:           the fitted clusters
+        """
+        capacities = np.asarray(capacities, dtype=float)
+        capacities = capacities[np.isfinite(capacities)]
+
+        if method == 'auto':
+            method = 'exact' if len(capacities) <= EXACT_CLUSTERING_LIMIT else 'minibatch'
+        if method == 'exact':
+            return cls(fit_optimal_1d(capacities, n_clusters))
+        if method == 'minibatch':
+            return cls(fit_minibatch_1d(capacities, n_clusters, batch_size))
+        raise ValueError(f'Unknown clustering method: {method}')
+
+    def assign(self, capacity):
+        """
+        This method assigns one capacity to its cluster in O(log k).
+
+        :param capacity: the capacity under examination
+
+        :return:         the cluster of the capacity
+        """
+        return bisect.bisect_right(self.boundaries, capacity)
+
+    def assign_many(self, capacities):
+        """
+        This method assigns many capacities to their clusters.
+
+        :param capacities: the capacities under examination
+
+        :return:           the array with the cluster of each capacity
+        """
+        return np.searchsorted(self.boundaries, np.asarray(capacities, dtype=float), side='right')
+
+    def save(self, path=CLUSTERS_PATH):
+        """
+        This method stores the centers and the boundaries of the clusters as JSON.
+
+        :param path: the path of the JSON file
+        """
+        with open(path, 'w') as file:
+            json.dump({'centers': self.centers.tolist(), 'boundaries': self.boundaries}, file, indent=2)
+
+    @classmethod
+    def load(cls, path=CLUSTERS_PATH):
+        """
+        This method loads stored clusters.
+
+        :param path: the path of the JSON file
+
+        :return:     the stored clusters
+        """
+        with open(path) as file:
+            return cls(json.load(file)['centers'])
+
+
+def summarize_clusters(capacities, clusters):
+    """
+    This method summarizes the clusters of the installations from the capacities table.
+
+    :param capacities: the capacities table with the capacity, the cluster and the number_of_files of each
+                       installation
+    :param clusters:   the fitted clusters
+
+    :return:           a dataframe with the center, the capacity range, the median capacity, the number of
+                       installations and the number of files of each cluster
+    """
+    bounds = np.concatenate(([-np.inf], clusters.boundaries, [np.inf]))
+    groups = capacities.groupby('cluster')
+
+    summary = pd.DataFrame({'center': clusters.centers, 'lower': bounds[:-1], 'upper': bounds[1:]},
+                           index=pd.RangeIndex(len(clusters.centers), name='cluster'))
+    summary['median_values'] = groups['capacity'].median()
+    summary['installations'] = groups.size()
+    if 'number_of_files' in capacities:
+        summary['number_of_files'] = groups['number_of_files'].sum()
+
+    return summary.fillna({'installations': 0})
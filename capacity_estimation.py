@@ -0,0 +1,131 @@
+import sqlite3
+
+from quantile_sketch import QuantileSketch, DEFAULT_RELATIVE_ACCURACY
+from parquet_reader import read_columns
+from dataset_catalog import parse_file_name, select_files
+
+# Quantile of the positive solar values that is used as the capacity of an installation
+CAPACITY_QUANTILE = 0.98
+
+# Path of the store of the per-file sketches
+SKETCH_STORE_PATH = 'data//capacity_sketches.sqlite'
+
+
+def sketch_solar_file(path, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """
+    This method reads a solar file and builds the quantile sketch of its positive values.
+
+    :param path:              the path of the solar file
+    :param relative_accuracy: the relative accuracy of the sketch
+
+    :return:                  the sketch of the positive solar values of the file
+    """
+
+    # Read only the solar values of the file as float32 (the missing values are NaN and are ignored by the sketch)
+    _, values = read_columns(path, ['SOLAR'])
+
+    # Add the positive values to the sketch
+    return QuantileSketch(relative_accuracy).add(values['SOLAR'])
+
+
+class SketchStore:
+    """
+    This class persists the quantile sketch of every solar file in an SQLite file, so that the capacity over any set
+    of months can be recomputed without reading the raw data again. A sketch is rebuilt only when the size or the
+    modification time of its file changes.
+    """
+
+    def __init__(self, path=SKETCH_STORE_PATH, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """
+        :param path:              the path of the SQLite file
+        :param relative_accuracy: the relative accuracy of the sketches
+        """
+        self.relative_accuracy = relative_accuracy
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS sketches ('
+                                 'path TEXT PRIMARY KEY, installation TEXT, start TEXT, stop TEXT, '
+                                 'size INTEGER, mtime REAL, relative_accuracy REAL, offset INTEGER, counts BLOB)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS sketches_installation ON sketches (installation)')
+        self._connection.commit()
+
+        # Number of sketches that were read from the store and built from the raw files
+        self.reused = 0
+        self.built = 0
+
+    def get_sketch(self, installation, path, size, mtime):
+        """
+        This method returns the sketch of a solar file, building and storing it if it is missing or outdated.
+
+        :param installation: the installation of the file
+        :param path:         the path of the file
+        :param size:         the size of the file (as recorded in the catalog)
+        :param mtime:        the modification time of the file (as recorded in the catalog)
+
+        :return:             the sketch of the positive solar values of the file
+        """
+        row = self._connection.execute('SELECT size, mtime, relative_accuracy, offset, counts FROM sketches '
+                                       'WHERE path = ?', (path,)).fetchone()
+
+        # Reuse the stored sketch if the file did not change
+        if row is not None and row[:3] == (size, mtime, self.relative_accuracy):
+            self.reused += 1
+            return QuantileSketch.from_bytes(row[4], row[3], self.relative_accuracy)
+
+        # Build the sketch from the raw file and store it
+        sketch = sketch_solar_file(path, self.relative_accuracy)
+        _, start, stop = parse_file_name(path)
+        self._connection.execute('INSERT OR REPLACE INTO sketches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (path, installation, start.strftime('%Y-%m-%d'), stop.strftime('%Y-%m-%d'),
+                                  size, mtime, self.relative_accuracy, sketch.offset, sketch.to_bytes()))
+        self._connection.commit()
+        self.built += 1
+
+        return sketch
+
+    def close(self):
+        """
+        This method closes the SQLite file of the store.
+        """
+        self._connection.close()
+
+
+def estimate_capacity(catalog, installation, store, months=None, years=(2023, 2024), quantile=CAPACITY_QUANTILE):
+    """
+    This method estimates the capacity of an installation as a quantile of the positive solar values of all its
+    files, merging the per-file sketches instead of reading one sample month.
+
+    :param catalog:      the catalog of the dataset
+    :param installation: the installation under examination
+    :param store:        the store of the per-file sketches
+    :param months:       the months (1-12) of the files that are taken into account (None for all the months)
+    :param years:        the years of the files that are taken into account (None for all the years)
+    :param quantile:     the quantile that is used as the capacity
+
+    :return:             the estimated capacity and the number of files it was computed from
+    """
+
+    # Retrieve the solar files of the installation
+    files = select_files(catalog, installation, 'SOLAR', years)
+    if months is not None:
+        files = files[files['stop'].dt.month.isin(months)]
+
+    return estimate_capacity_from_files(installation, files, store, quantile)
+
+
+def estimate_capacity_from_files(installation, files, store, quantile=CAPACITY_QUANTILE):
+    """
+    This method estimates the capacity of an installation from a selection of its catalog rows, merging the sketches
+    of the files.
+
+    :param installation: the installation under examination
+    :param files:        the catalog rows of the solar files that are taken into account
+    :param store:        the store of the per-file sketches
+    :param quantile:     the quantile that is used as the capacity
+
+    :return:             the estimated capacity and the number of files it was computed from
+    """
+    sketch = QuantileSketch(store.relative_accuracy)
+    for file in files.itertuples():
+        sketch.merge(store.get_sketch(installation, file.path, file.size, file.mtime))
+
+    return sketch.quantile(quantile), len(files)
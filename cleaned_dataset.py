@@ -0,0 +1,248 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Directory of the cleaned solar dataset, partitioned by installation and month
+CLEANED_DATASET_DIRECTORY = 'data//solar'
+
+# Directory of the combined solar and mains dataset, partitioned by installation and month
+NET_LOAD_DATASET_DIRECTORY = 'data//net_load'
+
+# Name of the time index of the cleaned data
+INDEX_NAME = 'localminute'
+
+# Compression of the parquet files
+COMPRESSION = 'zstd'
+
+
+def get_installation_directory(installation, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method returns the partition directory of an installation.
+
+    :param installation: the installation under examination
+    :param root:         the directory of the cleaned dataset
+
+    :return:             the path of the partition directory
+    """
+    return os.path.join(root, f'installation={installation}')
+
+
+def _to_partitioned_frame(data, installation):
+    """
+    This method prepares a cleaned dataframe for the partitioned dataset, casting the values to float32 and adding the
+    partition columns.
+
+    :param data:         the cleaned data with a timezone-aware index
+    :param installation: the installation under examination
+
+    :return:             the dataframe that is written to the dataset
+    """
+    frame = data.astype({column: np.float32 for column in data.columns if pd.api.types.is_float_dtype(data[column])})
+    frame.index.name = INDEX_NAME
+
+    # Add the partition columns (the month is taken in the local time of the installation)
+    frame['installation'] = installation
+    frame['month'] = data.index.strftime('%Y-%m')
+
+    return frame
+
+
+def get_staging_directory(installation, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method returns the directory where the data of an installation are written before they replace its previous
+    data. The name starts with '_', so the readers of the dataset ignore it.
+
+    :param installation: the installation under examination
+    :param root:         the directory of the cleaned dataset
+
+    :return:             the path of the staging directory
+    """
+    return os.path.join(root, f'_staging_{installation}')
+
+
+def get_directory_size(directory):
+    """
+    This method computes the size of the files of a directory and its sub-directories.
+
+    :param directory: the directory under examination
+
+    :return:          the size in bytes (0 if the directory does not exist)
+    """
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(directory) for name in names)
+
+
+def clear_staged_data(installation, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method removes the staged data of an installation, e.g. those left by an interrupted run.
+
+    :param installation: the installation under examination
+    :param root:         the directory of the cleaned dataset
+    """
+    shutil.rmtree(get_staging_directory(installation, root), ignore_errors=True)
+
+
+def append_cleaned_data(data, installation, part_name, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method appends cleaned data of an installation (e.g. one monthly file) to a partitioned parquet dataset,
+    without reading or rewriting the data that are already stored.
+
+    :param data:         the cleaned data with a timezone-aware index
+    :param installation: the installation under examination
+    :param part_name:    the name of the written files, unique per appended frame (e.g. the name of the source file)
+    :param root:         the directory of the dataset
+    """
+    _to_partitioned_frame(data, installation).to_parquet(root, partition_cols=['installation', 'month'],
+                                                         compression=COMPRESSION,
+                                                         basename_template=f'{part_name}-{{i}}.parquet',
+                                                         existing_data_behavior='overwrite_or_ignore')
+
+
+def commit_staged_data(installation, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method replaces the data of an installation with its staged data.
+
+    :param installation: the installation under examination
+    :param root:         the directory of the cleaned dataset
+    """
+    staging_directory = get_staging_directory(installation, root)
+    staged = get_installation_directory(installation, staging_directory)
+    target = get_installation_directory(installation, root)
+
+    # Replace the previous data of the installation
+    shutil.rmtree(target, ignore_errors=True)
+    if os.path.exists(staged):
+        os.replace(staged, target)
+
+    clear_staged_data(installation, root)
+
+
+def _get_part_name(file_name):
+    """
+    This method extracts the part name from the name of a file written by append_cleaned_data.
+
+    :param file_name: the name of the file, e.g. 'part-0.parquet'
+
+    :return:          the part name, e.g. 'part'
+    """
+    return file_name.rsplit('-', 1)[0]
+
+
+def remove_cleaned_parts(installation, part_names, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method removes the files of some parts (e.g. of some source files) from the data of an installation, in all
+    the months they were written to, and removes the months that are left empty.
+
+    :param installation: the installation under examination
+    :param part_names:   the names of the removed parts
+    :param root:         the directory of the cleaned dataset
+    """
+    part_names = set(part_names)
+    for directory, _, names in os.walk(get_installation_directory(installation, root), topdown=False):
+        for name in names:
+            if _get_part_name(name) in part_names:
+                os.remove(os.path.join(directory, name))
+
+        # Remove the month directories without files
+        if not os.listdir(directory) and directory != get_installation_directory(installation, root):
+            os.rmdir(directory)
+
+
+def merge_staged_data(installation, part_names, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method replaces some parts of the data of an installation with its staged data, keeping the rest of its
+    data as they are.
+
+    :param installation: the installation under examination
+    :param part_names:   the names of the replaced or removed parts (the staged parts are among them)
+    :param root:         the directory of the cleaned dataset
+    """
+    staged = get_installation_directory(installation, get_staging_directory(installation, root))
+    target = get_installation_directory(installation, root)
+
+    # Remove the previous version of the parts
+    remove_cleaned_parts(installation, part_names, root)
+
+    # Move the staged files to the same months of the data of the installation
+    for directory, _, names in os.walk(staged):
+        destination = os.path.join(target, os.path.relpath(directory, staged))
+        os.makedirs(destination, exist_ok=True)
+        for name in names:
+            os.replace(os.path.join(directory, name), os.path.join(destination, name))
+
+    clear_staged_data(installation, root)
+
+
+def write_cleaned_data(data, installation, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method stores the cleaned data of an installation in the partitioned parquet dataset, replacing any previous
+    data of the installation.
+
+    :param data:         the cleaned data with a timezone-aware index
+    :param installation: the installation under examination
+    :param root:         the directory of the cleaned dataset
+    """
+    clear_staged_data(installation, root)
+    append_cleaned_data(data, installation, 'part', get_staging_directory(installation, root))
+    commit_staged_data(installation, root)
+
+
+def _to_utc(timestamp):
+    """
+    This method converts a timestamp to UTC, considering naive timestamps as UTC.
+
+    :param timestamp: the timestamp under examination
+
+    :return:          the timezone-aware timestamp in UTC
+    """
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.tz_localize('UTC') if timestamp.tz is None else timestamp.tz_convert('UTC')
+
+
+def read_cleaned_data(installations=None, start=None, stop=None, columns=None, root=CLEANED_DATASET_DIRECTORY):
+    """
+    This method reads the cleaned data, pushing the filters on the installations and the time range down to the
+    partitions and the row groups of the dataset.
+
+    :param installations: the installations under examination (None for all the installations)
+    :param start:         the first timestamp under examination (None for no lower limit, naive timestamps are
+                          considered UTC)
+    :param stop:          the last timestamp under examination (None for no upper limit, naive timestamps are
+                          considered UTC)
+    :param columns:       the value columns to read, e.g. ['SOLAR'] (None for all the columns)
+    :param root:          the directory of the cleaned dataset
+
+    :return:              the cleaned data indexed by time, with an 'installation' column if more than one
+                          installation is read
+    """
+    filters = []
+
+    # Filter the partitions of the installations
+    if installations is not None:
+        filters.append(('installation', 'in', list(installations)))
+
+    # Filter the partitions of the months (with a margin of one day, because the months are in local time) and the
+    # row groups of the time range
+    if start is not None:
+        start = _to_utc(start)
+        filters.append(('month', '>=', (start - pd.Timedelta(days=1)).strftime('%Y-%m')))
+        filters.append((INDEX_NAME, '>=', start))
+    if stop is not None:
+        stop = _to_utc(stop)
+        filters.append(('month', '<=', (stop + pd.Timedelta(days=1)).strftime('%Y-%m')))
+        filters.append((INDEX_NAME, '<=', stop))
+
+    # Read the requested columns and the installation
+    if columns is not None:
+        columns = list(columns) + ['installation']
+
+    data = pd.read_parquet(root, columns=columns, filters=filters or None)
+    data = data.drop(columns='month', errors='ignore')
+    data['installation'] = data['installation'].astype(str)
+
+    # Drop the installation column when a single installation is read
+    if installations is not None and len(installations) == 1:
+        data = data.drop(columns='installation')
+
+    return data
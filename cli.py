@@ -0,0 +1,29 @@
+import argparse
+import importlib
+import sys
+
+# Module of each command, imported only when its command runs
+COMMANDS = {
+    'preprocess': 'preprocessing',
+    'preprocess-mains': 'preprocessing_mains',
+    'fleet-batch': 'fleet_batch',
+    'cluster': 'clustering_of_capacities',
+    'edge-models': 'edge_estimation',
+    'stream': 'streaming_cleaning',
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a step of the solar data pipeline.')
+    parser.add_argument('command', choices=list(COMMANDS), help='the step to run')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help='the arguments of the step (see COMMAND --help)')
+    args = parser.parse_args(argv)
+
+    # Import the module of the command and run its main with the remaining arguments
+    module = importlib.import_module(COMMANDS[args.command])
+    sys.argv = [f'{parser.prog} {args.command}'] + args.arguments
+    module.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,114 +1,139 @@
+import argparse
+import os
+
+import numpy as np
 import pandas as pd
-import glob
-from sklearn.cluster import KMeans
+from dataset_catalog import load_catalog, select_files
+from cleaned_dataset import read_cleaned_data
+from capacity_estimation import SketchStore, SKETCH_STORE_PATH, CAPACITY_QUANTILE, estimate_capacity_from_files
+from parallel_processing import run_in_parallel, summarize_report
+from capacity_clustering import CapacityClusters, summarize_clusters, CLUSTERS_PATH
+from installation_metadata import load_metadata, SMALL_CAPACITY
+
+# Store of the per-file quantile sketches of the process (one per worker)
+sketch_store = None
+
+
+def initialize_worker(store_path):
+    """
+    This method opens the sketch store of a worker process.
+
+    :param store_path: the path of the SQLite file of the sketch store
+    """
+    global sketch_store
+    sketch_store = SketchStore(store_path)
 
 
+def estimate_installation_capacity(installation, files):
+    """
+    This method estimates the capacity of one installation from the sketches of its solar files.
 
-# Retrieve the installations with solar measurements in 2023 or 2024
-installations = pd.read_csv('data//installations_with_solar_in_2023_or_2024.csv')
+    :param installation: the installation under examination
+    :param files:        the catalog rows of the solar files of the installation
 
-# Create a dataframe to store the capacities
-capacities = pd.DataFrame(columns=['installation_id', 'capacity'])
+    :return:             a dictionary with the capacity and the number of files
+    """
+    capacity, number_of_files = estimate_capacity_from_files(installation, files, sketch_store)
+    return {'capacity': capacity, 'number_of_files': number_of_files}
 
-for installation in installations.id.head(3):
 
-    #installation = installations.id.loc[0]
+def compute_capacities(catalog, installations, workers=None, chunksize=16):
+    """
+    This method estimates the capacities of many installations in parallel and builds the capacities table once.
 
-    data = pd.read_csv(f'data//solar//{installation}.csv')
+    :param catalog:       the catalog of the dataset
+    :param installations: the installations under examination
+    :param workers:       the number of worker processes
+    :param chunksize:     the number of installations sent to a worker at once
 
-    capacity = data[data['SOLAR'] > 0]['SOLAR'].quantile(0.98)
+    :return:              a dataframe with the installation_id, the capacity and the number_of_files
+    """
 
-    # capacities.append({'installation_id': 'installation1', 'capacity': capacity}, ignore_index=True)
+    # Retrieve the solar files of 2023 and 2024 of each installation from the catalog
+    tasks = {installation: (installation, select_files(catalog, installation, 'SOLAR', (2023, 2024)))
+             for installation in installations}
 
-    # Create a new row as a DataFrame
-    new_row = pd.DataFrame([{'installation_id': installation, 'capacity': capacity}])
+    # Estimate the capacities in parallel
+    report = run_in_parallel(estimate_installation_capacity, tasks, workers=workers, chunksize=chunksize,
+                             initializer=initialize_worker, initargs=(SKETCH_STORE_PATH,), verbose=False)
+    print(summarize_report(report))
 
-    # Add the new row to the existing DataFrame using pd.concat
-    capacities = pd.concat([capacities, new_row], ignore_index=True)
+    # Build the capacities table from the results, in the order of the installations
+    report = report.set_index('key').reindex(index=list(tasks), columns=['capacity', 'number_of_files'])
+    return pd.DataFrame({'installation_id': np.asarray(report.index, dtype=object),
+                         'capacity': report['capacity'].to_numpy(dtype=float),
+                         'number_of_files': report['number_of_files'].to_numpy(dtype=float)})
 
 
-capacities = pd.DataFrame(columns=['installation_id', 'capacity'])
+def compute_capacities_from_cleaned_data(installations):
+    """
+    This method computes the capacities of the installations from their cleaned data.
 
-# Iterate over the installation ids
-for installation in installations.id:
+    :param installations: the installations under examination
 
-    # Retrieve the solar fiels of the installation under examination
-    solar_files = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2023}*.parquet',
-                             recursive=True) +
-                   glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2024}*.parquet',
-                             recursive=True))
+    :return:              a dataframe with the installation_id and the capacity
+    """
 
-    # Filter files based on the conditions
-    matching_files = [
-        file for file in solar_files
-        if file.split('.')[0].split('_')[4][4:6] == '08'
-    ]
+    # Read the positive cleaned solar values of all the installations at once
+    data = read_cleaned_data(list(installations), columns=['SOLAR'])
+    data = data[data['SOLAR'] > 0]
 
-    matching_files_2 = [
-        file for file in solar_files
-        if file.split('.')[0].split('_')[4][4:6] == '07'
-    ]
+    # Retrieve the capacity as 98th percentile of the positive values of each installation
+    capacity = data.groupby('installation')['SOLAR'].quantile(CAPACITY_QUANTILE).reindex(list(installations))
 
-    matching_files_3 = [
-        file for file in solar_files
-        if file.split('.')[0].split('_')[4][4:6] == '06'
-    ]
+    return pd.DataFrame({'installation_id': np.asarray(capacity.index, dtype=object),
+                         'capacity': capacity.to_numpy(dtype=float)})
 
-    matching_files_4 = [
-        file for file in solar_files
-        if file.split('.')[0].split('_')[4][4:6] == '05'
-    ]
 
-    matching_files_5 = [
-        file for file in solar_files
-        if file.split('.')[0].split('_')[4][4:6] == '09'
-    ]
+def cluster_capacities(capacities, n_clusters=3, method='auto'):
+    """
+    This method clusters the installations based on their capacities.
 
-    matching_files_6 = [
-        file for file in solar_files
-        if file.split('.')[0].split('_')[4][4:6] == '04'
-    ]
+    :param capacities: the capacities table
+    :param n_clusters: the number of clusters
+    :param method:     the clustering method ('exact', 'minibatch' or 'auto')
 
-    matching_files_7 = [
-        file for file in solar_files
-        if file.split('.')[0].split('_')[4][4:6] == '10'
-    ]
+    :return:           the capacities table with the cluster of each installation, the clusters' information and the
+                       fitted clusters
+    """
+    clusters = CapacityClusters.fit(capacities['capacity'], n_clusters, method)
 
-    # Set the file as the first solar file available
-    file = solar_files[0]
+    capacities['cluster'] = clusters.assign_many(capacities['capacity'])
 
-    if matching_files:
-        file = matching_files[0]
-    elif matching_files_2:
-        file = matching_files_2[0]
-    elif matching_files_3:
-        file = matching_files_3[0]
-    elif matching_files_4:
-        file = matching_files_4[0]
-    elif matching_files_5:
-        file = matching_files_5[0]
-    elif matching_files_6:
-        file = matching_files_6[0]
-    elif matching_files_7:
-        file = matching_files_7[0]
+    clusters_info = summarize_clusters(capacities, clusters)
 
-    # Read the data
-    data = pd.read_parquet(file)
+    return capacities, clusters_info, clusters
 
-    # Fill nas with zero values
-    data['SOLAR'] = pd.to_numeric(data['SOLAR'].fillna(0), errors='coerce')
 
-    # Retrieve the capacity as 98th percentile of the positive values
-    capacity = data[data['SOLAR'] > 0]['SOLAR'].quantile(0.98)
+def get_clustered_installations(metadata):
+    """
+    This method builds the capacities table of the installations that belong to a cluster from their metadata.
 
-    # Create a new row as a DataFrame
-    new_row = pd.DataFrame([{'installation_id': installation, 'capacity': capacity}])
+    :param metadata: the metadata of the installations
 
-    # Add the new row to the existing DataFrame using pd.concat
-    capacities = pd.concat([capacities, new_row], ignore_index=True)
+    :return:         a dataframe with the installation_id, the capacity, the cluster and the number_of_files
+    """
+    table = metadata.to_frame()
+    table = table[table['cluster'].notna()]
+    return pd.DataFrame({'installation_id': np.asarray(table.index, dtype=object),
+                         'capacity': table['capacity'].to_numpy(dtype=float),
+                         'cluster': table['cluster'].to_numpy(dtype=int),
+                         'number_of_files': table['solar_files'].fillna(0).to_numpy(dtype=float)})
+
+
+def count_installations_per_number_of_files(capacities):
+    """
+    This method counts the installations of each cluster per number of solar files.
+
+    :param capacities: the capacities table with the cluster and the number_of_files of each installation
+
+    :return:           a dataframe with the cluster, the number_of_files and the installation_count
+    """
+    return (capacities
+            .groupby(['cluster', 'number_of_files'])['installation_id']
+            .nunique()  # Count unique installation IDs
+            .reset_index(name='installation_count'))
 
-# Exclude the installations with capacity lower that 1kWatt
-capacities = capacities[capacities.capacity > 1]
 
 '''
 capacities['capacity_rounded'] = capacities['capacity'].round()
@@ -128,79 +153,77 @@ plt.tight_layout()  # Adjust layout to prevent clipping of labels
 plt.show()
 '''
 
-# Number of clusters
-n_clusters = 3
-
-kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-
-capacities['cluster'] = kmeans.fit_predict(capacities[['capacity']])
-
-clusters_info = pd.DataFrame()
-
-clusters_info['median_values'] = capacities.groupby('cluster')['capacity'].median()
-clusters_info['cluster'] = capacities.groupby('cluster').size()
-
-
-capacities.to_csv('data//capacities_clustering.csv')
-
-
-
-'''
------------------------------  Capacities' analysis  ------------------------------------------
-'''
-capacities = pd.read_csv('data//capacities_clustering.csv')
-
-
-# Create a group number within each cluster
-# capacities['group'] = capacities.groupby('cluster').cumcount() % 2 + 1
-
-for index in capacities.index:
-
-    installation = capacities.loc[index].installation_id
-
-    solar_files = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2023}*.parquet',
-                             recursive=True) +
-                   glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2024}*.parquet',
-                             recursive=True))
-
-    capacities.at[index, 'number_of_files'] = len(solar_files)
-
-
-# Cluster zero
-cluster_zero = capacities[capacities['cluster'] == 0]
-
-# Step 1: Count the unique installation_id for each number_of_files
-file_counts_zero = (cluster_zero
-    .groupby('number_of_files')['installation_id']
-    .nunique()  # Count unique installation IDs
-    .reset_index()
-)
-
-# Step 2: Rename columns for clarity
-file_counts_zero.columns = ['number_of_files', 'installation_count']
-
-cluster_one = capacities[capacities['cluster'] == 1]
-
-# Step 1: Count the unique installation_id for each number_of_files
-file_counts_one = (cluster_one
-    .groupby('number_of_files')['installation_id']
-    .nunique()  # Count unique installation IDs
-    .reset_index()
-)
-
-# Step 2: Rename columns for clarity
-file_counts_one.columns = ['number_of_files', 'installation_count']
-
-cluster_two = capacities[capacities['cluster'] == 2]
-
-# Step 1: Count the unique installation_id for each number_of_files
-file_counts_two = (cluster_two
-    .groupby('number_of_files')['installation_id']
-    .nunique()  # Count unique installation IDs
-    .reset_index()
-)
-
-# Step 2: Rename columns for clarity
-file_counts_two.columns = ['number_of_files', 'installation_count']
-
 
+def main():
+    parser = argparse.ArgumentParser(description='Estimate and cluster the capacities of the installations.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--chunksize', type=int, default=16, help='installations sent to a worker at once')
+    parser.add_argument('--source', choices=['raw', 'cleaned'], default='raw',
+                        help='estimate the capacities from the raw files or from the cleaned data')
+    parser.add_argument('--clusters', type=int, default=3, help='number of clusters')
+    parser.add_argument('--method', choices=['auto', 'exact', 'minibatch'], default='auto',
+                        help='clustering method (exact 1-D k-means or MiniBatchKMeans for large fleets)')
+    parser.add_argument('--assign', action='store_true',
+                        help='assign the new installations to the stored clusters instead of refitting them')
+    args = parser.parse_args()
+
+    # Load the catalog of the dataset
+    catalog = load_catalog()
+
+    # Retrieve the installations with solar measurements in 2023 or 2024 and open their metadata
+    installations = pd.read_csv('data//installations_with_solar_in_2023_or_2024.csv')
+    metadata = load_metadata()
+
+    # Estimate only the capacities of the new installations when they are assigned to the stored clusters
+    if args.assign:
+        clusters = CapacityClusters.load(CLUSTERS_PATH)
+        installations = [installation for installation in installations.id
+                         if metadata.get(installation, 'capacity') is None]
+    else:
+        installations = installations.id.tolist()
+
+    # Estimate the capacities of the installations
+    if args.source == 'raw':
+        estimated = compute_capacities(catalog, installations, args.workers, args.chunksize)
+    else:
+        estimated = compute_capacities_from_cleaned_data(installations)
+
+    # Exclude the installations with capacity lower that 1kWatt
+    capacities = estimated[estimated.capacity > SMALL_CAPACITY].copy()
+
+    # Cluster the capacities and store the clusters for the next installations, or assign them to the stored clusters
+    if args.assign:
+        capacities['cluster'] = clusters.assign_many(capacities['capacity'])
+    else:
+        capacities, _, clusters = cluster_capacities(capacities, args.clusters, args.method)
+        clusters.save(CLUSTERS_PATH)
+
+    # Store the capacity, the cluster and the file coverage of the installations in their metadata
+    cluster_of = dict(zip(capacities['installation_id'], capacities['cluster']))
+    metadata.update({installation: {'capacity': capacity, 'cluster': cluster_of.get(installation)}
+                     for installation, capacity in zip(estimated['installation_id'], estimated['capacity'])})
+    metadata.update_file_coverage(catalog, installations)
+
+    # Clear the clusters of the installations that were not refitted, whose labels come from an older clustering
+    if not args.assign:
+        refitted = set(estimated['installation_id'])
+        metadata.update({installation: {'cluster': None} for installation, record in metadata.records.items()
+                         if record['cluster'] is not None and installation not in refitted})
+
+    # Build the table of all the clustered installations, which the edge models are built from
+    capacities = get_clustered_installations(metadata)
+    capacities.to_csv('data//capacities_clustering.csv')
+    metadata.close()
+
+    # Summarize the clusters
+    print(summarize_clusters(capacities, clusters))
+
+    # -----------------------------  Capacities' analysis  ------------------------------------------
+
+    # Count the installations of each cluster per number of files
+    file_counts = count_installations_per_number_of_files(capacities)
+    print(file_counts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import os
+
+import pandas as pd
+
+# Directory of the 1-minute dataset, with one sub-directory per installation
+DATASET_DIRECTORY = '/mnt/12TB/tasos/us_dataset/1min'
+
+# Path where the catalog of the dataset is stored
+CATALOG_PATH = 'data//catalog.parquet'
+
+# Columns of the catalog
+CATALOG_COLUMNS = ['installation', 'signal', 'start', 'stop', 'path', 'size', 'mtime', 'directory_mtime']
+
+
+def parse_file_name(path):
+    """
+    This method extracts the signal and the period of a parquet file of the dataset from its name, e.g.
+    '..._SOLAR_20230101_20230131.parquet' or '..._20230101_20230131_IDD....parquet'.
+
+    :param path: the path of the file
+
+    :return:     the signal ('SOLAR' or 'IDD'), the start date and the stop date, or None if the name is not recognized
+    """
+    tokens = os.path.basename(path).split('.')[0].split('_')
+
+    # Find the signal of the file
+    if 'SOLAR' in tokens:
+        signal = 'SOLAR'
+    elif any(token.startswith('IDD') for token in tokens):
+        signal = 'IDD'
+    else:
+        return None
+
+    # Find the start and stop dates of the file
+    dates = [token for token in tokens if len(token) == 8 and token.isdigit()]
+    if len(dates) < 2:
+        return None
+
+    return signal, pd.Timestamp(dates[0]), pd.Timestamp(dates[1])
+
+
+def _scan_installation(directory, installation):
+    """
+    This method lists the parquet files of one installation directory.
+
+    :param directory:    the path of the installation directory
+    :param installation: the installation under examination
+
+    :return:             a list with one catalog record per recognized file
+    """
+    directory_mtime = os.stat(directory).st_mtime
+    records = []
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.parquet') or not entry.is_file():
+                continue
+
+            parsed = parse_file_name(entry.name)
+            if parsed is None:
+                continue
+
+            stat = entry.stat()
+            records.append((installation,) + parsed + (entry.path, stat.st_size, stat.st_mtime, directory_mtime))
+
+    # Keep the directories without files in the catalog, so that they are not rescanned if they do not change
+    if not records:
+        records.append((installation, None, pd.NaT, pd.NaT, None, 0, 0.0, directory_mtime))
+
+    return records
+
+
+def _to_catalog(records):
+    """
+    This method builds the indexed catalog from a list of records.
+
+    :param records: a list of catalog records
+
+    :return:        the catalog indexed by (installation, signal) and sorted by start date
+    """
+    catalog = pd.DataFrame.from_records(records, columns=CATALOG_COLUMNS)
+    catalog['start'] = pd.to_datetime(catalog['start'])
+    catalog['stop'] = pd.to_datetime(catalog['stop'])
+    return catalog.sort_values(['installation', 'signal', 'start']).set_index(['installation', 'signal'])
+
+
+def build_catalog(root=DATASET_DIRECTORY):
+    """
+    This method scans the dataset once and builds the catalog of its parquet files.
+
+    :param root: the directory of the dataset
+
+    :return:     the catalog indexed by (installation, signal)
+    """
+    records = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                records.extend(_scan_installation(entry.path, entry.name))
+
+    return _to_catalog(records)
+
+
+def refresh_catalog(catalog, root=DATASET_DIRECTORY):
+    """
+    This method refreshes the catalog incrementally, rescanning only the installation directories that were added or
+    modified since the catalog was built. The files of the other directories are only stat-ed again, because a file
+    that is overwritten in place does not change the modification time of its directory.
+
+    :param catalog: the catalog under examination
+    :param root:    the directory of the dataset
+
+    :return:        the refreshed catalog
+    """
+
+    # Retrieve the modification time of each directory when it was scanned
+    scanned = catalog.groupby(level='installation')['directory_mtime'].first().to_dict()
+
+    records = []
+    unchanged = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+
+            # Keep the files of the directories that did not change and rescan the rest
+            if scanned.get(entry.name) == entry.stat().st_mtime:
+                unchanged.append(entry.name)
+            else:
+                records.extend(_scan_installation(entry.path, entry.name))
+
+    # Update the size and the modification time of the files of the unchanged directories (the placeholder rows of
+    # the directories without files are kept as they are)
+    kept = catalog[catalog.index.get_level_values('installation').isin(unchanged)].copy()
+    files = kept['path'].notna().to_numpy()
+    stats = [os.stat(path) for path in kept.loc[files, 'path']]
+    kept.loc[files, 'size'] = [stat.st_size for stat in stats]
+    kept.loc[files, 'mtime'] = [stat.st_mtime for stat in stats]
+
+    # Combine the unchanged part of the catalog with the rescanned directories
+    return _to_catalog(list(kept.reset_index()[CATALOG_COLUMNS].itertuples(index=False, name=None)) + records)
+
+
+def save_catalog(catalog, path=CATALOG_PATH):
+    """
+    This method stores the catalog as a parquet file.
+
+    :param catalog: the catalog under examination
+    :param path:    the path of the parquet file
+    """
+    catalog.reset_index().to_parquet(path, index=False)
+
+
+def load_catalog(path=CATALOG_PATH, root=DATASET_DIRECTORY, refresh=True):
+    """
+    This method loads the catalog of the dataset, building it on the first run and refreshing it incrementally on the
+    next runs.
+
+    :param path:    the path of the parquet file of the catalog
+    :param root:    the directory of the dataset
+    :param refresh: whether to rescan the directories that changed since the last run
+
+    :return:        the catalog indexed by (installation, signal)
+    """
+
+    # Build the catalog if it does not exist
+    if not os.path.exists(path):
+        catalog = build_catalog(root)
+        save_catalog(catalog, path)
+        return catalog
+
+    # Load the stored catalog
+    catalog = _to_catalog(list(pd.read_parquet(path)[CATALOG_COLUMNS].itertuples(index=False, name=None)))
+
+    # Refresh the catalog with the directories that changed
+    if refresh:
+        catalog = refresh_catalog(catalog, root)
+        save_catalog(catalog, path)
+
+    return catalog
+
+
+def select_files(catalog, installation, signal='SOLAR', years=(2023, 2024)):
+    """
+    This method returns the catalog rows of the files of an installation that start in the given years.
+
+    :param catalog:      the catalog of the dataset
+    :param installation: the installation under examination
+    :param signal:       the signal of the files ('SOLAR' or 'IDD')
+    :param years:        the years under examination (None for all the years)
+
+    :return:             the rows of the catalog for these files, sorted by start date (an empty frame if there are
+                         none)
+    """
+    key = (installation, signal)
+    if key not in catalog.index:
+        return catalog.iloc[:0]
+
+    files = catalog.loc[[key]]
+    if years is not None:
+        files = files[files['start'].dt.year.isin(years)]
+    return files
+
+
+def find_files(catalog, installation, signal='SOLAR', years=(2023, 2024)):
+    """
+    This method returns the files of an installation that start in the given years, as the glob pattern
+    f'{installation}/*_SOLAR_{year}*.parquet' used to do.
+
+    :param catalog:      the catalog of the dataset
+    :param installation: the installation under examination
+    :param signal:       the signal of the files ('SOLAR' or 'IDD')
+    :param years:        the years under examination (None for all the years)
+
+    :return:             the list with the paths of the files, sorted by start date
+    """
+    return select_files(catalog, installation, signal, years)['path'].tolist()
+
+
+def find_mains_file(catalog, installation, start, stop):
+    """
+    This method returns the mains (IDD) file of an installation that covers the same period as a solar file.
+
+    :param catalog:      the catalog of the dataset
+    :param installation: the installation under examination
+    :param start:        the start date of the period
+    :param stop:         the stop date of the period
+
+    :return:             the path of the mains file, or None if there is no such file
+    """
+    files = select_files(catalog, installation, 'IDD', years=None)
+    files = files[(files['start'] == start) & (files['stop'] == stop)]
+    return files['path'].iloc[0] if len(files) else None
+
+
+def select_file_pairs(catalog, installation, years=(2023, 2024)):
+    """
+    This method pairs the solar files of an installation that start in the given years with the mains (IDD) files
+    that cover the same periods, matching the two signals on their (start, stop) period.
+
+    :param catalog:      the catalog of the dataset
+    :param installation: the installation under examination
+    :param years:        the years under examination (None for all the years)
+
+    :return:             a dataframe with the start, the stop, the solar_path and the mains_path of each period that
+                         has both files, sorted by start date
+    """
+    solar = select_files(catalog, installation, 'SOLAR', years)[['start', 'stop', 'path']]
+    mains = select_files(catalog, installation, 'IDD', years=None)[['start', 'stop', 'path']]
+
+    # Keep the first mains file of each period, as find_mains_file does
+    mains = mains.drop_duplicates(['start', 'stop'])
+
+    return (solar.merge(mains, on=['start', 'stop'], how='inner', suffixes=('_solar', '_mains'))
+            .rename(columns={'path_solar': 'solar_path', 'path_mains': 'mains_path'})
+            .sort_values('start', ignore_index=True))
+
+
+def find_installations(catalog, signal='SOLAR', years=(2023, 2024)):
+    """
+    This method returns the installations that have files of a signal starting in the given years.
+
+    :param catalog: the catalog of the dataset
+    :param signal:  the signal of the files ('SOLAR' or 'IDD')
+    :param years:   the years under examination (None for all the years)
+
+    :return:        the list of the installations
+    """
+    return count_files(catalog, signal, years).index.tolist()
+
+
+def count_files(catalog, signal='SOLAR', years=(2023, 2024)):
+    """
+    This method counts the files of a signal per installation.
+
+    :param catalog: the catalog of the dataset
+    :param signal:  the signal of the files ('SOLAR' or 'IDD')
+    :param years:   the years under examination (None for all the years)
+
+    :return:        a series with the number of files of each installation that has at least one file
+    """
+    files = catalog[catalog.index.get_level_values('signal') == signal]
+    if years is not None:
+        files = files[files['start'].dt.year.isin(years)]
+    return files.groupby(level='installation').size()
@@ -0,0 +1,250 @@
+import argparse
+import warnings
+
+import numpy as np
+
+# Path of the compact models of the clusters
+EDGE_MODELS_PATH = 'data//edge_models.npz'
+
+# Quantile of the normalized production of each month and minute of the day that is used as the clear-sky production
+CLEAR_SKY_QUANTILE = 0.9
+
+# Number of minutes of a day
+MINUTES_PER_DAY = 1440
+
+
+class ClusterModel:
+    """
+    This class is the compact model of a cluster of installations: the capacity of the cluster and the clear-sky
+    production profile of each month, normalized by the capacity, with one value per minute of the day (12 x 1440
+    float32 values, about 135KB with their cumulative sums).
+    """
+
+    def __init__(self, capacity, profiles):
+        """
+        :param capacity: the capacity of the cluster (kW)
+        :param profiles: the normalized clear-sky production of each month and minute of the day, as a (12, 1440)
+                         array
+        """
+        self.capacity = float(capacity)
+        self.profiles = np.asarray(profiles, dtype=np.float32)
+
+        # Cumulative sums of the profiles, to average any window of minutes in constant time
+        self.cumulative = np.zeros((12, MINUTES_PER_DAY + 1), dtype=np.float32)
+        np.cumsum(self.profiles, axis=1, out=self.cumulative[:, 1:])
+
+    def expected(self, month, minute):
+        """
+        This method returns the normalized clear-sky production of a minute.
+
+        :param month:  the month (1-12)
+        :param minute: the minute of the day (0-1439)
+
+        :return:       the normalized production
+        """
+        return float(self.profiles[month - 1, minute])
+
+    def expected_mean(self, month, start, stop):
+        """
+        This method returns the mean normalized clear-sky production of a window of minutes of the same day.
+
+        :param month: the month (1-12)
+        :param start: the first minute of the window
+        :param stop:  the minute after the last minute of the window (limited to the end of the day)
+
+        :return:      the mean normalized production of the window
+        """
+        stop = min(stop, MINUTES_PER_DAY)
+        if stop <= start:
+            return 0.0
+        cumulative = self.cumulative[month - 1]
+        return float(cumulative[stop] - cumulative[start]) / (stop - start)
+
+
+class SolarEstimator:
+    """
+    This class estimates the current and the next-hour solar production of an installation from its stream of MAINS
+    readings, in constant time and memory per reading. The mains readings of the night give the consumption baseline;
+    during the day the drop of the mains below the baseline is the implied solar production, and the mean ratio of
+    the implied to the clear-sky production over a window of recent readings gives the clearness of the sky.
+    """
+
+    def __init__(self, model, capacity=None, window=60, night_threshold=0.01, baseline_smoothing=0.05,
+                 max_clearness=1.5):
+        """
+        :param model:              the model of the cluster of the installation
+        :param capacity:           the capacity of the installation (None for the capacity of the cluster)
+        :param window:             the number of daytime readings that are used to estimate the clearness
+        :param night_threshold:    the normalized clear-sky production below which a minute is considered night
+        :param baseline_smoothing: the smoothing factor of the exponential average of the night consumption
+        :param max_clearness:      the upper limit of the clearness
+        """
+        self.model = model
+        self.capacity = model.capacity if capacity is None else float(capacity)
+        self.night_threshold = night_threshold
+        self.baseline_smoothing = baseline_smoothing
+        self.max_clearness = max_clearness
+
+        # Ring buffer of the recent clearness ratios and their running sum
+        self._ratios = [0.0] * window
+        self._position = 0
+        self._count = 0
+        self._sum = 0.0
+
+        # Exponential average of the consumption (None until the first reading)
+        self.baseline = None
+
+    def _push_ratio(self, ratio):
+        """
+        This method adds a clearness ratio to the ring buffer, replacing the oldest one when the buffer is full.
+
+        :param ratio: the clearness ratio of a reading
+        """
+        if self._count == len(self._ratios):
+            self._sum -= self._ratios[self._position]
+        else:
+            self._count += 1
+
+        self._ratios[self._position] = ratio
+        self._sum += ratio
+        self._position = (self._position + 1) % len(self._ratios)
+
+    @property
+    def clearness(self):
+        """
+        The mean clearness of the recent daytime readings (1 before the first daytime reading).
+        """
+        if not self._count:
+            return 1.0
+        return min(max(self._sum / self._count, 0.0), self.max_clearness)
+
+    def update(self, timestamp, mains):
+        """
+        This method processes one MAINS reading and estimates the solar production.
+
+        :param timestamp: the local time of the reading (a datetime or a pandas Timestamp)
+        :param mains:     the MAINS reading (kW)
+
+        :return:          the estimated current production and mean production of the next hour (kW)
+        """
+        month = timestamp.month
+        minute = timestamp.hour * 60 + timestamp.minute
+        expected = self.model.expected(month, minute)
+
+        if self.baseline is None:
+            self.baseline = mains
+
+        # Update the consumption baseline with the night readings
+        if expected < self.night_threshold:
+            self.baseline += self.baseline_smoothing * (mains - self.baseline)
+
+        # Update the clearness with the implied production of the daytime readings
+        else:
+            implied = min(max(self.baseline - mains, 0.0), self.capacity)
+            self._push_ratio(implied / (self.capacity * expected))
+
+        # Scale the clear-sky production of the current minute and of the next hour by the clearness
+        scale = self.clearness * self.capacity
+        return scale * expected, scale * self.model.expected_mean(month, minute + 1, minute + 61)
+
+
+def build_installation_profile(installation, capacity, quantile=CLEAR_SKY_QUANTILE):
+    """
+    This method computes the clear-sky production profile of an installation from its cleaned history.
+
+    :param installation: the installation under examination
+    :param capacity:     the capacity of the installation
+    :param quantile:     the quantile of the production of each month and minute that is used as clear-sky
+
+    :return:             the normalized production of each month and minute of the day, as a (12, 1440) array (NaN
+                         for the months without data)
+    """
+    # Read the cleaned solar values in the local time of the installation, importing the dataset reader here so that
+    # the estimators can be used on devices without pandas and pyarrow
+    from cleaned_dataset import read_cleaned_data
+
+    solar = read_cleaned_data([installation], columns=['SOLAR'])['SOLAR']
+
+    # Compute the quantile of the normalized production of each month and minute of the day
+    index = solar.index
+    profile = (solar / capacity).groupby([index.month, index.hour * 60 + index.minute]).quantile(quantile)
+
+    profiles = np.full((12, MINUTES_PER_DAY), np.nan, dtype=np.float32)
+    months, minutes = profile.index.get_level_values(0), profile.index.get_level_values(1)
+    profiles[months - 1, minutes] = profile.to_numpy(dtype=np.float32)
+
+    return profiles
+
+
+def build_cluster_models(capacities, quantile=CLEAR_SKY_QUANTILE):
+    """
+    This method builds the model of each cluster from the profiles of its installations.
+
+    :param capacities: the capacities table with the installation_id, the capacity and the cluster of each installation
+    :param quantile:   the quantile of the production of each month and minute that is used as clear-sky
+
+    :return:           a dictionary mapping each cluster to its model
+    """
+    models = {}
+    for cluster, installations in capacities.groupby('cluster'):
+
+        # Combine the profiles of the installations with the median of each month and minute (the months without data
+        # in any installation are all-NaN and get a zero profile)
+        profiles = np.stack([build_installation_profile(installation, capacity, quantile)
+                             for installation, capacity in zip(installations['installation_id'],
+                                                               installations['capacity'])])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            profile = np.nan_to_num(np.nanmedian(profiles, axis=0), nan=0.0)
+
+        models[int(cluster)] = ClusterModel(installations['capacity'].median(), profile)
+
+    return models
+
+
+def save_models(models, path=EDGE_MODELS_PATH):
+    """
+    This method stores the models of the clusters in one compressed numpy file.
+
+    :param models: a dictionary mapping each cluster to its model
+    :param path:   the path of the file
+    """
+    clusters = sorted(models)
+    np.savez_compressed(path, clusters=np.array(clusters),
+                        capacities=np.array([models[cluster].capacity for cluster in clusters]),
+                        profiles=np.stack([models[cluster].profiles for cluster in clusters]))
+
+
+def load_models(path=EDGE_MODELS_PATH):
+    """
+    This method loads the models of the clusters.
+
+    :param path: the path of the file
+
+    :return:     a dictionary mapping each cluster to its model
+    """
+    with np.load(path) as stored:
+        return {int(cluster): ClusterModel(capacity, profiles)
+                for cluster, capacity, profiles in zip(stored['clusters'], stored['capacities'], stored['profiles'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the edge models of the clusters of the installations.')
+    parser.add_argument('--capacities', default='data//capacities_clustering.csv', help='path of the clusters')
+    parser.add_argument('--output', default=EDGE_MODELS_PATH, help='path of the models')
+    args = parser.parse_args()
+
+    # Load the capacity and the cluster of each installation (pandas is only needed to build the models)
+    import pandas as pd
+    capacities = pd.read_csv(args.capacities)
+
+    # Build and store the models of the clusters
+    models = build_cluster_models(capacities)
+    save_models(models, args.output)
+
+    for cluster, model in models.items():
+        print(f'cluster {cluster}: capacity {model.capacity:.2f}kW, peak {model.profiles.max():.2f}')
+
+
+if __name__ == '__main__':
+    main()
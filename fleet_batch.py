@@ -0,0 +1,378 @@
+import argparse
+import os
+import warnings
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+import preprocessing
+from preprocessing import get_part_name, profiler, SUN_TIMES_CACHE_PATH
+from preprocessing_mains import initialize_worker
+from useful_methods import DEFAULT_TIMEZONE
+from minute_series import MinuteSeries, get_sun_times
+from parquet_reader import read_columns
+from sanitization import SIGNAL_RULES
+from parallel_processing import run_in_parallel, summarize_report, record_input_state
+from dataset_catalog import load_catalog, select_files
+from cleaned_dataset import append_cleaned_data, clear_staged_data, commit_staged_data, get_installation_directory, \
+    get_staging_directory
+from capacity_estimation import CAPACITY_QUANTILE
+from instrumentation import StageProfiler, summarize_stages, export_report
+from installation_metadata import load_metadata
+
+# Number of installations that are stacked in one matrix
+BATCH_SIZE = 128
+
+# Path of the capacities of each installation and period that are computed by the batches
+FLEET_CAPACITIES_PATH = 'data//fleet_capacities.csv'
+
+
+def group_files(catalog, timezones, installations, years=(2023, 2024)):
+    """
+    This method groups the solar files of the installations by timezone and period, so that the files of a group can
+    be cleaned together on the same minutes.
+
+    :param catalog:       the catalog of the dataset
+    :param timezones:     a mapping of each installation to its timezone
+    :param installations: the installations under examination
+    :param years:         the years under examination (None for all the years)
+
+    :return:              a dictionary mapping each (timezone, start, stop) group to its (installation, path) pairs
+    """
+    groups = defaultdict(list)
+    for installation in installations:
+        files = select_files(catalog, installation, 'SOLAR', years)
+        for start, stop, path in zip(files['start'], files['stop'], files['path']):
+            groups[(timezones[installation], start, stop)].append((installation, path))
+
+    return dict(groups)
+
+
+def build_grid(start, stop, timezone):
+    """
+    This method builds the minutes that are shared by the files of a period, handling the timezones as
+    handle_timezones does, once for the whole group.
+
+    :param start:    the first day of the period
+    :param stop:     the last day of the period
+    :param timezone: the timezone of the installations
+
+    :return:         the container of the sorted and unique localized minutes, and the column of each naive minute of
+                     the period (the non-existent minutes share the column of the minute they are shifted to)
+    """
+    naive = pd.date_range(start, pd.Timestamp(stop) + pd.Timedelta(days=1), freq='min', inclusive='left')
+
+    # Localize the minutes of the period in one vectorized call
+    utc = naive.tz_localize(DEFAULT_TIMEZONE, ambiguous=np.zeros(len(naive), dtype=bool),
+                            nonexistent=pd.Timedelta(hours=1)).tz_convert('UTC').tz_localize(None)
+    minutes = utc.as_unit('s').asi8 // 60
+
+    # Sort the localized minutes and find the column of each naive minute
+    minutes, columns = np.unique(minutes, return_inverse=True)
+
+    return MinuteSeries(minutes, {}, timezone), columns
+
+
+def read_matrix(paths, start, columns, stats=None):
+    """
+    This method reads the solar files of a group into one (installation x minute) matrix.
+
+    :param paths:   the paths of the files
+    :param start:   the first day of the period
+    :param columns: the column of each naive minute of the period, as returned by build_grid
+    :param stats:   a dictionary where the number of compressed bytes that are read is added as 'bytes_read'
+
+    :return:        the float32 matrix of the values (NaN for the minutes without a reading), the boolean matrix of
+                    the minutes with a reading, the number of readings outside the period that were dropped and the
+                    number of readings that were replaced by a later reading of the same minute
+    """
+    width = int(columns.max()) + 1
+    values = np.full((len(paths), width), np.nan, dtype=np.float32)
+    present = np.zeros((len(paths), width), dtype=bool)
+    first_minute = np.datetime64(pd.Timestamp(start), 'm').astype(np.int64)
+    outside = 0
+    replaced = 0
+
+    for row, path in enumerate(paths):
+        times, signals = read_columns(path, ['SOLAR'], stats=stats)
+
+        # Find the column of each reading, dropping the readings outside the period
+        positions = np.asarray(times, dtype='datetime64[m]').astype(np.int64) - first_minute
+        inside = (positions >= 0) & (positions < len(columns))
+        targets = columns[positions[inside]]
+        readings = signals['SOLAR'][inside]
+        outside += int(len(positions) - len(targets))
+
+        # Keep the last reading of each minute that appears twice, before or after the localization
+        _, last = np.unique(targets[::-1], return_index=True)
+        last = len(targets) - 1 - last
+        replaced += int(len(targets) - len(last))
+        values[row, targets[last]] = readings[last]
+        present[row, targets[last]] = True
+
+    return values, present, outside, replaced
+
+
+def sanitize_matrix(values, present, fill_value=0.0, lower=None, lower_replacement=0.0, upper=None,
+                    upper_replacement=0.0):
+    """
+    This method sanitizes a matrix of readings in place with the rules of sanitize_values, counting the changed
+    values of each row among the minutes with a reading.
+
+    :param values:            the matrix under examination (modified in place)
+    :param present:           the boolean matrix of the minutes with a reading
+    :param fill_value:        the value of the missing samples
+    :param lower:             the samples below this value are replaced by lower_replacement (None for no limit)
+    :param lower_replacement: the replacement of the samples below the lower limit
+    :param upper:             the samples equal to or above this value are replaced by upper_replacement (None for no
+                              limit)
+    :param upper_replacement: the replacement of the samples above the upper limit
+
+    :return:                  a dictionary with the number of values of each row that were filled, raised to the
+                              lower limit and replaced above the upper limit
+    """
+    counts = {}
+
+    # Fill the missing values
+    mask = np.isnan(values)
+    counts['filled'] = (mask & present).sum(axis=1)
+    np.putmask(values, mask, fill_value)
+
+    # Replace the values below the lower limit
+    if lower is not None:
+        np.less(values, lower, out=mask)
+        counts['below_lower'] = (mask & present).sum(axis=1)
+        np.putmask(values, mask, lower_replacement)
+
+    # Replace the values above the upper limit
+    if upper is not None:
+        np.greater_equal(values, upper, out=mask)
+        counts['above_upper'] = (mask & present).sum(axis=1)
+        np.putmask(values, mask, upper_replacement)
+
+    return counts
+
+
+def correct_solar_zeros_matrix(values, present, daylight, first_of_day, last_of_day):
+    """
+    This method corrects in place the zero solar values between sunrise and sunset of all the rows of a matrix, as
+    correct_solar_zeros_between_sunrise_sunset does for one installation. The minutes without a reading are skipped,
+    so every row gets the same result as its own file.
+
+    :param values:       the sanitized matrix (modified in place)
+    :param present:      the boolean matrix of the minutes with a reading
+    :param daylight:     the boolean array of the minutes between sunrise and sunset
+    :param first_of_day: the first column of the day of each minute
+    :param last_of_day:  the last column of the day of each minute
+    """
+
+    # Find the non-zero values and the zeros that need to be corrected
+    non_zero = present & (values != 0)
+    zeros = present & daylight & (values == 0)
+    if not zeros.any():
+        return
+
+    # Find the column of the previous and next non-zero value of each minute within its day
+    width = values.shape[1]
+    positions = np.arange(width)
+    previous_position = np.maximum.accumulate(np.where(non_zero, positions, -1), axis=1)
+    next_position = np.minimum.accumulate(np.where(non_zero, positions, width)[:, ::-1], axis=1)[:, ::-1]
+    has_previous = previous_position >= first_of_day
+    has_next = next_position <= last_of_day
+    previous_value = np.take_along_axis(values, np.clip(previous_position, 0, None), axis=1).astype(float)
+    next_value = np.take_along_axis(values, np.clip(next_position, None, width - 1), axis=1).astype(float)
+
+    # Count the zeros corrected since the previous non-zero value (or the start of the day)
+    zero_count = np.concatenate((np.zeros((len(values), 1), dtype=np.int64), np.cumsum(zeros, axis=1)), axis=1)
+    order = zero_count[:, 1:] - np.take_along_axis(zero_count, np.maximum(previous_position + 1, first_of_day), axis=1)
+
+    # The k-th zero between two non-zero values converges to the next value: next + (previous - next) / 2^k
+    corrected = np.where(has_previous & has_next, next_value + np.ldexp(previous_value - next_value, -order),
+                         np.where(has_previous, previous_value, np.where(has_next, next_value, 0)))
+
+    # Replace the zero values with the corrected values
+    values[zeros] = corrected[zeros]
+
+
+def compute_capacities(values, present, quantile=CAPACITY_QUANTILE):
+    """
+    This method computes the capacity of each row of a cleaned matrix as a quantile of its positive values.
+
+    :param values:   the cleaned matrix
+    :param present:  the boolean matrix of the minutes with a reading
+    :param quantile: the quantile of the positive values
+
+    :return:         the capacity of each row (NaN for the rows without positive values)
+    """
+    positive = np.where(present & (values > 0), values, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanquantile(positive, quantile, axis=1)
+
+
+def clean_batch(timezone, start, stop, files):
+    """
+    This method cleans the solar files of many installations for the same timezone and period at once: the files are
+    stacked in one (installation x minute) matrix, the timezones are handled and the sunrise and sunset are looked up
+    once for the whole batch, and the cleaning runs on all the rows together. The cleaned rows are appended to the
+    staged output of their installations.
+
+    :param timezone: the timezone of the installations
+    :param start:    the first day of the period
+    :param stop:     the last day of the period
+    :param files:    the (installation, path) pairs of the batch
+
+    :return:         a dictionary with the number of files and rows, the number of readings that were dropped
+                     because they are outside the period or replaced by a later reading of the same minute, the
+                     capacities of the installations in the period and the number of values changed by the
+                     sanitization
+    """
+    profiler.reset()
+    installations = [installation for installation, _ in files]
+
+    # Localize the minutes of the period once for the whole batch
+    with profiler.stage('timezones'):
+        grid, columns = build_grid(start, stop, timezone)
+
+    # Read the files into one matrix
+    with profiler.stage('read') as counters:
+        values, present, outside, replaced = read_matrix([path for _, path in files], start, columns, stats=counters)
+        counters['rows'] = int(present.sum())
+
+    # Fill NaN values with 0 and zero out negative values
+    with profiler.stage('sanitize', rows=values.size):
+        counts = sanitize_matrix(values, present, **SIGNAL_RULES['SOLAR'])
+
+    # Look up the sunrise and the sunset of the days of the period once
+    with profiler.stage('sun_times', rows=len(grid)):
+        sunrise, sunset = get_sun_times(grid, preprocessing.sun_times_cache)
+        seconds = grid.minutes * 60
+        night = (seconds < sunrise) | (seconds > sunset)
+        daylight = (seconds >= sunrise) & (seconds <= sunset)
+
+    # Zero out the values before sunrise and after sunset
+    with profiler.stage('zero_out', rows=values.size):
+        values[:, night] = 0
+
+    # Correct the zero values between sunrise and sunset
+    with profiler.stage('correct_zeros', rows=values.size):
+        correct_solar_zeros_matrix(values, present, daylight, *grid.get_day_positions())
+
+    # Compute the capacity of each installation in the period
+    with profiler.stage('capacities', rows=values.size):
+        capacities = compute_capacities(values, present)
+
+    # Append the cleaned rows of each installation to its staged output
+    with profiler.stage('write') as counters:
+        for row, (installation, path) in enumerate(files):
+            series = MinuteSeries(grid.minutes[present[row]], {'SOLAR': values[row, present[row]]}, timezone)
+            append_cleaned_data(series.to_frame(), installation, get_part_name(path),
+                                get_staging_directory(installation))
+        counters['rows'] = int(present.sum())
+
+    return {'files': len(files),
+            'rows': int(present.sum()),
+            'readings_outside_period': outside,
+            'readings_replaced': replaced,
+            'installations': installations,
+            'capacities': capacities.tolist(),
+            **{f'SOLAR_{name}': int(count.sum()) for name, count in counts.items()},
+            **profiler.to_dict()}
+
+
+def build_tasks(groups, batch_size=BATCH_SIZE):
+    """
+    This method splits the groups of files into batches of at most batch_size installations.
+
+    :param groups:     a dictionary mapping each (timezone, start, stop) group to its (installation, path) pairs
+    :param batch_size: the maximum number of installations of a batch
+
+    :return:           a dictionary mapping the key of each batch to the arguments of clean_batch
+    """
+    tasks = {}
+    for (timezone, start, stop), files in groups.items():
+        for first in range(0, len(files), batch_size):
+            key = f"{timezone}_{start.strftime('%Y%m%d')}_{stop.strftime('%Y%m%d')}_{first // batch_size}"
+            tasks[key] = (timezone, start, stop, files[first:first + batch_size])
+
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean the solar measurements of the fleet in batches of '
+                                                 'installations that share a timezone and a period.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='installations stacked in one matrix')
+    parser.add_argument('--report', default='data//fleet_batch_report.csv',
+                        help='path of the per-batch report of the run (.csv or .json)')
+    args = parser.parse_args()
+
+    # Retrieve the installations with solar measurements in 2023 or 2024 and their timezones
+    installations = pd.read_csv('data//installations_with_solar_in_2023_or_2024.csv')
+    metadata = load_metadata()
+    timezones = metadata.get_timezones(installations.id)
+    unknown = [installation for installation in installations.id if installation not in timezones]
+
+    # Group the solar files by timezone and period and split the groups into batches, leaving out the installations
+    # whose timezone is unknown
+    run_profiler = StageProfiler()
+    with run_profiler.stage('tasks'):
+        catalog = load_catalog()
+        tasks = build_tasks(group_files(catalog, timezones, list(timezones)), args.batch_size)
+
+    # Remove any data left by an interrupted run
+    for installation in installations.id:
+        clear_staged_data(installation)
+
+    # Clean the batches in parallel
+    with run_profiler.stage('run'):
+        report = run_in_parallel(clean_batch, tasks, workers=args.workers, initializer=initialize_worker,
+                                 initargs=(SUN_TIMES_CACHE_PATH,))
+
+    # Retrieve the files of each installation, whose state is recorded with its output for the runs that skip the up
+    # to date installations
+    files = defaultdict(list)
+    for task in tasks.values():
+        for installation, path in task[3]:
+            files[installation].append(path)
+
+    # Replace the output of the installations whose batches all succeeded, and drop the staged data of the rest. The
+    # installations without any batch in this run (e.g. without files in the catalog) keep their previous output
+    failed = {installation for key in report.loc[report['status'] == 'failed', 'key']
+              for installation, _ in tasks[key][3]}
+    cleaned = {installation for key in report.loc[report['status'] == 'done', 'key']
+               for installation, _ in tasks[key][3]}
+    with run_profiler.stage('commit'):
+        for installation in installations.id:
+            if installation in cleaned and installation not in failed:
+                commit_staged_data(installation)
+                record_input_state(get_installation_directory(installation), files[installation])
+            else:
+                clear_staged_data(installation)
+
+    # Update the file coverage of the installations in their metadata
+    metadata.update_file_coverage(catalog, installations.id)
+    metadata.close()
+
+    # Store the capacities of each installation and period
+    done = report[report['status'] == 'done']
+    capacities = pd.DataFrame([(installation, tasks[key][1], capacity)
+                               for key, batch, values in zip(done['key'], done['installations'], done['capacities'])
+                               for installation, capacity in zip(batch, values)],
+                              columns=['installation_id', 'start', 'capacity'])
+    capacities.to_csv(FLEET_CAPACITIES_PATH, index=False)
+
+    # Store the report and print the summary of the run and of its stages
+    export_report(report.drop(columns=['installations', 'capacities'], errors='ignore'), args.report)
+    for _, failure in report[report['status'] == 'failed'].iterrows():
+        print(f"{failure['key']} failed:\n{failure['error']}")
+    if unknown:
+        print(f"Skipped {len(unknown)} installations whose timezone is unknown: {', '.join(map(str, unknown))}")
+    print(summarize_report(report))
+    print(pd.DataFrame.from_dict(run_profiler.stages, orient='index')[['seconds']])
+    print(summarize_stages(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+import csv
+import os
+import sqlite3
+
+from useful_methods import get_timezone_coordinates
+
+# Path of the metadata store of the installations
+METADATA_PATH = 'data//installations_metadata.sqlite'
+
+# Path of the timezone of each installation
+TIMEZONES_PATH = 'timezones.csv'
+
+# Paths of the capacities tables that are imported in the metadata store (again whenever they are modified)
+CAPACITIES_PATHS = ('data//capacities_clustering.csv', 'data//small_capacities.csv')
+
+# Capacity (kW) up to which an installation is considered too small to be analysed
+SMALL_CAPACITY = 1.0
+
+# Fields of an installation and their SQLite types
+FIELDS = {
+    'timezone': 'TEXT',
+    'latitude': 'REAL',
+    'longitude': 'REAL',
+    'capacity': 'REAL',
+    'cluster': 'INTEGER',
+    'solar_files': 'INTEGER',
+    'mains_files': 'INTEGER',
+    'first_file': 'TEXT',
+    'last_file': 'TEXT',
+}
+
+
+class InstallationMetadata:
+    """
+    This class stores the metadata of the installations (timezone, location, capacity, cluster and file coverage) in
+    one SQLite table. The whole table is loaded in a dictionary when the store is opened, so every lookup takes
+    constant time, and the updates are written through to the table in one transaction.
+    """
+
+    def __init__(self, path=METADATA_PATH):
+        """
+        :param path: the path of the SQLite file
+        """
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS installations (installation TEXT PRIMARY KEY, ' +
+                                 ', '.join(f'{field} {kind}' for field, kind in FIELDS.items()) + ')')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, mtime REAL)')
+        self._connection.commit()
+
+        # Load the metadata of all the installations
+        self.records = {row[0]: dict(zip(FIELDS, row[1:]))
+                        for row in self._connection.execute(f"SELECT installation, {', '.join(FIELDS)} "
+                                                            f"FROM installations")}
+
+    def __contains__(self, installation):
+        return installation in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, installation, field, default=None):
+        """
+        This method returns a field of an installation.
+
+        :param installation: the installation under examination
+        :param field:        the field, e.g. 'capacity'
+        :param default:      the value that is returned if the installation or the field is unknown
+
+        :return:             the value of the field
+        """
+        value = self.records.get(installation, {}).get(field)
+        return default if value is None or value == '' else value
+
+    def get_timezone(self, installation):
+        """
+        This method returns the timezone of an installation.
+
+        :param installation: the installation under examination
+
+        :return:             the name of the timezone
+        """
+        timezone = self.get(installation, 'timezone')
+        if timezone is None:
+            raise KeyError(f'The timezone of installation {installation} is unknown')
+        return timezone
+
+    def get_location(self, installation):
+        """
+        This method returns the location of an installation.
+
+        :param installation: the installation under examination
+
+        :return:             the latitude and the longitude (those of the reference city of its timezone if the
+                             location is unknown)
+        """
+        latitude, longitude = self.get(installation, 'latitude'), self.get(installation, 'longitude')
+        if latitude is None or longitude is None:
+            return get_timezone_coordinates(self.get_timezone(installation))
+        return latitude, longitude
+
+    def get_timezones(self, installations):
+        """
+        This method returns the timezones of many installations.
+
+        :param installations: the installations under examination
+
+        :return:              a dictionary mapping each installation whose timezone is known to the name of its
+                              timezone (the installations whose timezone is unknown are left out)
+        """
+        return {installation: self.get(installation, 'timezone') for installation in installations
+                if self.get(installation, 'timezone') is not None}
+
+    def is_small(self, installation):
+        """
+        This method checks whether the capacity of an installation is too small to be analysed.
+
+        :param installation: the installation under examination
+
+        :return:             True if the capacity is known and not greater than SMALL_CAPACITY
+        """
+        capacity = self.get(installation, 'capacity')
+        return capacity is not None and capacity <= SMALL_CAPACITY
+
+    def update(self, records):
+        """
+        This method updates some fields of some installations, adding the installations that are unknown.
+
+        :param records: a dictionary mapping each installation to a dictionary of its updated fields
+        """
+        rows = []
+        for installation, fields in records.items():
+            record = self.records.setdefault(installation, dict.fromkeys(FIELDS))
+            record.update({field: _to_sqlite(value) for field, value in fields.items() if field in FIELDS})
+            rows.append((installation,) + tuple(record.values()))
+
+        placeholders = ', '.join('?' * (len(FIELDS) + 1))
+        self._connection.executemany(f'INSERT OR REPLACE INTO installations VALUES ({placeholders})', rows)
+        self._connection.commit()
+
+    def update_file_coverage(self, catalog, installations, years=(2023, 2024)):
+        """
+        This method updates the number of solar and mains files of the installations and the period that they cover
+        from the catalog of the dataset.
+
+        :param catalog:       the catalog of the dataset
+        :param installations: the installations under examination
+        :param years:         the years under examination (None for all the years)
+        """
+        files = catalog if years is None else catalog[catalog['start'].dt.year.isin(years)]
+        files = files[files.index.get_level_values('installation').isin(list(installations))]
+        counts = files.groupby(level=['installation', 'signal']).size()
+        periods = files.groupby(level='installation').agg(first_file=('start', 'min'), last_file=('stop', 'max'))
+
+        self.update({installation: {'solar_files': int(counts.get((installation, 'SOLAR'), 0)),
+                                    'mains_files': int(counts.get((installation, 'IDD'), 0)),
+                                    'first_file': periods['first_file'].get(installation),
+                                    'last_file': periods['last_file'].get(installation)}
+                     for installation in installations})
+
+    def get_import_time(self, path):
+        """
+        This method returns the modification time of a CSV file when it was last imported in the store.
+
+        :param path: the path of the CSV file
+
+        :return:     the modification time (None if the file was never imported)
+        """
+        row = self._connection.execute('SELECT mtime FROM imports WHERE path = ?', (path,)).fetchone()
+        return None if row is None else row[0]
+
+    def record_import(self, path, mtime):
+        """
+        This method records that a CSV file was imported in the store.
+
+        :param path:  the path of the CSV file
+        :param mtime: the modification time of the imported file
+        """
+        self._connection.execute('INSERT OR REPLACE INTO imports VALUES (?, ?)', (path, mtime))
+        self._connection.commit()
+
+    def to_frame(self):
+        """
+        This method returns the metadata as a table, e.g. to summarize the fleet.
+
+        :return: a dataframe indexed by installation with one column per field
+        """
+        import pandas as pd
+
+        return pd.DataFrame.from_dict(self.records, orient='index', columns=list(FIELDS)).rename_axis('installation')
+
+    def close(self):
+        """
+        This method closes the SQLite file of the store.
+        """
+        self._connection.close()
+
+
+def _to_sqlite(value):
+    """
+    This method converts a value to a type that SQLite stores (e.g. numpy numbers and timestamps).
+
+    :param value: the value under examination
+
+    :return:      the converted value (None for missing values and blank strings)
+    """
+    if value is None or value != value:
+        return None
+    if isinstance(value, str):
+        return value.strip() or None
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def _read_csv(path):
+    """
+    This method reads the rows of a CSV file as dictionaries.
+
+    :param path: the path of the CSV file
+
+    :return:     the list of the rows (empty if the file does not exist)
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def _read_timezones(path):
+    """
+    This method reads the timezone of each installation from a CSV file.
+
+    :param path: the path of the CSV file (the first column holds the installation and the second its timezone)
+
+    :return:     a dictionary mapping each installation to its fields
+    """
+    records = {}
+    for row in _read_csv(path):
+        installation, timezone = list(row.values())[:2]
+        records.setdefault(installation, {})['timezone'] = timezone
+    return records
+
+
+def _read_capacities(path):
+    """
+    This method reads the capacity and the cluster of each installation from a capacities table.
+
+    :param path: the path of the CSV file
+
+    :return:     a dictionary mapping each installation to its fields
+    """
+    records = {}
+    for row in _read_csv(path):
+        fields = records.setdefault(row['installation_id'], {})
+        fields['capacity'] = float(row['capacity'])
+        if row.get('cluster'):
+            fields['cluster'] = int(row['cluster'])
+    return records
+
+
+def load_metadata(path=METADATA_PATH, timezones_path=TIMEZONES_PATH, capacities_paths=CAPACITIES_PATHS):
+    """
+    This method opens the metadata store, importing the timezones and the capacities that are stored in CSV files.
+    A CSV file is imported again whenever it was modified since its last import, so that the edits of the files and
+    the installations added to them are picked up, and its values replace those of the store.
+
+    :param path:             the path of the SQLite file
+    :param timezones_path:   the path of the timezone of each installation
+    :param capacities_paths: the paths of the capacities tables
+
+    :return:                 the metadata store
+    """
+    metadata = InstallationMetadata(path)
+
+    sources = [(timezones_path, _read_timezones)] + [(capacities_path, _read_capacities)
+                                                     for capacities_path in capacities_paths]
+    for source, read in sources:
+        if not os.path.exists(source):
+            continue
+
+        # Import the files that were modified since their last import
+        mtime = os.stat(source).st_mtime
+        if metadata.get_import_time(source) != mtime:
+            metadata.update(read(source))
+            metadata.record_import(source, mtime)
+
+    return metadata
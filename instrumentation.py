@@ -0,0 +1,100 @@
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Suffixes of the counters of a stage
+COUNTERS = ('seconds', 'calls', 'rows', 'bytes_read', 'bytes_written')
+
+
+class StageProfiler:
+    """
+    This class measures the stages of a pipeline: the time spent in each stage, the number of calls and, when they
+    are given, the rows and the bytes that were read and written. The counters are plain sums updated around each
+    stage of a file, so the profiler can be left on in production runs.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def reset(self):
+        """
+        This method clears the counters, e.g. before the next installation.
+        """
+        self.stages = {}
+
+    def add(self, stage, **counters):
+        """
+        This method adds counters to a stage.
+
+        :param stage:    the name of the stage
+        :param counters: the added values of the counters, e.g. rows=1440 or bytes_read=2048
+        """
+        totals = self.stages.setdefault(stage, dict.fromkeys(COUNTERS, 0))
+        for name, value in counters.items():
+            totals[name] += value
+
+    @contextmanager
+    def stage(self, stage, **counters):
+        """
+        This method measures the duration of a block of code as one call of a stage.
+
+        :param stage:    the name of the stage
+        :param counters: other counters of the call, e.g. rows=1440
+
+        :return:         a dictionary where the block can set more counters (e.g. the rows it produced)
+        """
+        extra = {}
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.add(stage, seconds=time.perf_counter() - start, calls=1, **counters, **extra)
+
+    def to_dict(self):
+        """
+        This method flattens the counters, e.g. {'read_seconds': 0.5, 'read_rows': 43200, ...}. The counters that
+        were never set are left out.
+
+        :return: the dictionary of the counters
+        """
+        return {f'{stage}_{name}': value for stage, totals in self.stages.items() for name, value in totals.items()
+                if value or name in ('seconds', 'calls')}
+
+
+def summarize_stages(report):
+    """
+    This method summarizes the stages of a run from the per-installation counters of its report.
+
+    :param report: the report of the run, with one '{stage}_{counter}' column per stage and counter
+
+    :return:       a dataframe with the totals of each stage and its share of the measured time, slowest first
+    """
+    totals = {}
+    for column in report.columns:
+        for name in COUNTERS:
+            if column.endswith(f'_{name}') and pd.api.types.is_numeric_dtype(report[column]):
+                stage = column[:-len(name) - 1]
+                totals.setdefault(stage, {})[name] = report[column].sum()
+
+    summary = pd.DataFrame.from_dict(totals, orient='index').reindex(columns=list(COUNTERS)).fillna(0)
+    summary = summary[summary['calls'] > 0]
+    summary['share'] = summary['seconds'] / summary['seconds'].sum()
+    summary['rows_per_second'] = summary['rows'] / summary['seconds']
+
+    return summary.sort_values('seconds', ascending=False)
+
+
+def export_report(report, path):
+    """
+    This method stores the per-installation report of a run as CSV or as JSON lines, depending on the extension of
+    the path.
+
+    :param report: the report of the run
+    :param path:   the path of the file ('.json' or '.jsonl' for JSON lines, CSV otherwise)
+    """
+    report = report.drop(columns='result', errors='ignore').rename(columns={'key': 'installation'})
+    if path.endswith(('.json', '.jsonl')):
+        report.to_json(path, orient='records', lines=True)
+    else:
+        report.to_csv(path, index=False)
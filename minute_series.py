@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+
+from useful_methods import DEFAULT_TIMEZONE
+from sanitization import sanitize_values, SIGNAL_RULES
+
+# Minutes of a day
+MINUTES_PER_DAY = 1440
+
+# Name of the time index of the frames
+INDEX_NAME = 'localminute'
+
+
+class MinuteSeries:
+    """
+    This class is a compact container of the 1-minute data of an installation: one sorted int64 array with the UTC
+    minutes since the epoch and one float32 array per signal. The local days of the installation are found once, as
+    the offsets of their first rows, so that the rows of a day are a slice (a view) of the arrays. The cleaning
+    functions of this module modify the arrays in place, and the container is converted to and from pandas only at
+    the edges of the pipeline.
+    """
+
+    def __init__(self, minutes, columns, timezone):
+        """
+        :param minutes:  the sorted and unique UTC minutes since the epoch (int64)
+        :param columns:  a dictionary with the float32 array of each signal, aligned with the minutes
+        :param timezone: the timezone of the installation
+        """
+        self.minutes = np.asarray(minutes, dtype=np.int64)
+        self.columns = {name: _to_writable(values) for name, values in columns.items()}
+        self.timezone = timezone
+
+        # Find the local day of each row and the offsets of the first row of each day
+        local_days = self._get_local_minutes() // MINUTES_PER_DAY
+        boundaries = np.flatnonzero(local_days[1:] != local_days[:-1]) + 1
+        self.day_offsets = np.concatenate(([0], boundaries, [len(self.minutes)] if len(self.minutes) else [])
+                                          ).astype(np.int64)
+        self.days = local_days[self.day_offsets[:-1]]
+
+    def _get_local_minutes(self):
+        """
+        This method converts the UTC minutes to the minutes of the local clock of the installation.
+
+        :return: the local minutes since the epoch
+        """
+        if not len(self.minutes):
+            return self.minutes
+        index = pd.DatetimeIndex((self.minutes * 60).astype('datetime64[s]'), tz='UTC').tz_convert(self.timezone)
+        return index.tz_localize(None).asi8 // (60 * 10 ** _get_unit_exponent(index))
+
+    @classmethod
+    def from_raw(cls, times, columns, timezone):
+        """
+        This method builds the container from the naive times and the values of a raw file, handling the timezones as
+        handle_timezones does. The readings of a minute that appears twice (before or after the localization) are
+        replaced by the last one.
+
+        :param times:    the naive times of the raw file (in the default timezone of the dataset)
+        :param columns:  a dictionary with the values of each signal
+        :param timezone: the timezone of the installation
+
+        :return:         the container
+        """
+        times = pd.DatetimeIndex(times)
+
+        # Localize the times in one vectorized call, resolving the ambiguous minutes to standard time and shifting the
+        # non-existent minutes by one hour
+        utc = times.tz_localize(DEFAULT_TIMEZONE, ambiguous=np.zeros(len(times), dtype=bool),
+                                nonexistent=pd.Timedelta(hours=1)).tz_convert('UTC').tz_localize(None)
+        minutes = utc.asi8 // (60 * 10 ** _get_unit_exponent(utc))
+
+        # Sort the minutes and keep the last reading of each minute
+        order = np.argsort(minutes, kind='stable')
+        minutes = minutes[order]
+        last = np.r_[minutes[1:] != minutes[:-1], True]
+        if last.all() and (order[1:] > order[:-1]).all():
+            return cls(minutes, columns, timezone)
+
+        keep = order[last]
+        return cls(minutes[last], {name: np.asarray(values)[keep] for name, values in columns.items()}, timezone)
+
+    @classmethod
+    def from_frame(cls, data, timezone=None):
+        """
+        This method builds the container from a dataframe with a timezone-aware index.
+
+        :param data:     the dataframe under examination
+        :param timezone: the timezone of the installation (defaults to the timezone of the index)
+
+        :return:         the container
+        """
+        index = data.index.tz_convert('UTC').tz_localize(None)
+        minutes = index.asi8 // (60 * 10 ** _get_unit_exponent(index))
+        columns = {name: data[name].to_numpy(dtype=np.float32) for name in data.columns}
+        return cls(minutes, columns, timezone or str(data.index.tz))
+
+    def to_frame(self):
+        """
+        This method converts the container to a dataframe indexed by the time in the timezone of the installation.
+
+        :return: the dataframe with one float32 column per signal
+        """
+        index = pd.DatetimeIndex((self.minutes * 60).astype('datetime64[s]'), tz='UTC', name=INDEX_NAME)
+        return pd.DataFrame(self.columns, index=index.tz_convert(self.timezone), copy=False)
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        self.columns[name] = _to_writable(values)
+
+    def day_slice(self, day):
+        """
+        This method returns the rows of a day.
+
+        :param day: the position of the day (from 0 to the number of days - 1)
+
+        :return:    the slice of the rows of the day, to index the arrays of the container without copying them
+        """
+        return slice(self.day_offsets[day], self.day_offsets[day + 1])
+
+    def get_dates(self):
+        """
+        This method returns the local dates of the days of the container.
+
+        :return: the DatetimeIndex of the dates
+        """
+        return pd.to_datetime(self.days * MINUTES_PER_DAY * 60, unit='s')
+
+    def get_day_positions(self):
+        """
+        This method repeats the first and the last position of each day for each row of the day.
+
+        :return: the first and the last position of the day of each row
+        """
+        counts = np.diff(self.day_offsets)
+        return np.repeat(self.day_offsets[:-1], counts), np.repeat(self.day_offsets[1:] - 1, counts)
+
+
+def _to_writable(values):
+    """
+    This method converts values to a float32 array that can be modified in place, copying them only if they are not
+    float32 or if they are read-only (e.g. a buffer shared with pyarrow).
+
+    :param values: the values under examination
+
+    :return:       the float32 array
+    """
+    values = np.asarray(values, dtype=np.float32)
+    return values if values.flags.writeable else values.copy()
+
+
+def _get_unit_exponent(index):
+    """
+    This method returns the number of decimal digits of the unit of a DatetimeIndex below the second.
+
+    :param index: the DatetimeIndex under examination
+
+    :return:      0 for seconds, 3 for milliseconds, 6 for microseconds and 9 for nanoseconds
+    """
+    return {'s': 0, 'ms': 3, 'us': 6, 'ns': 9}[index.unit]
+
+
+def sanitize_series(series, rules=None):
+    """
+    This method sanitizes the signals of a container in place, as sanitize does for a dataframe.
+
+    :param series: the container under examination (modified in place)
+    :param rules:  a dictionary mapping each signal to its rules (defaults to the rules of the signals in the data)
+
+    :return:       a dictionary with the number of changed values per signal and per rule, e.g. 'SOLAR_below_lower'
+    """
+    if rules is None:
+        rules = {name: rule for name, rule in SIGNAL_RULES.items() if name in series.columns}
+
+    report = {}
+    for name, rule in rules.items():
+        counts = {'coerced': 0, **sanitize_values(series[name], **rule)}
+        report.update({f'{name}_{counter}': count for counter, count in counts.items()})
+
+    return report
+
+
+def get_sun_times(series, sun_times_cache):
+    """
+    This method looks up the sunrise and the sunset of each day of a container once and maps them to its rows.
+
+    :param series:          the container under examination
+    :param sun_times_cache: the sunrise/sunset cache
+
+    :return:                the sunrise and the sunset of the day of each row, in seconds since the epoch (NaN for the
+                            days without a sunrise or a sunset)
+    """
+    sun_times = sun_times_cache.get_series(series.get_dates(), series.timezone)
+
+    # Convert the sunrise and the sunset of each day to seconds since the epoch
+    seconds = []
+    for column in ('sunrise', 'sunset'):
+        times = pd.DatetimeIndex(sun_times[column])
+        values = (times.asi8 / 10 ** _get_unit_exponent(times)).astype(float)
+        values[times.isna()] = np.nan
+        seconds.append(np.repeat(values, np.diff(series.day_offsets)))
+
+    return seconds[0], seconds[1]
+
+
+def zero_out_solar_series(series, sunrise, sunset):
+    """
+    This method zeroes out in place the solar values before the sunrise and after the sunset of their day, as
+    zero_out_solar_between_sunrise_sunset does.
+
+    :param series:  the container under examination (modified in place)
+    :param sunrise: the sunrise of the day of each row, in seconds since the epoch
+    :param sunset:  the sunset of the day of each row, in seconds since the epoch
+
+    :return:        the container
+    """
+    seconds = series.minutes * 60
+    series['SOLAR'][(seconds < sunrise) | (seconds > sunset)] = 0
+    return series
+
+
+def correct_solar_zeros_series(series, sunrise, sunset):
+    """
+    This method corrects in place the zero solar values between the sunrise and the sunset of their day, as
+    correct_solar_zeros_between_sunrise_sunset does, using the day offsets of the container instead of normalizing
+    the timestamps.
+
+    :param series:  the container under examination (modified in place)
+    :param sunrise: the sunrise of the day of each row, in seconds since the epoch
+    :param sunset:  the sunset of the day of each row, in seconds since the epoch
+
+    :return:        the container
+    """
+    seconds = series.minutes * 60
+    values = series['SOLAR']
+
+    # Find the non-zero values and the zeros that need to be corrected
+    non_zero = (values != 0) & ~np.isnan(values)
+    zeros = (seconds >= sunrise) & (seconds <= sunset) & (values == 0)
+    if not zeros.any():
+        return series
+
+    # Find the position of the previous and next non-zero value of each row within its day
+    positions = np.arange(len(values))
+    first_of_day, last_of_day = series.get_day_positions()
+    previous_position = np.maximum.accumulate(np.where(non_zero, positions, -1))
+    next_position = np.minimum.accumulate(np.where(non_zero, positions, len(values))[::-1])[::-1]
+    has_previous = previous_position >= first_of_day
+    has_next = next_position <= last_of_day
+    previous_value = values[np.clip(previous_position, 0, None)].astype(float)
+    next_value = values[np.clip(next_position, None, len(values) - 1)].astype(float)
+
+    # Count the zeros corrected since the previous non-zero value (or the start of the day)
+    zero_count = np.r_[0, np.cumsum(zeros)]
+    order = zero_count[positions + 1] - zero_count[np.maximum(previous_position + 1, first_of_day)]
+
+    # The k-th zero between two non-zero values converges to the next value: next + (previous - next) / 2^k
+    corrected = np.where(has_previous & has_next, next_value + np.ldexp(previous_value - next_value, -order),
+                         np.where(has_previous, previous_value, np.where(has_next, next_value, 0)))
+
+    # Replace the zero values with the corrected values
+    values[zeros] = corrected[zeros]
+
+    return series
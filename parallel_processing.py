@@ -0,0 +1,193 @@
+import json
+import os
+import time
+import traceback
+from multiprocessing import Pool
+
+import pandas as pd
+
+# Name of the file where the state of the inputs of an output is recorded
+INPUT_STATE_NAME = '_inputs.json'
+
+
+def _get_input_state_path(output_path):
+    """
+    This method returns the path of the file where the state of the inputs of an output is recorded.
+
+    :param output_path: the path of the output file or directory
+
+    :return:            the path of the state file (inside the directory, where its prefix hides it from the parquet
+                        readers, or next to the file)
+    """
+    if os.path.isdir(output_path):
+        return os.path.join(output_path, INPUT_STATE_NAME)
+    return output_path + INPUT_STATE_NAME
+
+
+def get_input_state(input_paths):
+    """
+    This method returns the state of the files an output is computed from.
+
+    :param input_paths: the paths of the input files
+
+    :return:            the sorted list of the path, the size and the modification time of each input file
+    """
+    state = []
+    for path in input_paths:
+        stat = os.stat(path)
+        state.append([path, stat.st_size, stat.st_mtime])
+    return sorted(state)
+
+
+def record_input_state(output_path, input_paths):
+    """
+    This method records the state of the files an output was computed from, once the output is written.
+
+    :param output_path: the path of the output file or directory
+    :param input_paths: the paths of the input files
+    """
+
+    # Skip the outputs that were not written (e.g. without any input)
+    if not os.path.exists(output_path):
+        return
+
+    with open(_get_input_state_path(output_path), 'w') as file:
+        json.dump(get_input_state(input_paths), file)
+
+
+def is_output_up_to_date(output_path, input_paths):
+    """
+    This method checks whether an output (a file or a directory of files) exists and was computed from the current
+    files, i.e. from the same paths with the same sizes and modification times as recorded by record_input_state. The
+    inputs that were added, removed, replaced or modified since the output was written make it out of date, whatever
+    their modification times.
+
+    :param output_path: the path of the output file or directory
+    :param input_paths: the paths of the input files
+
+    :return:            True if the output is complete and up to date, False otherwise
+    """
+    state_path = _get_input_state_path(output_path)
+
+    # Retrieve the non-empty output files
+    if os.path.isdir(output_path):
+        output_files = [os.path.join(directory, name) for directory, _, names in os.walk(output_path) for name in names]
+    else:
+        output_files = [output_path] if os.path.exists(output_path) else []
+    output_files = [path for path in output_files if path != state_path and os.path.getsize(path) > 0]
+
+    # The output does not exist, is empty or was written without recording its inputs
+    if not output_files or not os.path.exists(state_path):
+        return False
+
+    # The inputs changed since the output was written
+    with open(state_path) as file:
+        recorded = json.load(file)
+    try:
+        return recorded == get_input_state(input_paths)
+    except FileNotFoundError:
+        return False
+
+
+def _run_task(task):
+    """
+    This method runs one task and records its duration, its result and its failure (if any), so that a failing task
+    does not stop the rest of the run.
+
+    :param task: a tuple with the function, the key and the arguments of the task
+
+    :return:     a dictionary with the key, the status, the duration, the result and the error of the task
+    """
+    function, key, args = task
+
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+        status, error = 'done', None
+    except Exception:
+        result, status, error = None, 'failed', traceback.format_exc()
+
+    record = {'key': key, 'status': status, 'seconds': time.perf_counter() - start, 'result': result, 'error': error}
+
+    # Expand the results that are dictionaries into separate fields of the report
+    if isinstance(result, dict):
+        record.update(result)
+        record['result'] = None
+
+    return record
+
+
+def run_in_parallel(function, tasks, workers=None, chunksize=1, initializer=None, initargs=(), verbose=True):
+    """
+    This method runs a function for many independent tasks (e.g. installations) in a pool of processes and returns
+    an aggregated report of the run.
+
+    :param function:    the function to run, which must be importable by the worker processes
+    :param tasks:       a dictionary mapping the key of each task to the tuple of the arguments of the function
+    :param workers:     the number of worker processes (defaults to the number of cores, 1 runs in this process)
+    :param chunksize:   the number of tasks that are sent to a worker at once
+    :param initializer: a function that is called once in every worker (and once in this process when workers is 1)
+    :param initargs:    the arguments of the initializer
+    :param verbose:     whether to print the progress of the run
+
+    :return:            a dataframe with the key, status, duration (in seconds), result and error of each task (results
+                        that are dictionaries are expanded into columns)
+    """
+    workers = workers or os.cpu_count()
+    jobs = [(function, key, args) for key, args in tasks.items()]
+    records = []
+
+    # Run the tasks in this process
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        results = map(_run_task, jobs)
+        records = _collect(results, len(jobs), verbose)
+
+    # Run the tasks in a pool of processes, collecting the results as they finish
+    else:
+        with Pool(processes=workers, initializer=initializer, initargs=initargs) as pool:
+            results = pool.imap_unordered(_run_task, jobs, chunksize=chunksize)
+            records = _collect(results, len(jobs), verbose)
+
+    report = pd.DataFrame(records)
+    return report.reindex(columns=list(dict.fromkeys(['key', 'status', 'seconds', 'result', 'error'] +
+                                                     list(report.columns))))
+
+
+def _collect(results, total, verbose):
+    """
+    This method collects the results of the tasks and prints the progress of the run.
+
+    :param results: an iterable with the results of the tasks
+    :param total:   the total number of tasks
+    :param verbose: whether to print the progress of the run
+
+    :return:        the list of the results
+    """
+    records = []
+    for record in results:
+        records.append(record)
+        if verbose:
+            print(f"[{len(records)}/{total}] {record['key']} {record['status']} ({record['seconds']:.1f}s)")
+    return records
+
+
+def summarize_report(report):
+    """
+    This method summarizes the report of a run.
+
+    :param report: the report returned by run_in_parallel
+
+    :return:       a dictionary with the number of tasks per status, the total and maximum duration and the totals
+                   of the numeric fields returned by the tasks
+    """
+    summary = report['status'].value_counts().to_dict()
+    summary['seconds_total'] = float(report['seconds'].sum())
+    summary['seconds_max'] = float(report['seconds'].max()) if len(report) else 0.0
+
+    # Sum the numeric fields that were returned by the tasks
+    for column in report.columns.difference(['key', 'status', 'seconds', 'result', 'error']):
+        if pd.api.types.is_numeric_dtype(report[column]):
+            summary[column] = float(report[column].sum())
+    return summary
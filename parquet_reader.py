@@ -0,0 +1,320 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Name of the time column of the raw files, when the files do not record the name of their index
+DEFAULT_TIME_COLUMN = 'localminute'
+
+# Number of files that are read ahead while the current file is processed
+PREFETCH_DEPTH = 2
+
+# Bytes of the read-ahead data above which no more files are read ahead
+PREFETCH_MEMORY_LIMIT = 256 * 2 ** 20
+
+# Number of threads that read the files ahead
+PREFETCH_WORKERS = 2
+
+
+def get_time_column(parquet_file):
+    """
+    This method finds the column of a parquet file that holds the time index of the dataframe it was written from.
+
+    :param parquet_file: the opened pyarrow ParquetFile
+
+    :return:             the name of the time column
+    """
+    metadata = parquet_file.schema_arrow.metadata or {}
+    if b'pandas' in metadata:
+        index_columns = [column for column in json.loads(metadata[b'pandas'])['index_columns']
+                         if isinstance(column, str)]
+        if index_columns:
+            return index_columns[0]
+
+    return DEFAULT_TIME_COLUMN
+
+
+def _to_timestamp(value, timezone):
+    """
+    This method converts a bound or a statistic to a timestamp that can be compared with the values of a time column.
+
+    :param value:    the value under examination
+    :param timezone: the timezone of the time column (None for naive times)
+
+    :return:         the comparable timestamp
+    """
+    timestamp = pd.Timestamp(value)
+    if timezone is None:
+        return timestamp.tz_localize(None) if timestamp.tz is not None else timestamp
+    return timestamp.tz_localize(timezone) if timestamp.tz is None else timestamp.tz_convert(timezone)
+
+
+def select_row_groups(parquet_file, time_column, start=None, stop=None):
+    """
+    This method selects the row groups of a parquet file that may contain times in a range, using the minimum and the
+    maximum time that are stored in the statistics of each row group. The row groups without statistics are kept.
+
+    :param parquet_file: the opened pyarrow ParquetFile
+    :param time_column:  the name of the time column
+    :param start:        the first time under examination (None for no lower limit)
+    :param stop:         the last time under examination (None for no upper limit)
+
+    :return:             the list with the indices of the selected row groups
+    """
+    metadata = parquet_file.metadata
+    if start is None and stop is None:
+        return list(range(metadata.num_row_groups))
+
+    timezone = getattr(parquet_file.schema_arrow.field(time_column).type, 'tz', None)
+    position = parquet_file.schema_arrow.get_field_index(time_column)
+
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        statistics = metadata.row_group(i).column(position).statistics
+
+        # Keep the row group if it has no statistics or if its times overlap the range
+        if statistics is None or not statistics.has_min_max:
+            row_groups.append(i)
+        elif (stop is None or _to_timestamp(statistics.min, timezone) <= _to_timestamp(stop, timezone)) and \
+                (start is None or _to_timestamp(statistics.max, timezone) >= _to_timestamp(start, timezone)):
+            row_groups.append(i)
+
+    return row_groups
+
+
+def get_read_size(parquet_file, row_groups, columns):
+    """
+    This method computes the number of compressed bytes of the column chunks that are read from a parquet file.
+
+    :param parquet_file: the opened pyarrow ParquetFile
+    :param row_groups:   the indices of the read row groups
+    :param columns:      the names of the read columns
+
+    :return:             the number of bytes
+    """
+    positions = [parquet_file.schema_arrow.get_field_index(column) for column in columns]
+    return sum(parquet_file.metadata.row_group(i).column(position).total_compressed_size
+               for i in row_groups for position in positions)
+
+
+def read_table(path, columns, start=None, stop=None, memory_map=True, stats=None):
+    """
+    This method reads the time column and the requested columns of a raw parquet file, skipping the row groups that
+    are outside the time range.
+
+    :param path:       the path of the parquet file
+    :param columns:    the columns to read, e.g. ['SOLAR']
+    :param start:      the first time under examination (None for no lower limit)
+    :param stop:       the last time under examination (None for no upper limit)
+    :param memory_map: whether to memory-map the file instead of reading it into buffers
+    :param stats:      a dictionary where the number of compressed bytes that are read is added as 'bytes_read'
+                       (None to skip the count)
+
+    :return:           the pyarrow table with the time column and the requested columns in the time range, and the
+                       name of the time column
+    """
+    parquet_file = pq.ParquetFile(path, memory_map=memory_map)
+    time_column = get_time_column(parquet_file)
+
+    # Read only the requested columns of the row groups that overlap the time range
+    row_groups = select_row_groups(parquet_file, time_column, start, stop)
+    table = parquet_file.read_row_groups(row_groups, columns=[time_column] + list(columns), use_pandas_metadata=False)
+    if stats is not None:
+        stats['bytes_read'] = stats.get('bytes_read', 0) + get_read_size(parquet_file, row_groups,
+                                                                         [time_column] + list(columns))
+
+    # Filter the rows of the selected row groups that are outside the time range
+    if start is not None or stop is not None:
+        timezone = getattr(table.schema.field(time_column).type, 'tz', None)
+        mask = pa.scalar(True)
+        if start is not None:
+            mask = pc.and_(mask, pc.greater_equal(table[time_column], _to_timestamp(start, timezone)))
+        if stop is not None:
+            mask = pc.and_(mask, pc.less_equal(table[time_column], _to_timestamp(stop, timezone)))
+        table = table.filter(mask)
+
+    return table, time_column
+
+
+def _to_float32(array):
+    """
+    This method casts a numeric pyarrow column to float32, turning the missing values into NaN.
+
+    :param array: the pyarrow column under examination
+
+    :return:      the float32 numpy array, or None if the column is not numeric
+    """
+    if not (pa.types.is_floating(array.type) or pa.types.is_integer(array.type)):
+        return None
+
+    return array.cast(pa.float32()).to_numpy()
+
+
+def read_columns(path, columns, start=None, stop=None, memory_map=True, stats=None):
+    """
+    This method reads the requested columns of a raw parquet file directly into float32 arrays.
+
+    :param path:       the path of the parquet file
+    :param columns:    the columns to read, e.g. ['SOLAR']
+    :param start:      the first time under examination (None for no lower limit)
+    :param stop:       the last time under examination (None for no upper limit)
+    :param memory_map: whether to memory-map the file instead of reading it into buffers
+    :param stats:      a dictionary where the number of compressed bytes that are read is added as 'bytes_read'
+
+    :return:           the array of the times and a dictionary with the float32 array of each column (the columns
+                       that are not numeric are converted with pd.to_numeric)
+    """
+    table, time_column = read_table(path, columns, start, stop, memory_map, stats)
+
+    values = {}
+    for column in columns:
+        array = _to_float32(table[column])
+        if array is None:
+            array = pd.to_numeric(table[column].to_pandas(), errors='coerce').to_numpy(dtype=np.float32)
+        values[column] = array
+
+    return table[time_column].to_numpy(), values
+
+
+def read_frame(path, columns, start=None, stop=None, memory_map=True, stats=None):
+    """
+    This method reads the requested columns of a raw parquet file into a dataframe indexed by time, casting the
+    numeric columns to float32. It replaces pd.read_parquet(path) when only some signals are needed.
+
+    :param path:       the path of the parquet file
+    :param columns:    the columns to read, e.g. ['SOLAR']
+    :param start:      the first time under examination (None for no lower limit)
+    :param stop:       the last time under examination (None for no upper limit)
+    :param memory_map: whether to memory-map the file instead of reading it into buffers
+    :param stats:      a dictionary where the number of compressed bytes that are read is added as 'bytes_read'
+
+    :return:           the dataframe with the requested columns, indexed by time
+    """
+    table, time_column = read_table(path, columns, start, stop, memory_map, stats)
+
+    # Keep the columns that are not numeric as they are, so that the sanitization counts their coercion
+    data = {}
+    for column in columns:
+        array = _to_float32(table[column])
+        data[column] = table[column].to_pandas().to_numpy() if array is None else array
+
+    return pd.DataFrame(data, index=pd.Index(table[time_column].to_pandas(), name=time_column))
+
+
+def get_data_size(data):
+    """
+    This method computes the number of bytes that read data keeps in memory.
+
+    :param data: the data under examination (arrays, dataframes, pyarrow tables or tuples, lists and dictionaries of
+                 them)
+
+    :return:     the number of bytes (0 for the objects of other types)
+    """
+    if isinstance(data, (tuple, list)):
+        return sum(get_data_size(item) for item in data)
+    if isinstance(data, dict):
+        return sum(get_data_size(item) for item in data.values())
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(index=True).sum())
+    if isinstance(data, (np.ndarray, pd.Series, pd.Index, pa.Table, pa.Array, pa.ChunkedArray)):
+        return int(data.nbytes)
+    return 0
+
+
+def get_file_size(path):
+    """
+    This method returns the size of a file, or the total size of a group of files that are read together.
+
+    :param path: the path of the file, or a tuple of paths
+
+    :return:     the number of bytes
+    """
+    if isinstance(path, tuple):
+        return sum(get_file_size(item) for item in path)
+    return os.path.getsize(path)
+
+
+class PrefetchingReader:
+    """
+    This class reads files ahead in a pool of threads while the previous files are processed, so that the disk and
+    the CPU work at the same time. The files are yielded in their order, and the read-ahead queue is bounded both by
+    its depth and by the memory that its data takes. Until a file has been read, its size in memory is estimated as
+    the largest of its size on disk and the size of the largest file read so far. At least one file is always read,
+    whatever the memory limit, and a depth of 0 reads the files one after the other without threads.
+
+    pyarrow releases the GIL while it decompresses and decodes the column chunks, so the reads run in parallel with
+    the cleaning even though they are threads of the same process.
+    """
+
+    def __init__(self, paths, read, depth=PREFETCH_DEPTH, memory_limit=PREFETCH_MEMORY_LIMIT,
+                 workers=PREFETCH_WORKERS):
+        """
+        :param paths:        the paths of the files (or tuples of paths that are read together)
+        :param read:         the function that reads one item of the paths
+        :param depth:        the maximum number of files that are read ahead of the processed file
+        :param memory_limit: the maximum number of bytes of the data that is read ahead
+        :param workers:      the number of threads that read the files
+        """
+        self.paths = list(paths)
+        self.read = read
+        self.depth = max(depth, 0)
+        self.memory_limit = memory_limit
+        self.workers = max(workers, 1)
+
+        # Time spent waiting for the files that were not read yet, and the peak of the read-ahead data
+        self.wait_seconds = 0.0
+        self.peak_bytes = 0
+
+    def __iter__(self):
+        """
+        This method yields each path with its data, in the order of the paths.
+
+        :return: a generator of (path, data) tuples
+        """
+        if self.depth == 0:
+            for path in self.paths:
+                start = time.perf_counter()
+                data = self.read(path)
+                self.wait_seconds += time.perf_counter() - start
+                yield path, data
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, self.depth), thread_name_prefix='prefetch')
+        pending = deque()
+        position = 0
+        largest = 0
+        try:
+            while position < len(self.paths) or pending:
+
+                # Read files ahead while the queue is not full and its estimated data stays within the memory limit (the
+                # queue holds the next file and the files that are read ahead of it while it is processed)
+                while position < len(self.paths) and len(pending) <= self.depth:
+                    estimate = max(largest, get_file_size(self.paths[position]))
+                    buffered = sum(size for _, _, size in pending)
+                    if pending and buffered + estimate > self.memory_limit:
+                        break
+                    pending.append((self.paths[position], executor.submit(self.read, self.paths[position]),
+                                    estimate))
+                    position += 1
+                    self.peak_bytes = max(self.peak_bytes, buffered + estimate)
+
+                # Wait for the next file (any error of its read is raised here)
+                path, future, _ = pending.popleft()
+                start = time.perf_counter()
+                data = future.result()
+                self.wait_seconds += time.perf_counter() - start
+                largest = max(largest, get_data_size(data))
+
+                yield path, data
+        finally:
+            # Drop the reads that did not start when the iteration is stopped early
+            for _, future, _ in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
@@ -1,23 +1,36 @@
-import pandas as pd
-import glob
-import matplotlib.pyplot as plt
-import numpy as np
-from datetime import datetime
-import requests
-import pytz
-
-from useful_methods import find_installations_with_solar_in_2023_or_2024, handle_timezones, get_sunrise_sunset, \
-    zero_out_solar_between_sunrise_sunset, correct_solar_zeros_between_sunrise_sunset, \
-    zero_out_negative_values_between_sunrise_sunset
+import argparse
+import os
+import time
+from collections import Counter
 
-# Disable the future downcasting warning
-pd.set_option('future.no_silent_downcasting', True)
-
-#Import the time zones
-timezones = pd.read_csv('timezones.csv', names=['installationId', 'timezone']).drop(0)
+import pandas as pd
 
-# Set index in the timezones
-timezones.set_index('installationId', inplace=True)
+from useful_methods import zero_out_solar_between_sunrise_sunset, correct_solar_zeros_between_sunrise_sunset, \
+    map_sunrise_sunset_to_index
+from sunrise_sunset_cache import SunriseSunsetCache
+from parquet_reader import read_columns, PrefetchingReader, PREFETCH_DEPTH, PREFETCH_MEMORY_LIMIT
+from sanitization import SIGNAL_RULES
+from parallel_processing import run_in_parallel, summarize_report, is_output_up_to_date, record_input_state
+from dataset_catalog import load_catalog, find_files
+from cleaned_dataset import append_cleaned_data, clear_staged_data, commit_staged_data, merge_staged_data, \
+    get_installation_directory, get_staging_directory, get_directory_size
+from processing_manifest import ProcessingManifest, MANIFEST_PATH, get_file_state
+from instrumentation import StageProfiler, summarize_stages, export_report
+from installation_metadata import load_metadata
+from minute_series import MinuteSeries, sanitize_series, get_sun_times, zero_out_solar_series, \
+    correct_solar_zeros_series
+
+# Path of the sunrise/sunset cache that is shared by the runs
+SUN_TIMES_CACHE_PATH = 'data//sunrise_sunset.sqlite'
+
+# Cache of the sunrise and sunset times of the process (one per worker)
+sun_times_cache = None
+
+# Manifest of the processed source files of the process (one per worker)
+manifest = None
+
+# Timers and counters of the stages of the process
+profiler = StageProfiler()
 
 """
 #Import the time zones
@@ -40,94 +53,288 @@ df_installations.to_csv("data//installations_with_solar_in_2023_or_2024.csv", in
 """
 
 
-# Retrieve the installations with solar measurements in 2023 or 2024
-installations = pd.read_csv('data//installations_with_solar_in_2023_or_2024.csv')
+def initialize_worker(cache_path, manifest_path=MANIFEST_PATH):
+    """
+    This method opens the sunrise/sunset cache and the manifest of the processed files of a worker process.
 
+    :param cache_path:    the path of the SQLite file of the cache
+    :param manifest_path: the path of the SQLite file of the manifest
+    """
+    global sun_times_cache, manifest
+    sun_times_cache = SunriseSunsetCache(cache_path)
+    manifest = ProcessingManifest(manifest_path)
 
-"""
-# Iterate over the installation ids
-for installationId in installations.id:
 
-    print(installationId)
-    # plot_evs_with_mains(installationId, timezones)
+def read_solar_file(file):
+    """
+    This method reads the times and the float32 solar values of a solar file. It runs in the threads of the
+    prefetching reader, so it measures the read itself instead of using the profiler of the process.
 
-    # installationId = 'installation11'
+    :param file: the path of the solar file
 
-    # mains_files = glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installationId}/*_IDD*.parquet', recursive=True)
+    :return:     the times, a dictionary with the solar values and the counters of the read (seconds, rows and
+                 bytes_read)
+    """
+    counters = {}
+    start = time.perf_counter()
+    times, values = read_columns(file, ['SOLAR'], stats=counters)
+    counters.update(seconds=time.perf_counter() - start, calls=1, rows=len(times))
+    return times, values, counters
 
-    solar_files = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installationId}/*_SOLAR_{2023}*.parquet',
-                             recursive=True) +
-                   glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installationId}/*_SOLAR_{2024}*.parquet',
-                            recursive=True))
-"""
 
-# Iterate over all the installations under examination
-for installation in installations.id:
-#for installation in installations.id:
+def clean_solar_readings(times, values, timezone):
+    """
+    This method cleans the readings of one solar file of an installation.
+
+    :param times:    the naive times of the file
+    :param values:   a dictionary with the solar values of the file
+    :param timezone: the timezone of the installation
+
+    :return:         the cleaned data of the file and the number of values changed by the sanitization
+    """
+
+    # Handle the timezones of the data, keeping the values in a compact container until the cleaning is done
+    with profiler.stage('timezones', rows=len(times)):
+        series = MinuteSeries.from_raw(times, values, timezone)
+
+    # Fill NaN values with 0 and zero out negative values
+    with profiler.stage('sanitize', rows=len(series)):
+        sanitization_counts = sanitize_series(series, {'SOLAR': SIGNAL_RULES['SOLAR']})
+
+    return clean_solar_series(series).to_frame(), sanitization_counts
 
-    # installation = installations.id.loc[0]
 
-    solar_files = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2023}*.parquet',
-                             recursive=True) +
-                   glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2024}*.parquet',
-                             recursive=True))
+def clean_solar_file(file, timezone):
+    """
+    This method reads and cleans one solar file of an installation.
 
-    #file = solar_files[0]
+    :param file:     the path of the solar file
+    :param timezone: the timezone of the installation
 
-    # Create a list to store all the corrected dataframes of all files for the installation under examination
-    dataframes_list = []
+    :return:         the cleaned data of the file and the number of values changed by the sanitization
+    """
 
-    # Iterate over the solar files
-    for file in solar_files:
+    # Read the times and the float32 solar values of the file
+    times, values, counters = read_solar_file(file)
+    profiler.add('read', **counters)
 
-        # Read the parquet filed
-        data = pd.read_parquet(file)
+    return clean_solar_readings(times, values, timezone)
 
-        # Fill NaN values with 0 and convert to float
-        data['SOLAR'] = pd.to_numeric(data['SOLAR'].fillna(0), errors='coerce')
 
-        # Zero out negative values
-        data['SOLAR'] = data['SOLAR'].apply(lambda x: x if x >= 0 else 0)
+def clean_solar_series(series):
+    """
+    This method zeroes out the solar values of the night and corrects the zero solar values of the day in place, as
+    clean_solar_data does for a dataframe.
 
-        # Retrieve the timezone of the installation under examination
-        timezone = timezones.loc[installation].values[0]
+    :param series: the sanitized container of the data
 
-        # Handle the timezones of the data
-        data = handle_timezones(data, timezone)
+    :return:       the cleaned container
+    """
 
-        # Create a dictionary based on the date
-        data_dict = {date: group for date, group in data.groupby(data.index.date)}
+    # Look up the sunrise and the sunset of each day of the container once
+    with profiler.stage('sun_times', rows=len(series)):
+        sunrise, sunset = get_sun_times(series, sun_times_cache)
 
-        # Iterate over the days and zero out the values that are between sunrise and sunset, and correct the zero values
-        for day in data_dict.keys():
+    # Zero out the values before sunrise and after sunset
+    with profiler.stage('zero_out', rows=len(series)):
+        series = zero_out_solar_series(series, sunrise, sunset)
 
-            # Get the sunrise and the sunset for the day under examination
-            sunrise, sunset = get_sunrise_sunset(day, timezone)
+    # Correct the zero values between sunrise and sunset
+    with profiler.stage('correct_zeros', rows=len(series)):
+        series = correct_solar_zeros_series(series, sunrise, sunset)
 
-            # Zero out the values before and after sunset
-            data_dict[day] = zero_out_solar_between_sunrise_sunset(data_dict[day], sunrise, sunset)
+    return series
 
-            # Correct the zero values between sunrise and sunset
-            data_dict[day] = correct_solar_zeros_between_sunrise_sunset(data_dict[day], sunrise, sunset)
 
-        # Concatenate the daily dataframes in the dictionary into one dataframe that contains info for 30 days
-        combined_data = pd.concat(data_dict.values())
+def clean_solar_data(data, timezone):
+    """
+    This method zeroes out the solar values of the night and corrects the zero solar values of the day, using the
+    sunrise and the sunset of each day.
 
-        # Store the dataframes to the list
-        dataframes_list.append(combined_data)
+    :param data:     the sanitized data with a 'SOLAR' column and an index in the timezone of the installation
+    :param timezone: the timezone of the installation
 
-    # Concatenate the dataframes of the list to one final dataframe
-    data_installation = pd.concat(dataframes_list)
+    :return:         the cleaned data
+    """
 
-    #Store the dataframe
-    data_installation.to_csv(f'data//solar//{installation}.csv')
+    # Compute the sunrise and the sunset of all the days of the file at once and map each timestamp to the sunrise
+    # and the sunset of its day
+    with profiler.stage('sun_times', rows=len(data)):
+        sun_times = sun_times_cache.get_series(data.index.normalize().tz_localize(None).unique(), timezone)
+        sunrise, sunset = map_sunrise_sunset_to_index(data.index, sun_times)
 
-    print(installation)
+    # Zero out the values before sunrise and after sunset
+    with profiler.stage('zero_out', rows=len(data)):
+        data = zero_out_solar_between_sunrise_sunset(data, sunrise, sunset)
 
-# Change the file ------------------------ HERE
-# file = mains_files[0]
+    # Correct the zero values between sunrise and sunset
+    with profiler.stage('correct_zeros', rows=len(data)):
+        data = correct_solar_zeros_between_sunrise_sunset(data, sunrise, sunset)
 
+    return data
 
 
+def get_part_name(file):
+    """
+    This method returns the name of the part of the cleaned dataset that is written from a source file.
 
+    :param file: the path of the source file
 
+    :return:     the name of the part
+    """
+    return os.path.splitext(os.path.basename(file))[0]
+
+
+def preprocess_installation(installation, timezone, solar_files, incremental=False, prefetch_depth=PREFETCH_DEPTH,
+                            prefetch_memory_limit=PREFETCH_MEMORY_LIMIT):
+    """
+    This method cleans the solar files of an installation one by one, appending each cleaned file to the output as
+    soon as it is ready. The next files are read ahead in background threads while a file is cleaned, within the
+    depth and the memory limit of the read-ahead queue. In incremental mode only the files that were added or
+    modified since the last run are cleaned, and only their parts of the output are replaced.
+
+    :param installation:          the installation under examination
+    :param timezone:              the timezone of the installation
+    :param solar_files:           the paths of the solar files of the installation
+    :param incremental:           whether to clean only the new or modified files
+    :param prefetch_depth:        the number of files that are read ahead (0 to read the files one after the other)
+    :param prefetch_memory_limit: the maximum number of bytes of the files that are read ahead
+
+    :return:                      a dictionary with the number of files that were cleaned, kept and removed, the
+                                  number of rows that were stored, the sunrise/sunset cache lookups and the number of
+                                  values changed by the sanitization
+    """
+
+    # Keep the counters of the cache to report the lookups of this installation and reset the stage counters
+    hits, misses = sun_times_cache.hits, sun_times_cache.misses
+    profiler.reset()
+
+    # Remove any data left by an interrupted run
+    clear_staged_data(installation)
+
+    # Find the files that were added or modified since the last run (all the files if there is no previous output)
+    with profiler.stage('manifest'):
+        incremental = incremental and os.path.isdir(get_installation_directory(installation))
+        if incremental:
+            changed, touched, removed = manifest.find_changes(installation, solar_files)
+        else:
+            # Record the size and the modification time of the files without hashing them, which would read every
+            # file twice. The hashes are computed by the next incremental runs, for the files that look modified
+            changed, touched, removed = {file: get_file_state(file, with_hash=False) for file in solar_files}, {}, []
+
+    # Iterate over the solar files that need cleaning, reading the next files while the current one is cleaned
+    rows = {}
+    sanitization_counts = Counter()
+    reader = PrefetchingReader([file for file in solar_files if file in changed], read_solar_file, prefetch_depth,
+                               prefetch_memory_limit)
+    for file, (times, values, counters) in reader:
+        profiler.add('read', **counters)
+
+        # Clean the file
+        data, counts = clean_solar_readings(times, values, timezone)
+        sanitization_counts.update(counts)
+
+        # Append the cleaned file to the staged output of the installation
+        with profiler.stage('write', rows=len(data)):
+            append_cleaned_data(data, installation, get_part_name(file), get_staging_directory(installation))
+        rows[file] = len(data)
+
+    # Record the time spent waiting for the files that were not read ahead in time
+    profiler.add('read_wait', seconds=reader.wait_seconds, calls=len(reader.paths))
+
+    # Replace the parts of the modified and removed files, or the whole previous output of the installation
+    with profiler.stage('commit', bytes_written=get_directory_size(get_staging_directory(installation))):
+        if incremental:
+            merge_staged_data(installation, [get_part_name(file) for file in list(changed) + removed])
+        else:
+            commit_staged_data(installation)
+            manifest.remove(installation)
+
+        # Record the processed files in the manifest
+        manifest.record(installation, changed, rows)
+        manifest.record(installation, touched)
+        manifest.remove(installation, removed)
+
+        # Record the files the output was computed from, for the runs that skip the up to date installations
+        record_input_state(get_installation_directory(installation), solar_files)
+
+    return {'files_cleaned': len(changed),
+            'files_kept': len(solar_files) - len(changed),
+            'files_removed': len(removed),
+            'rows': sum(rows.values()),
+            'sun_times_hits': sun_times_cache.hits - hits,
+            'sun_times_misses': sun_times_cache.misses - misses,
+            **sanitization_counts,
+            **profiler.to_dict()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean the solar measurements of the installations.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--chunksize', type=int, default=1, help='installations sent to a worker at once')
+    parser.add_argument('--resume', action='store_true', help='skip installations whose output is up to date')
+    parser.add_argument('--incremental', action='store_true',
+                        help='clean only the files that were added or modified since the last run')
+    parser.add_argument('--prefetch-depth', type=int, default=PREFETCH_DEPTH,
+                        help='files read ahead while a file is cleaned (0 to read the files one after the other)')
+    parser.add_argument('--prefetch-memory', type=float, default=PREFETCH_MEMORY_LIMIT / 2 ** 20,
+                        help='maximum size of the files read ahead by each worker (in MB)')
+    parser.add_argument('--report', default='data//preprocessing_report.csv',
+                        help='path of the per-installation report of the run (.csv or .json)')
+    args = parser.parse_args()
+
+    # Open the metadata of the installations
+    metadata = load_metadata()
+
+    # Retrieve the installations with solar measurements in 2023 or 2024
+    installations = pd.read_csv('data//installations_with_solar_in_2023_or_2024.csv')
+
+    # Load the catalog of the dataset
+    run_profiler = StageProfiler()
+    with run_profiler.stage('catalog'):
+        catalog = load_catalog()
+
+    # Build the tasks, skipping the installations whose timezone is unknown and, when resuming, those whose output is
+    # up to date
+    tasks = {}
+    skipped = []
+    timezones = metadata.get_timezones(installations.id)
+    unknown = [installation for installation in installations.id if installation not in timezones]
+    with run_profiler.stage('tasks'):
+        for installation in timezones:
+            solar_files = find_files(catalog, installation, 'SOLAR', (2023, 2024))
+            if args.resume and is_output_up_to_date(get_installation_directory(installation), solar_files):
+                skipped.append(installation)
+            else:
+                tasks[installation] = (installation, timezones[installation], solar_files, args.incremental,
+                                       args.prefetch_depth, int(args.prefetch_memory * 2 ** 20))
+
+    # Clean the installations in parallel
+    with run_profiler.stage('run'):
+        report = run_in_parallel(preprocess_installation, tasks, workers=args.workers, chunksize=args.chunksize,
+                                 initializer=initialize_worker, initargs=(SUN_TIMES_CACHE_PATH, MANIFEST_PATH))
+
+    # Update the file coverage of the installations in their metadata
+    metadata.update_file_coverage(catalog, installations.id)
+    metadata.close()
+
+    # Add the skipped installations and those whose timezone is unknown to the report and store it
+    if skipped:
+        report = pd.concat([report, pd.DataFrame({'key': skipped, 'status': 'skipped', 'seconds': 0.0})],
+                           ignore_index=True)
+    if unknown:
+        report = pd.concat([report, pd.DataFrame({'key': unknown, 'status': 'failed', 'seconds': 0.0,
+                                                  'error': 'The timezone of the installation is unknown'})],
+                           ignore_index=True)
+    export_report(report, args.report)
+
+    # Print the failed installations and the summary of the run and of its stages
+    for _, failure in report[report['status'] == 'failed'].iterrows():
+        print(f"{failure['key']} failed:\n{failure['error']}")
+    print(summarize_report(report))
+    print(pd.DataFrame.from_dict(run_profiler.stages, orient='index')[['seconds']])
+    print(summarize_stages(report))
+
+
+if __name__ == '__main__':
+    main()
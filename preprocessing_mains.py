@@ -1,149 +1,263 @@
-import pandas as pd
-import glob
-import pandas as pd
-import glob
-import matplotlib.pyplot as plt
-import numpy as np
-from datetime import datetime
-import requests
-import pytz
-
-
-from useful_methods import find_installations_with_solar_in_2023_or_2024, handle_timezones, get_sunrise_sunset, \
-    zero_out_solar_between_sunrise_sunset, correct_solar_zeros_between_sunrise_sunset, \
-    zero_out_negative_values_between_sunrise_sunset
-
-
-#Import the time zones
-timezones = pd.read_csv('timezones.csv', names=['installationId', 'timezone']).drop(0)
-
-# Set index in the timezones
-timezones.set_index('installationId', inplace=True)
-
-# Load data
-installations = pd.read_csv('data//installations_with_solar_in_2023_or_2024.csv')
-installations_with_small_capacities = pd.read_csv('data//small_capacities.csv')
-
-
-# Filter installations where id is not in installations_with_small_capacities
-filtered_installations = installations[
-    ~installations['id'].isin(installations_with_small_capacities['installation_id'])
-]
-
-
-
-# Iterate over all the installations under examination
-for installation in filtered_installations.id:
-
-    print(installation)
-
-    # installation = filtered_installations['id'].loc[0]
-
-    solar_files = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2023}*.parquet',
-                             recursive=True) +
-                   glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2024}*.parquet',
-                             recursive=True))
-
-    # Create a list to store all the main files
-    main_files = []
-
-    # Iterate over the solar file
-    for file in solar_files:
-
-        # Extract the start and stop date of the solar file
-        start_date = file.split('_')[3]
-        stop_date = file.split('_')[4].split('.')[0]
-
-        time_period = start_date + '_' + stop_date
-
-        # Retrieve the mains file corresponding to this time period
-        main_file = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_{time_period}_IDD**.parquet',
-                               recursive=True))
-
-        # Add the main file to the list
-        if main_file:  # Append only if a match is found
-            main_files.extend(main_file)
-
-
-# --------------------------------------- FOR ONE INSTALLATION --------------------------------------------------------
-
-# Execution for one installation
+import argparse
+import os
+import time
+from collections import Counter
 
-installation = filtered_installations['id'].loc[0]
-
-solar_files = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2023}*.parquet',
-                             recursive=True) +
-                glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_SOLAR_{2024}*.parquet',
-                          recursive=True))
-
-# Create a list to store all the main files
-main_files = []
-
-# Iterate over the solar file
-for file in solar_files:
-    # Extract the start and stop date of the solar file
-    start_date = file.split('_')[3]
-    stop_date = file.split('_')[4].split('.')[0]
-
-    time_period = start_date + '_' + stop_date
-
-    # Retrieve the mains file corresponding to this time period
-    main_file = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installation}/*_{time_period}_IDD**.parquet',
-                           recursive=True))
-
-    # Add the main file to the list
-    if main_file:  # Append only if a match is found
-
-        # Read the parquet filed
-        data = pd.read_parquet(main_file)
-
-        # Fill NaN values with 0 and convert to float
-        data['MAINS'] = pd.to_numeric(data['MAINS'].fillna(0), errors='coerce')
-
-        main_files.extend(main_file)
-
-
-for file in main_files:
-
-    file = main_files[0]
-
-    # Read the parquet filed
-    data = pd.read_parquet(file)
-
-    #
-    data.sort_index()
-
-    # Fill NaN values with 0 and convert to float
-    data['MAINS'] = pd.to_numeric(data['MAINS'].fillna(0), errors='coerce')
-
-    # Replace values that are greater than 50kW with zeros.
-    data['MAINS'] = data['MAINS'].apply(lambda x: x if x < 50 else 0)
-
-    # Zero out negative values
-    # data['SOLAR'] = data['SOLAR'].apply(lambda x: x if x >= 0 else 0)
-
-    # Retrieve the timezone of the installation under examination
-    timezone = timezones.loc[installation].values[0]
-
-    # Handle the timezones of the data
-    data = handle_timezones(data, timezone)
-
-    # Create a dictionary based on the date
-    data_dict = {date: group for date, group in data.groupby(data.index.date)}
-
-    # Iterate over the days and zero out the values that are between sunrise and sunset, and correct the zero values
-    for day in data_dict.keys():
-
-        print(day)
-        # Get the sunrise and the sunset for the day under examination
-        sunrise, sunset = get_sunrise_sunset(day, timezone)
-
-        # Zero out the negative values before and after sunset
-        # data_dict[day] = zero_out_negative_values_between_sunrise_sunset(data_dict[day], sunrise, sunset)
-
-        # Correct the zero values between sunrise and sunset
-        # data_dict[day] = correct_solar_zeros_between_sunrise_sunset(data_dict[day], sunrise, sunset)
+import numpy as np
+import pandas as pd
 
-    # Concatenate the daily dataframes in the dictionary into one dataframe that contains info for 30 days
-    combined_data = pd.concat(data_dict.values())
+import preprocessing
+from preprocessing import clean_solar_data, profiler, SUN_TIMES_CACHE_PATH
+from sunrise_sunset_cache import SunriseSunsetCache
+from useful_methods import handle_timezones
+from parquet_reader import read_frame, PrefetchingReader, PREFETCH_DEPTH, PREFETCH_MEMORY_LIMIT
+from sanitization import sanitize, SIGNAL_RULES
+from parallel_processing import run_in_parallel, summarize_report, is_output_up_to_date, record_input_state
+from dataset_catalog import load_catalog, select_file_pairs
+from cleaned_dataset import append_cleaned_data, clear_staged_data, commit_staged_data, get_installation_directory, \
+    get_staging_directory, get_directory_size, NET_LOAD_DATASET_DIRECTORY
+from instrumentation import StageProfiler, summarize_stages, export_report
+from installation_metadata import load_metadata
+
+
+def initialize_worker(cache_path):
+    """
+    This method opens the sunrise/sunset cache of a worker process. The combined dataset is not recorded in the
+    manifest of the solar files, so, unlike the solar workers, the mains workers do not open it.
 
+    :param cache_path: the path of the SQLite file of the cache
+    """
+    preprocessing.sun_times_cache = SunriseSunsetCache(cache_path)
+
+
+def add_consumption_columns(data):
+    """
+    This method derives the consumption of an installation from its solar production and its mains measurements. The
+    mains meter measures the power exchanged with the grid (negative when the solar production is exported), so it is
+    the net load, and the gross consumption is the net load plus the solar production. The columns are missing (NaN)
+    for the minutes that one of the two files did not measure.
+
+    :param data: the cleaned data with a 'SOLAR' and a 'MAINS' column
+
+    :return:     the data with the 'NET_LOAD' and the 'GROSS_CONSUMPTION' columns
+    """
+    data['NET_LOAD'] = data['MAINS']
+    data['GROSS_CONSUMPTION'] = data['MAINS'] + data['SOLAR']
+    return data
+
+
+def read_file_pair(file_pair):
+    """
+    This method reads the solar and the mains file of the same period. It runs in the threads of the prefetching
+    reader, so it measures the read itself instead of using the profiler of the process.
+
+    :param file_pair: the (solar_file, mains_file) tuple of the period
+
+    :return:          the solar data, the mains data and the counters of the read (seconds, rows and bytes_read)
+    """
+    solar_file, mains_file = file_pair
+    counters = {}
+    start = time.perf_counter()
+    solar = read_frame(solar_file, ['SOLAR'], stats=counters)
+    mains = read_frame(mains_file, ['MAINS'], stats=counters)
+    counters.update(seconds=time.perf_counter() - start, calls=1, rows=len(solar) + len(mains))
+    return solar, mains, counters
+
+
+def clean_file_pair(solar_file, mains_file, timezone):
+    """
+    This method reads the solar and the mains file of the same period, aligns them on one time index and cleans them.
+
+    :param solar_file: the path of the solar file
+    :param mains_file: the path of the mains file
+    :param timezone:   the timezone of the installation
+
+    :return:           the combined cleaned data of the period and the number of values changed by the sanitization
+    """
+
+    # Read the two signals of the period
+    solar, mains, counters = read_file_pair((solar_file, mains_file))
+    profiler.add('read', **counters)
+
+    return clean_period(solar, mains, timezone)
+
+
+def clean_period(solar, mains, timezone):
+    """
+    This method aligns the solar and the mains data of the same period on one time index and cleans them. Each
+    signal is sanitized before the join, so the minutes that only one file measured keep the other signal missing
+    (NaN) instead of the fill value of the sanitization.
+
+    :param solar:    the raw solar data of the period
+    :param mains:    the raw mains data of the period
+    :param timezone: the timezone of the installation
+
+    :return:         the combined cleaned data of the period and the number of values changed by the sanitization
+    """
+
+    # Handle the timezones of the two files
+    with profiler.stage('timezones', rows=len(solar) + len(mains)):
+        solar = handle_timezones(solar, timezone)
+        mains = handle_timezones(mains, timezone)
+
+    # Drop the minutes that appear twice after the shift of the nonexistent DST hour, so that the join is one-to-one
+    solar = solar[~solar.index.duplicated(keep='last')]
+    mains = mains[~mains.index.duplicated(keep='last')]
+
+    # Fill the missing values, zero out the negative solar values and the mains values that are greater than 50kW, in
+    # the readings of each file
+    with profiler.stage('sanitize', rows=len(solar) + len(mains)):
+        sanitization_counts = {**sanitize(solar, {'SOLAR': SIGNAL_RULES['SOLAR']}),
+                               **sanitize(mains, {'MAINS': SIGNAL_RULES['MAINS']})}
+
+    # Align the two signals on the localized minutes with one join (the minutes that a file did not measure are NaN)
+    with profiler.stage('join') as counters:
+        data = solar.join(mains, how='outer')
+        counters['rows'] = len(data)
+
+    # Clean the solar values with the sunrise and the sunset of each day, leaving the minutes that the solar file did
+    # not measure missing (the zeroing of the night would set them to 0)
+    unmeasured = data['SOLAR'].isna().to_numpy()
+    data = clean_solar_data(data, timezone)
+    data.loc[unmeasured, 'SOLAR'] = np.nan
+
+    return add_consumption_columns(data), sanitization_counts
+
+
+def preprocess_installation(installation, timezone, file_pairs, root=NET_LOAD_DATASET_DIRECTORY,
+                            prefetch_depth=PREFETCH_DEPTH, prefetch_memory_limit=PREFETCH_MEMORY_LIMIT):
+    """
+    This method cleans the pairs of solar and mains files of an installation one by one, appending each combined
+    period to the output as soon as it is ready. The next pairs are read ahead in background threads while a period
+    is cleaned, within the depth and the memory limit of the read-ahead queue.
+
+    :param installation:          the installation under examination
+    :param timezone:              the timezone of the installation
+    :param file_pairs:            a list of (solar_file, mains_file) tuples of the same periods
+    :param root:                  the directory of the combined dataset
+    :param prefetch_depth:        the number of pairs that are read ahead (0 to read the pairs one after the other)
+    :param prefetch_memory_limit: the maximum number of bytes of the pairs that are read ahead
+
+    :return:                      a dictionary with the number of periods and rows that were stored, the
+                                  sunrise/sunset cache lookups and the number of values changed by the sanitization
+    """
+    cache = preprocessing.sun_times_cache
+
+    # Keep the counters of the cache to report the lookups of this installation and reset the stage counters
+    hits, misses = cache.hits, cache.misses
+    profiler.reset()
+
+    # Remove any data left by an interrupted run
+    clear_staged_data(installation, root)
+
+    # Iterate over the periods, reading the next pairs of files while the current period is cleaned
+    rows = 0
+    sanitization_counts = Counter()
+    reader = PrefetchingReader([tuple(file_pair) for file_pair in file_pairs], read_file_pair, prefetch_depth,
+                               prefetch_memory_limit)
+    for (solar_file, _), (solar, mains, counters) in reader:
+        profiler.add('read', **counters)
+
+        # Clean the period
+        data, counts = clean_period(solar, mains, timezone)
+        sanitization_counts.update(counts)
+
+        # Append the combined period to the staged output of the installation
+        with profiler.stage('write', rows=len(data)):
+            append_cleaned_data(data, installation, os.path.splitext(os.path.basename(solar_file))[0],
+                                get_staging_directory(installation, root))
+        rows += len(data)
+
+    # Record the time spent waiting for the pairs that were not read ahead in time
+    profiler.add('read_wait', seconds=reader.wait_seconds, calls=len(reader.paths))
+
+    # Replace the previous output of the installation with the new one
+    with profiler.stage('commit', bytes_written=get_directory_size(get_staging_directory(installation, root))):
+        commit_staged_data(installation, root)
+
+        # Record the files the output was computed from, for the runs that skip the up to date installations
+        record_input_state(get_installation_directory(installation, root),
+                           [file for file_pair in file_pairs for file in file_pair])
+
+    return {'periods': len(file_pairs),
+            'rows': rows,
+            'sun_times_hits': cache.hits - hits,
+            'sun_times_misses': cache.misses - misses,
+            **sanitization_counts,
+            **profiler.to_dict()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Combine the solar and mains measurements of the installations.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--chunksize', type=int, default=1, help='installations sent to a worker at once')
+    parser.add_argument('--resume', action='store_true', help='skip installations whose output is up to date')
+    parser.add_argument('--prefetch-depth', type=int, default=PREFETCH_DEPTH,
+                        help='pairs of files read ahead while a period is cleaned (0 to read them one after the other)')
+    parser.add_argument('--prefetch-memory', type=float, default=PREFETCH_MEMORY_LIMIT / 2 ** 20,
+                        help='maximum size of the files read ahead by each worker (in MB)')
+    parser.add_argument('--report', default='data//preprocessing_mains_report.csv',
+                        help='path of the per-installation report of the run (.csv or .json)')
+    args = parser.parse_args()
+
+    # Open the metadata of the installations
+    metadata = load_metadata()
+
+    # Load the installations, leaving out those with small capacities
+    installations = pd.read_csv('data//installations_with_solar_in_2023_or_2024.csv')
+    filtered_installations = [installation for installation in installations.id
+                              if not metadata.is_small(installation)]
+
+    # Load the catalog of the dataset
+    run_profiler = StageProfiler()
+    with run_profiler.stage('catalog'):
+        catalog = load_catalog()
+
+    # Build the tasks from the solar and mains files of the same periods, skipping the installations whose timezone is
+    # unknown and, when resuming, those whose output is up to date
+    tasks = {}
+    skipped = []
+    timezones = metadata.get_timezones(filtered_installations)
+    unknown = [installation for installation in filtered_installations if installation not in timezones]
+    with run_profiler.stage('tasks'):
+        for installation in timezones:
+            pairs = select_file_pairs(catalog, installation, (2023, 2024))
+            file_pairs = list(zip(pairs['solar_path'], pairs['mains_path']))
+            inputs = pairs['solar_path'].tolist() + pairs['mains_path'].tolist()
+            output = get_installation_directory(installation, NET_LOAD_DATASET_DIRECTORY)
+            if args.resume and is_output_up_to_date(output, inputs):
+                skipped.append(installation)
+            else:
+                tasks[installation] = (installation, timezones[installation], file_pairs,
+                                       NET_LOAD_DATASET_DIRECTORY, args.prefetch_depth,
+                                       int(args.prefetch_memory * 2 ** 20))
+
+    # Combine the installations in parallel
+    with run_profiler.stage('run'):
+        report = run_in_parallel(preprocess_installation, tasks, workers=args.workers, chunksize=args.chunksize,
+                                 initializer=initialize_worker, initargs=(SUN_TIMES_CACHE_PATH,))
+
+    # Update the file coverage of the installations in their metadata
+    metadata.update_file_coverage(catalog, filtered_installations)
+    metadata.close()
+
+    # Add the skipped installations and those whose timezone is unknown to the report and store it
+    if skipped:
+        report = pd.concat([report, pd.DataFrame({'key': skipped, 'status': 'skipped', 'seconds': 0.0})],
+                           ignore_index=True)
+    if unknown:
+        report = pd.concat([report, pd.DataFrame({'key': unknown, 'status': 'failed', 'seconds': 0.0,
+                                                  'error': 'The timezone of the installation is unknown'})],
+                           ignore_index=True)
+    export_report(report, args.report)
+
+    # Print the failed installations and the summary of the run and of its stages
+    for _, failure in report[report['status'] == 'failed'].iterrows():
+        print(f"{failure['key']} failed:\n{failure['error']}")
+    print(summarize_report(report))
+    print(pd.DataFrame.from_dict(run_profiler.stages, orient='index')[['seconds']])
+    print(summarize_stages(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import sqlite3
+
+# Path of the manifest of the source files that were processed
+MANIFEST_PATH = 'data//preprocessing_manifest.sqlite'
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """
+    This method computes the hash of the content of a file.
+
+    :param path:       the path of the file
+    :param chunk_size: the number of bytes that are read at once
+
+    :return:           the hexadecimal BLAKE2 digest of the file
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_state(path, with_hash=True):
+    """
+    This method returns the state of a file that is recorded in the manifest.
+
+    :param path:      the path of the file
+    :param with_hash: whether to hash the content of the file (a full read of the file)
+
+    :return:          the size, the modification time and the hash of the file (None if it is not computed)
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime, hash_file(path) if with_hash else None
+
+
+class ProcessingManifest:
+    """
+    This class records the source files that were cleaned (path, size, modification time and content hash) in an
+    SQLite file, so that the next runs clean only the files that were added or changed. The hash of a file is computed
+    only when its size or modification time changed, so an unchanged fleet is checked with one stat per file. The full
+    runs record the files without their hash, and a file whose hash is unknown is cleaned again when its size or
+    modification time changes.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        """
+        :param path: the path of the SQLite file
+        """
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS manifest ('
+                                 'path TEXT PRIMARY KEY, installation TEXT, size INTEGER, mtime REAL, hash TEXT, '
+                                 'rows INTEGER)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS manifest_installation ON manifest (installation)')
+        self._connection.commit()
+
+    def get_entries(self, installation):
+        """
+        This method returns the recorded files of an installation.
+
+        :param installation: the installation under examination
+
+        :return:             a dictionary mapping the path of each file to its size, modification time and hash
+        """
+        rows = self._connection.execute('SELECT path, size, mtime, hash FROM manifest WHERE installation = ?',
+                                        (str(installation),)).fetchall()
+        return {path: (size, mtime, content_hash) for path, size, mtime, content_hash in rows}
+
+    def find_changes(self, installation, files):
+        """
+        This method compares the current source files of an installation with the recorded ones.
+
+        :param installation: the installation under examination
+        :param files:        the paths of the current source files
+
+        :return:             a dictionary with the size, the modification time and the hash of each new or modified
+                             file, a dictionary with the same fields for the files whose content did not change but
+                             whose size or modification time did, and the list of the recorded files that no longer
+                             exist
+        """
+        entries = self.get_entries(installation)
+
+        changed = {}
+        touched = {}
+        for path in files:
+            stat = os.stat(path)
+            entry = entries.get(path)
+
+            # Skip the files whose size and modification time did not change
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime):
+                continue
+
+            # Hash the rest to tell the modified files from the touched ones (the files recorded without a hash count as
+            # modified)
+            content_hash = hash_file(path)
+            if entry is not None and entry[2] is not None and entry[2] == content_hash:
+                touched[path] = (stat.st_size, stat.st_mtime, content_hash)
+            else:
+                changed[path] = (stat.st_size, stat.st_mtime, content_hash)
+
+        removed = sorted(set(entries) - set(files))
+
+        return changed, touched, removed
+
+    def record(self, installation, files, rows=None):
+        """
+        This method records processed files of an installation.
+
+        :param installation: the installation under examination
+        :param files:        a dictionary mapping the path of each file to its size, modification time and hash
+        :param rows:         a dictionary mapping the path of each file to the number of cleaned rows (None to keep the
+                             recorded numbers)
+        """
+        for path, (size, mtime, content_hash) in files.items():
+            if rows is None:
+                self._connection.execute('UPDATE manifest SET size = ?, mtime = ?, hash = ? WHERE path = ?',
+                                         (size, mtime, content_hash, path))
+            else:
+                self._connection.execute('INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?)',
+                                         (path, str(installation), size, mtime, content_hash, rows.get(path)))
+        self._connection.commit()
+
+    def remove(self, installation, paths=None):
+        """
+        This method removes files of an installation from the manifest.
+
+        :param installation: the installation under examination
+        :param paths:        the paths of the removed files (None for all the files of the installation)
+        """
+        if paths is None:
+            self._connection.execute('DELETE FROM manifest WHERE installation = ?', (str(installation),))
+        else:
+            self._connection.executemany('DELETE FROM manifest WHERE path = ?', [(path,) for path in paths])
+        self._connection.commit()
+
+    def close(self):
+        """
+        This method closes the SQLite file of the manifest.
+        """
+        self._connection.close()
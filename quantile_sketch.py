@@ -0,0 +1,124 @@
+import numpy as np
+
+# Default relative accuracy of the quantiles
+DEFAULT_RELATIVE_ACCURACY = 0.005
+
+
+class QuantileSketch:
+    """
+    This class is a mergeable streaming quantile sketch for positive values, with logarithmically spaced buckets
+    (as in DDSketch). Every quantile is returned with a bounded relative error, the sketches of different files can
+    be merged by adding their bucket counts, and a sketch takes a few kilobytes whatever the number of values.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, offset=0, counts=None):
+        """
+        :param relative_accuracy: the relative accuracy of the quantiles
+        :param offset:            the index of the first bucket
+        :param counts:            the counts of the buckets
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.offset = int(offset)
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def add(self, values):
+        """
+        This method adds values to the sketch. The values that are not positive (or not finite) are ignored.
+
+        :param values: the values as an array-like
+
+        :return:       the sketch itself
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values) & (values > 0)]
+        if not len(values):
+            return self
+
+        # Find the bucket of each value and count the values per bucket
+        indices = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        offset = int(indices.min())
+        self._add_counts(offset, np.bincount(indices - offset))
+
+        return self
+
+    def merge(self, other):
+        """
+        This method merges another sketch with the same relative accuracy into this sketch.
+
+        :param other: the other sketch
+
+        :return:      the sketch itself
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Only sketches with the same relative accuracy can be merged')
+
+        if len(other.counts):
+            self._add_counts(other.offset, other.counts)
+
+        return self
+
+    def quantile(self, q):
+        """
+        This method estimates a quantile of the values that were added to the sketch.
+
+        :param q: the quantile (between 0 and 1)
+
+        :return:  the estimated quantile, or NaN if the sketch is empty
+        """
+        total = self.count
+        if total == 0:
+            return np.nan
+
+        # Find the bucket of the requested rank
+        rank = q * (total - 1)
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank, side='right'))
+
+        # Return the value in the middle of the bucket (in relative terms)
+        return float(2 * self.gamma ** (self.offset + bucket) / (self.gamma + 1))
+
+    def to_bytes(self):
+        """
+        This method serializes the counts of the sketch.
+
+        :return: the counts as bytes
+        """
+        return self.counts.astype('<i8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, offset, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """
+        This method restores a sketch that was serialized with to_bytes.
+
+        :param data:              the counts as bytes
+        :param offset:            the index of the first bucket
+        :param relative_accuracy: the relative accuracy of the sketch
+
+        :return:                  the sketch
+        """
+        return cls(relative_accuracy, offset, np.frombuffer(data, dtype='<i8').copy())
+
+    def _add_counts(self, offset, counts):
+        """
+        This method adds bucket counts to the sketch, growing its range of buckets when needed.
+
+        :param offset: the index of the first added bucket
+        :param counts: the added counts
+        """
+        if not len(self.counts):
+            self.offset, self.counts = offset, np.array(counts, dtype=np.int64)
+            return
+
+        # Grow the range of the buckets to cover both sketches
+        start = min(self.offset, offset)
+        stop = max(self.offset + len(self.counts), offset + len(counts))
+        merged = np.zeros(stop - start, dtype=np.int64)
+        merged[self.offset - start:self.offset - start + len(self.counts)] += self.counts
+        merged[offset - start:offset - start + len(counts)] += counts
+
+        self.offset, self.counts = start, merged
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# Sanitization rules of each signal:
+#   fill_value:        the value of the missing (or non-numeric) samples
+#   lower:             the samples below this value are replaced by lower_replacement
+#   upper:             the samples equal to or above this value are replaced by upper_replacement
+SIGNAL_RULES = {
+    # Zero out negative values
+    'SOLAR': {'fill_value': 0.0, 'lower': 0.0, 'lower_replacement': 0.0},
+
+    # Replace values that are greater than 50kW with zeros
+    'MAINS': {'fill_value': 0.0, 'upper': 50.0, 'upper_replacement': 0.0},
+}
+
+
+def sanitize_column(data, column, fill_value=0.0, lower=None, lower_replacement=0.0, upper=None,
+                    upper_replacement=0.0, dtype=np.float32):
+    """
+    This method sanitizes one column of a dataframe with vectorized in-place operations on a float buffer: it coerces
+    the values to numbers, fills the missing values and applies the lower and upper limits.
+
+    :param data:              the dataframe under examination (modified in place)
+    :param column:            the column to sanitize
+    :param fill_value:        the value of the missing (or non-numeric) samples
+    :param lower:             the samples below this value are replaced by lower_replacement (None for no limit)
+    :param lower_replacement: the replacement of the samples below the lower limit
+    :param upper:             the samples equal to or above this value are replaced by upper_replacement (None for no
+                              limit)
+    :param upper_replacement: the replacement of the samples above the upper limit
+    :param dtype:             the dtype of the sanitized column
+
+    :return:                  a dictionary with the number of values that were coerced, filled, raised to the lower
+                              limit and replaced above the upper limit
+    """
+    values = data[column]
+    counts = {'coerced': 0, 'filled': 0, 'below_lower': 0, 'above_upper': 0}
+
+    # Convert to numbers, counting the values that could not be converted
+    if not pd.api.types.is_numeric_dtype(values):
+        numeric = pd.to_numeric(values, errors='coerce')
+        counts['coerced'] = int((numeric.isna() & values.notna()).sum())
+        values = numeric
+
+    # Copy the values once into a float buffer and sanitize it in place
+    buffer = values.to_numpy(dtype=dtype, na_value=np.nan, copy=True)
+    counts.update(sanitize_values(buffer, fill_value, lower, lower_replacement, upper, upper_replacement))
+    counts['filled'] -= counts['coerced']
+
+    data[column] = buffer
+
+    return counts
+
+
+def sanitize_values(buffer, fill_value=0.0, lower=None, lower_replacement=0.0, upper=None, upper_replacement=0.0):
+    """
+    This method sanitizes a float array in place: it fills the missing values and applies the lower and upper limits.
+
+    :param buffer:            the float array under examination (modified in place)
+    :param fill_value:        the value of the missing samples
+    :param lower:             the samples below this value are replaced by lower_replacement (None for no limit)
+    :param lower_replacement: the replacement of the samples below the lower limit
+    :param upper:             the samples equal to or above this value are replaced by upper_replacement (None for no
+                              limit)
+    :param upper_replacement: the replacement of the samples above the upper limit
+
+    :return:                  a dictionary with the number of values that were filled, raised to the lower limit and
+                              replaced above the upper limit
+    """
+    counts = {'filled': 0, 'below_lower': 0, 'above_upper': 0}
+
+    # Fill the missing values
+    mask = np.isnan(buffer)
+    counts['filled'] = int(mask.sum())
+    np.putmask(buffer, mask, fill_value)
+
+    # Replace the values below the lower limit
+    if lower is not None:
+        np.less(buffer, lower, out=mask)
+        counts['below_lower'] = int(mask.sum())
+        np.putmask(buffer, mask, lower_replacement)
+
+    # Replace the values above the upper limit
+    if upper is not None:
+        np.greater_equal(buffer, upper, out=mask)
+        counts['above_upper'] = int(mask.sum())
+        np.putmask(buffer, mask, upper_replacement)
+
+    return counts
+
+
+def sanitize(data, rules=None, dtype=np.float32):
+    """
+    This method sanitizes the signals of a dataframe according to their rules.
+
+    :param data:  the dataframe under examination (modified in place)
+    :param rules: a dictionary mapping each column to its rules (defaults to the rules of the signals in the data)
+    :param dtype: the dtype of the sanitized columns
+
+    :return:      a dictionary with the number of changed values per column and per rule, e.g. 'SOLAR_below_lower'
+    """
+    if rules is None:
+        rules = {column: rule for column, rule in SIGNAL_RULES.items() if column in data.columns}
+
+    report = {}
+    for column, rule in rules.items():
+        counts = sanitize_column(data, column, dtype=dtype, **rule)
+        report.update({f'{column}_{name}': count for name, count in counts.items()})
+
+    return report
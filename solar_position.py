@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+# Solar zenith angle (in degrees) at sunrise and sunset, accounting for atmospheric refraction and the solar disc
+SUNRISE_ZENITH = 90.833
+
+# Julian day of the J2000.0 epoch and of the unix epoch
+J2000 = 2451545.0
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+
+def _julian_centuries(julian_day):
+    """
+    This method converts julian days to julian centuries since the J2000.0 epoch.
+
+    :param julian_day: the julian days as a numpy array
+
+    :return:           the julian centuries as a numpy array
+    """
+    return (julian_day - J2000) / 36525.0
+
+
+def _sun_declination_and_equation_of_time(julian_century):
+    """
+    This method computes the declination of the sun and the equation of time following the NOAA solar calculator.
+
+    :param julian_century: the julian centuries since the J2000.0 epoch as a numpy array
+
+    :return:               the declination (in degrees) and the equation of time (in minutes) as numpy arrays
+    """
+    t = julian_century
+
+    # Geometric mean longitude and anomaly of the sun (in degrees)
+    mean_longitude = np.mod(280.46646 + t * (36000.76983 + t * 0.0003032), 360.0)
+    mean_anomaly = 357.52911 + t * (35999.05029 - 0.0001537 * t)
+
+    # Eccentricity of the earth's orbit
+    eccentricity = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+
+    # Equation of the center of the sun
+    anomaly = np.radians(mean_anomaly)
+    equation_of_center = (np.sin(anomaly) * (1.914602 - t * (0.004817 + 0.000014 * t)) +
+                          np.sin(2 * anomaly) * (0.019993 - 0.000101 * t) +
+                          np.sin(3 * anomaly) * 0.000289)
+
+    # Apparent longitude of the sun
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent_longitude = mean_longitude + equation_of_center - 0.00569 - 0.00478 * np.sin(omega)
+
+    # Corrected obliquity of the ecliptic
+    mean_obliquity = 23.0 + (26.0 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60.0) / 60.0
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+
+    # Declination of the sun
+    declination = np.degrees(np.arcsin(np.sin(obliquity) * np.sin(np.radians(apparent_longitude))))
+
+    # Equation of time (in minutes)
+    y = np.tan(obliquity / 2) ** 2
+    longitude = np.radians(mean_longitude)
+    equation_of_time = 4 * np.degrees(y * np.sin(2 * longitude) -
+                                      2 * eccentricity * np.sin(anomaly) +
+                                      4 * eccentricity * y * np.sin(anomaly) * np.cos(2 * longitude) -
+                                      0.5 * y ** 2 * np.sin(4 * longitude) -
+                                      1.25 * eccentricity ** 2 * np.sin(2 * anomaly))
+
+    return declination, equation_of_time
+
+
+def compute_sunrise_sunset(dates, latitude, longitude, timezone='UTC'):
+    """
+    This method computes the sunrise and the sunset of a vector of dates in one call, without any network access. The
+    latitude and longitude are either scalars or arrays with one value per date, so that many installations can be
+    handled together.
+
+    :param dates:     the (local) dates under examination
+    :param latitude:  the latitude of the location(s) in degrees
+    :param longitude: the longitude of the location(s) in degrees (negative towards the west)
+    :param timezone:  the timezone in which the sunrise and sunset are returned
+
+    :return:          two timezone-aware DatetimeIndex objects with the sunrise and the sunset of each date (or
+                      location). Days without a sunrise or a sunset (polar day or night) are NaT.
+    """
+
+    # Midnight (UTC) of each date as nanoseconds since the unix epoch
+    midnights = pd.DatetimeIndex(pd.to_datetime(dates)).tz_localize(None).normalize().as_unit('ns').asi8
+
+    # Broadcast the dates and the coordinates against each other
+    midnights, latitude, longitude = np.broadcast_arrays(midnights,
+                                                         np.asarray(latitude, dtype=float),
+                                                         np.asarray(longitude, dtype=float))
+
+    # Approximate the local solar noon of each date to evaluate the position of the sun
+    julian_day = UNIX_EPOCH_JULIAN_DAY + midnights / 86400e9 + 0.5 - longitude / 360.0
+    declination, equation_of_time = _sun_declination_and_equation_of_time(_julian_centuries(julian_day))
+
+    # Hour angle of the sunrise (in degrees)
+    latitude_radians = np.radians(latitude)
+    declination_radians = np.radians(declination)
+    with np.errstate(invalid='ignore'):
+        hour_angle = np.degrees(np.arccos(np.cos(np.radians(SUNRISE_ZENITH)) /
+                                          (np.cos(latitude_radians) * np.cos(declination_radians)) -
+                                          np.tan(latitude_radians) * np.tan(declination_radians)))
+
+    # Solar noon, sunrise and sunset in minutes after midnight UTC
+    solar_noon = 720.0 - 4.0 * longitude - equation_of_time
+    sunrise_minutes = solar_noon - 4.0 * hour_angle
+    sunset_minutes = solar_noon + 4.0 * hour_angle
+
+    # Convert the minutes to timestamps rounded to the second
+    sunrise = _minutes_to_datetime_index(midnights, sunrise_minutes, timezone)
+    sunset = _minutes_to_datetime_index(midnights, sunset_minutes, timezone)
+
+    return sunrise, sunset
+
+
+def _minutes_to_datetime_index(midnights, minutes, timezone):
+    """
+    This method converts minutes after midnight UTC to a timezone-aware DatetimeIndex.
+
+    :param midnights: the midnights (UTC) as nanoseconds since the unix epoch
+    :param minutes:   the minutes after midnight as a numpy array (NaN for missing values)
+    :param timezone:  the timezone of the result
+
+    :return:          the timezone-aware DatetimeIndex
+    """
+    nanoseconds = midnights + np.round(np.nan_to_num(minutes) * 60.0).astype('int64') * 1_000_000_000
+    index = pd.DatetimeIndex(nanoseconds.astype('datetime64[ns]'), tz='UTC')
+    return index.where(~np.isnan(minutes)).tz_convert(timezone)
+
+
+def compute_solar_elevation(times, latitude, longitude):
+    """
+    This method computes the elevation of the sun above the horizon for a vector of timestamps.
+
+    :param times:     the timestamps under examination (naive timestamps are considered UTC)
+    :param latitude:  the latitude of the location(s) in degrees
+    :param longitude: the longitude of the location(s) in degrees (negative towards the west)
+
+    :return:          the solar elevation (in degrees) as a numpy array, without refraction correction
+    """
+
+    # Convert the timestamps to UTC nanoseconds since the unix epoch
+    times = pd.DatetimeIndex(pd.to_datetime(times))
+    if times.tz is not None:
+        times = times.tz_convert('UTC').tz_localize(None)
+    nanoseconds = times.as_unit('ns').asi8
+
+    # Position of the sun
+    julian_day = UNIX_EPOCH_JULIAN_DAY + nanoseconds / 86400e9
+    declination, equation_of_time = _sun_declination_and_equation_of_time(_julian_centuries(julian_day))
+
+    # True solar time (in minutes) and hour angle (in degrees)
+    minutes = (nanoseconds % 86_400_000_000_000) / 60e9
+    true_solar_time = np.mod(minutes + equation_of_time + 4.0 * np.asarray(longitude, dtype=float), 1440.0)
+    hour_angle = true_solar_time / 4.0 - 180.0
+
+    # Solar zenith and elevation
+    latitude_radians = np.radians(np.asarray(latitude, dtype=float))
+    declination_radians = np.radians(declination)
+    cos_zenith = (np.sin(latitude_radians) * np.sin(declination_radians) +
+                  np.cos(latitude_radians) * np.cos(declination_radians) * np.cos(np.radians(hour_angle)))
+
+    return 90.0 - np.degrees(np.arccos(np.clip(cos_zenith, -1.0, 1.0)))
@@ -0,0 +1,402 @@
+import argparse
+import asyncio
+import sys
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from useful_methods import DEFAULT_TIMEZONE
+from sanitization import SIGNAL_RULES
+from sunrise_sunset_cache import SunriseSunsetCache
+
+# Nanoseconds of an hour
+HOUR = 3600 * 10 ** 9
+
+# Maximum number of readings that are held back until the next non-zero value of their day
+PENDING_LIMIT = 240
+
+
+def sanitize_value(value, fill_value=0.0, lower=None, lower_replacement=0.0, upper=None, upper_replacement=0.0):
+    """
+    This method sanitizes one reading with the same rules and the same float32 precision as sanitize_column.
+
+    :param value:             the reading under examination
+    :param fill_value:        the value of the missing (or non-numeric) readings
+    :param lower:             the readings below this value are replaced by lower_replacement (None for no limit)
+    :param lower_replacement: the replacement of the readings below the lower limit
+    :param upper:             the readings equal to or above this value are replaced by upper_replacement (None for no
+                              limit)
+    :param upper_replacement: the replacement of the readings above the upper limit
+
+    :return:                  the sanitized reading
+    """
+    try:
+        value = float(np.float32(value))
+    except (TypeError, ValueError):
+        value = np.nan
+
+    if value != value:
+        value = float(np.float32(fill_value))
+    if lower is not None and value < lower:
+        value = float(np.float32(lower_replacement))
+    if upper is not None and value >= upper:
+        value = float(np.float32(upper_replacement))
+
+    return value
+
+
+class StreamingCleaner:
+    """
+    This class is the streaming counterpart of the cleaning chain of the solar readings (timezone handling,
+    sanitization, zeroing of the night and correction of the daylight zeros). The readings are pushed one at a time
+    and the cleaned readings are returned as soon as they are final: a daylight zero is corrected with the mean of the
+    previous and the next non-zero value of its day, so it is held back until the next non-zero reading arrives, the
+    sun sets or its day ends. The latest reading is also held back until a later minute arrives, so that a repeated
+    minute replaces it (the last reading of a minute wins, as in the batch cleaning).
+
+    Each reading is processed in constant time and at most max_pending readings are held back: when the buffer is
+    full, its oldest daylight zero is released with the value it gets when its day has no next non-zero value. On a
+    sorted replay of a raw file whose daylight zero gaps are shorter than max_pending readings the results are the
+    same as those of the batch cleaning.
+    """
+
+    def __init__(self, timezone, sun_times_cache=None, latitude=None, longitude=None, max_pending=PENDING_LIMIT):
+        """
+        :param timezone:        the timezone of the installation
+        :param sun_times_cache: the sunrise/sunset cache (None for a cache in memory)
+        :param latitude:        the latitude of the installation (defaults to the reference city of the timezone)
+        :param longitude:       the longitude of the installation (defaults to the reference city of the timezone)
+        :param max_pending:     the maximum number of readings that are held back
+        """
+        self.timezone = timezone
+        self.sun_times_cache = SunriseSunsetCache() if sun_times_cache is None else sun_times_cache
+        self.latitude = latitude
+        self.longitude = longitude
+        self.max_pending = max(max_pending, 1)
+
+        # Latest raw reading (timestamp, solar, mains), kept until a later minute arrives
+        self._latest = None
+
+        # Last localized hour of the raw timestamps and whether it exists in the default timezone
+        self._hour = None
+        self._hour_start = None
+        self._hour_exists = True
+
+        # Local day under examination and its sunrise and sunset
+        self._day = None
+        self._sunrise = None
+        self._sunset = None
+
+        # Last non-zero solar value of the day and number of daylight zeros since then
+        self._previous = None
+        self._chain = 0
+
+        # Readings held back until the next non-zero value: [timestamp, solar, mains, order of the daylight zero]
+        self._pending = deque()
+
+    def localize(self, timestamp):
+        """
+        This method moves a raw timestamp to the timezone of the installation, as handle_timezones does. The clocks
+        change on the hour, so the start of the hour of the reading is localized once and the minutes of the same hour
+        are offsets from it.
+
+        :param timestamp: the naive raw timestamp
+
+        :return:          the timezone-aware timestamp, or None if the hour does not exist (when the clocks go forward)
+        """
+        hour, offset = divmod(timestamp.value, HOUR)
+        if hour != self._hour:
+            self._hour = hour
+            raw_hour = pd.Timestamp(hour * HOUR, unit='ns')
+            hour_start = raw_hour.tz_localize(DEFAULT_TIMEZONE, ambiguous=False, nonexistent=pd.Timedelta(hours=1))
+            self._hour_exists = hour_start.tz_localize(None) == raw_hour
+            self._hour_start = hour_start.tz_convert(self.timezone)
+        if not self._hour_exists:
+            return None
+        return self._hour_start + pd.Timedelta(offset, unit='ns')
+
+    def _start_day(self, day):
+        """
+        This method closes the day under examination and looks up the sunrise and the sunset of the next one.
+
+        :param day: the new local day
+
+        :return:    the readings of the previous day that were held back
+        """
+        released = self._release(None)
+
+        self._day = day
+        self._sunrise, self._sunset = self.sun_times_cache.get(pd.Timestamp(day), self.timezone, self.latitude,
+                                                               self.longitude)
+        self._previous = None
+        self._chain = 0
+
+        return released
+
+    def _correct(self, solar, order, next_value):
+        """
+        This method corrects a daylight zero as the batch cleaning does: the k-th zero between two non-zero values is
+        next + (previous - next) / 2^k.
+
+        :param solar:      the held back solar value
+        :param order:      the order of the daylight zero since the previous non-zero value (None for other values)
+        :param next_value: the next non-zero value of the day (None if there is none)
+
+        :return:           the corrected value
+        """
+        if order is None:
+            return solar
+        if self._previous is not None and next_value is not None:
+            return next_value + np.ldexp(self._previous - next_value, -order)
+        if self._previous is not None:
+            return self._previous
+        if next_value is not None:
+            return next_value
+        return 0.0
+
+    def _release(self, next_value):
+        """
+        This method corrects the daylight zeros that are held back and releases the held back readings.
+
+        :param next_value: the next non-zero value of the day (None at the end of the day)
+
+        :return:           the released readings as (timestamp, solar, mains) tuples
+        """
+        released = []
+        while self._pending:
+            timestamp, solar, mains, order = self._pending.popleft()
+            released.append((timestamp, float(self._correct(solar, order, next_value)), mains))
+
+        return released
+
+    def push(self, timestamp, solar, mains=None):
+        """
+        This method cleans one reading. The reading is held back until a reading of a later minute arrives, and the
+        readings that arrive out of order are dropped.
+
+        :param timestamp: the raw timestamp of the reading (naive, in the default timezone of the dataset, or
+                          timezone-aware, in which case it is converted to the clock of the raw files)
+        :param solar:     the SOLAR reading
+        :param mains:     the MAINS reading (None if it is not measured)
+
+        :return:          the list of the readings that became final, as (timestamp, solar, mains) tuples
+        """
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert(DEFAULT_TIMEZONE).tz_localize(None)
+
+        # Replace the latest reading when its minute is repeated and drop the readings that are before it
+        if self._latest is not None and timestamp <= self._latest[0]:
+            if timestamp == self._latest[0]:
+                self._latest = (timestamp, solar, mains)
+            return []
+
+        # Clean the previous reading, which is final now that a later minute arrived
+        latest, self._latest = self._latest, (timestamp, solar, mains)
+        return [] if latest is None else self._clean(*latest)
+
+    def _clean(self, timestamp, solar, mains):
+        """
+        This method cleans one final reading.
+
+        :param timestamp: the naive raw timestamp of the reading
+        :param solar:     the SOLAR reading
+        :param mains:     the MAINS reading (None if it is not measured)
+
+        :return:          the list of the readings that became final, as (timestamp, solar, mains) tuples
+        """
+
+        # Handle the timezone of the reading and start a new day if needed. The readings of the hour that does not
+        # exist are dropped, because the batch cleaning keeps the readings of the next hour, which share their minutes
+        local = self.localize(timestamp)
+        if local is None:
+            return []
+        released = self._start_day(local.date()) if local.date() != self._day else []
+
+        # Sanitize the readings
+        solar = sanitize_value(solar, **SIGNAL_RULES['SOLAR'])
+        if mains is not None:
+            mains = sanitize_value(mains, **SIGNAL_RULES['MAINS'])
+
+        # Zero out the values before sunrise and after sunset. After the sunset no value of the day can be non-zero,
+        # so the daylight zeros that are held back are final
+        daylight = False
+        if self._sunrise is not None:
+            daylight = self._sunrise <= local <= self._sunset
+            if not daylight:
+                solar = 0.0
+                if local > self._sunset:
+                    released += self._release(None)
+
+        # Release the held back readings when a non-zero value arrives
+        if solar != 0:
+            self._pending.append([local, solar, mains, None])
+            released += self._release(solar)
+            self._previous = solar
+            self._chain = 0
+
+        # Hold back the daylight zeros (and the readings after them) until the next non-zero value
+        elif daylight:
+            self._chain += 1
+            self._pending.append([local, solar, mains, self._chain])
+        elif self._pending:
+            self._pending.append([local, solar, mains, None])
+        else:
+            released.append((local, solar, mains))
+
+        # Release the oldest held back reading when the buffer is full
+        if len(self._pending) > self.max_pending:
+            timestamp, solar, mains, order = self._pending.popleft()
+            released.append((timestamp, float(self._correct(solar, order, None)), mains))
+
+        return released
+
+    def flush(self):
+        """
+        This method releases the readings that are held back, as at the end of their day.
+
+        :return: the released readings as (timestamp, solar, mains) tuples
+        """
+        latest, self._latest = self._latest, None
+        released = [] if latest is None else self._clean(*latest)
+        return released + self._release(None)
+
+
+async def read_replay(path, mains_path=None, speed=None):
+    """
+    This method replays the readings of a raw solar file, joined with the readings of the mains file of the same
+    period when it is given.
+
+    :param path:       the path of the solar file
+    :param mains_path: the path of the mains file (None to replay only the SOLAR readings)
+    :param speed:      the speed of the replay relative to real time (None to replay as fast as possible)
+
+    :return:           an asynchronous iterator of (timestamp, values) tuples
+    """
+    # Import the parquet reader here, so that the cleaner of a socket stream does not load pyarrow
+    from parquet_reader import read_frame
+
+    data = read_frame(path, ['SOLAR'])
+
+    # Align the MAINS readings on the raw minutes with one join, keeping the last reading of a minute that appears
+    # twice (the minutes that are missing from a file become NaN, as in the batch cleaning)
+    if mains_path is not None:
+        mains = read_frame(mains_path, ['MAINS'])
+        data = data[~data.index.duplicated(keep='last')].join(mains[~mains.index.duplicated(keep='last')],
+                                                              how='outer')
+
+    data = data.sort_index(kind='stable')
+    previous = None
+    for timestamp, values in zip(data.index, data.itertuples(index=False, name=None)):
+        if speed is not None and previous is not None:
+            await asyncio.sleep((timestamp - previous).total_seconds() / speed)
+        else:
+            await asyncio.sleep(0)
+        previous = timestamp
+        yield timestamp, values
+
+
+async def read_socket(address, stats=None):
+    """
+    This method reads the readings that are sent to a local socket, one per line as
+    'timestamp,value[,value...]'. The malformed lines are skipped, so that one bad line does not stop the stream.
+
+    :param address: 'host:port' for a TCP socket or the path of a Unix socket
+    :param stats:   a dictionary where the number of skipped lines is added as 'malformed_lines' (None to skip the
+                    count)
+
+    :return:        an asynchronous iterator of (timestamp, values) tuples
+    """
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+    else:
+        reader, writer = await asyncio.open_unix_connection(address)
+
+    try:
+        async for line in reader:
+            fields = line.decode(errors='replace').strip().split(',')
+            if len(fields) < 2:
+                continue
+
+            # Parse the reading, skipping the lines whose timestamp or values are not valid
+            try:
+                timestamp = pd.Timestamp(fields[0])
+                values = tuple(float(field) if field else np.nan for field in fields[1:])
+            except ValueError:
+                timestamp = pd.NaT
+            if timestamp is pd.NaT:
+                if stats is not None:
+                    stats['malformed_lines'] = stats.get('malformed_lines', 0) + 1
+                continue
+
+            yield timestamp, values
+    finally:
+        writer.close()
+
+
+async def clean_stream(readings, cleaner):
+    """
+    This method cleans a stream of readings.
+
+    :param readings: an asynchronous iterator of (timestamp, values) tuples, with the SOLAR and optionally the MAINS
+                     reading as values
+    :param cleaner:  the streaming cleaner of the installation
+
+    :return:         an asynchronous iterator of the cleaned (timestamp, solar, mains) tuples
+    """
+    async for timestamp, values in readings:
+        for record in cleaner.push(timestamp, *values[:2]):
+            yield record
+
+    for record in cleaner.flush():
+        yield record
+
+
+async def run(source, timezone, mains_path=None, latitude=None, longitude=None):
+    """
+    This method cleans the readings of a replay file or a socket and prints them.
+
+    :param source:     the path of a replay file, or 'host:port' / the path of a Unix socket
+    :param timezone:   the timezone of the installation
+    :param mains_path: the path of the mains file that is replayed along with the solar file (None for no mains)
+    :param latitude:   the latitude of the installation (defaults to the reference city of the timezone)
+    :param longitude:  the longitude of the installation (defaults to the reference city of the timezone)
+    """
+    stats = {}
+    readings = read_replay(source, mains_path) if source.endswith('.parquet') else read_socket(source, stats)
+    cleaner = StreamingCleaner(timezone, latitude=latitude, longitude=longitude)
+    async for timestamp, solar, mains in clean_stream(readings, cleaner):
+        print(f'{timestamp.isoformat()},{solar:.6f}' + ('' if mains is None else f',{mains:.6f}'))
+
+    # Report the lines of the socket that were skipped
+    if stats.get('malformed_lines'):
+        print(f"Skipped {stats['malformed_lines']} malformed lines", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean a stream of minute readings of an installation.')
+    parser.add_argument('source', help='a raw parquet file to replay, host:port or the path of a Unix socket')
+    parser.add_argument('--timezone', default=DEFAULT_TIMEZONE, help='timezone of the installation')
+    parser.add_argument('--installation', help='read the timezone and the location of this installation from the '
+                                               'metadata store instead')
+    parser.add_argument('--mains-file', help='the raw mains file of the same period, to replay its MAINS readings '
+                                             'along with the SOLAR ones')
+    args = parser.parse_args()
+
+    # Look up the timezone and the location of the installation
+    timezone, latitude, longitude = args.timezone, None, None
+    if args.installation is not None:
+        from installation_metadata import load_metadata
+
+        metadata = load_metadata()
+        timezone = metadata.get_timezone(args.installation)
+        latitude, longitude = metadata.get_location(args.installation)
+        metadata.close()
+
+    asyncio.run(run(args.source, timezone, args.mains_file, latitude, longitude))
+
+
+if __name__ == '__main__':
+    main()
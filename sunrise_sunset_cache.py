@@ -0,0 +1,207 @@
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from useful_methods import get_sunrise_sunset_series, get_timezone_coordinates
+
+# Maximum number of sunrise/sunset entries that are kept in memory
+DEFAULT_MAX_SIZE = 65536
+
+# Maximum number of parameters of a single SQLite query
+SQLITE_BATCH_SIZE = 500
+
+
+class SunriseSunsetCache:
+    """
+    This class is a cache in front of the sunrise/sunset computation. The entries are keyed by (date, latitude,
+    longitude, timezone) and are kept in memory with LRU eviction and, optionally, persisted in an SQLite file so that
+    reruns of the preprocessing do not compute the same days again. The hits and misses are counted, so that it can be
+    confirmed that a warm rerun makes zero lookups.
+    """
+
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param path:     the path of the SQLite file (None to keep the cache only in memory)
+        :param max_size: the maximum number of entries that are kept in memory
+        """
+        self.max_size = max_size
+        self._memory = OrderedDict()
+
+        # Counters of the lookups
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # Open (or create) the SQLite file
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, timeout=60)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS sun_times ('
+                                     'date TEXT, latitude REAL, longitude REAL, timezone TEXT, '
+                                     'sunrise INTEGER, sunset INTEGER, '
+                                     'PRIMARY KEY (date, latitude, longitude, timezone)) WITHOUT ROWID')
+            self._connection.commit()
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def stats(self):
+        """
+        This method returns the counters of the cache.
+
+        :return: a dictionary with the memory hits, the disk hits, the misses and the number of entries in memory
+        """
+        return {'memory_hits': self.memory_hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'entries': len(self._memory)}
+
+    def get(self, date, timezone_str, latitude=None, longitude=None):
+        """
+        This method returns the sunrise and the sunset of one day, as get_sunrise_sunset does.
+
+        :param date:         the date under examination
+        :param timezone_str: the timezone of the installation
+        :param latitude:     the latitude of the installation (defaults to the reference city of the timezone)
+        :param longitude:    the longitude of the installation (defaults to the reference city of the timezone)
+
+        :return:             the sunrise and the sunset, or None, None if the sun does not rise or set
+        """
+        sunrise, sunset = self.get_series([date], timezone_str, latitude, longitude).iloc[0]
+
+        if pd.isnull(sunrise) or pd.isnull(sunset):
+            return None, None
+
+        return sunrise, sunset
+
+    def get_series(self, dates, timezone_str, latitude=None, longitude=None):
+        """
+        This method returns the sunrise and the sunset of many days, looking them up first in memory, then on disk,
+        and computing only the remaining days in one call.
+
+        :param dates:        the dates under examination
+        :param timezone_str: the timezone of the installation
+        :param latitude:     the latitude of the installation (defaults to the reference city of the timezone)
+        :param longitude:    the longitude of the installation (defaults to the reference city of the timezone)
+
+        :return:             a dataframe indexed by date with the 'sunrise' and 'sunset' columns
+        """
+
+        # Use the reference city of the timezone when the location is unknown
+        if latitude is None or longitude is None:
+            latitude, longitude = get_timezone_coordinates(timezone_str)
+        location = (round(float(latitude), 4), round(float(longitude), 4), timezone_str)
+
+        # Build the keys of the dates
+        dates = list(dates)
+        days = [pd.Timestamp(date).date().isoformat() for date in dates]
+
+        # Look up the days in memory
+        seconds = {}
+        missing = []
+        for day in dict.fromkeys(days):
+            key = (day,) + location
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                seconds[day] = self._memory[key]
+                self.memory_hits += 1
+            else:
+                missing.append(day)
+
+        # Look up the remaining days on disk
+        if missing and self._connection is not None:
+            found = self._read_from_disk(missing, location)
+            self.disk_hits += len(found)
+            seconds.update(found)
+            for day, value in found.items():
+                self._remember((day,) + location, value)
+            missing = [day for day in missing if day not in found]
+
+        # Compute the days that were not found
+        if missing:
+            computed = self._compute(missing, location)
+            self.misses += len(computed)
+            seconds.update(computed)
+            for day, value in computed.items():
+                self._remember((day,) + location, value)
+            self._write_to_disk(computed, location)
+
+        # Convert the epoch seconds to timestamps in the timezone of the installation
+        values = np.array([seconds[day] for day in days], dtype=float).reshape(-1, 2)
+        sunrise = pd.to_datetime(values[:, 0], unit='s', utc=True).tz_convert(timezone_str)
+        sunset = pd.to_datetime(values[:, 1], unit='s', utc=True).tz_convert(timezone_str)
+
+        return pd.DataFrame({'sunrise': sunrise, 'sunset': sunset}, index=dates)
+
+    def close(self):
+        """
+        This method closes the SQLite file of the cache.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _remember(self, key, value):
+        """
+        This method stores an entry in memory and evicts the least recently used entries.
+
+        :param key:   the key of the entry
+        :param value: the sunrise and the sunset as epoch seconds
+        """
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    @staticmethod
+    def _compute(days, location):
+        """
+        This method computes the sunrise and the sunset of the days that are not cached.
+
+        :param days:     the days as ISO strings
+        :param location: the latitude, the longitude and the timezone
+
+        :return:         a dictionary mapping each day to its sunrise and sunset as epoch seconds (None for NaT)
+        """
+        latitude, longitude, timezone_str = location
+        times = get_sunrise_sunset_series(pd.to_datetime(days), timezone_str, latitude, longitude)
+
+        computed = {}
+        for day, sunrise, sunset in zip(days, times['sunrise'], times['sunset']):
+            computed[day] = (None if pd.isnull(sunrise) else sunrise.value // 1_000_000_000,
+                             None if pd.isnull(sunset) else sunset.value // 1_000_000_000)
+        return computed
+
+    def _read_from_disk(self, days, location):
+        """
+        This method reads the cached days of a location from the SQLite file.
+
+        :param days:     the days as ISO strings
+        :param location: the latitude, the longitude and the timezone
+
+        :return:         a dictionary mapping each found day to its sunrise and sunset as epoch seconds
+        """
+        found = {}
+        for start in range(0, len(days), SQLITE_BATCH_SIZE):
+            batch = days[start:start + SQLITE_BATCH_SIZE]
+            query = ('SELECT date, sunrise, sunset FROM sun_times '
+                     'WHERE latitude = ? AND longitude = ? AND timezone = ? '
+                     f'AND date IN ({", ".join("?" * len(batch))})')
+            for day, sunrise, sunset in self._connection.execute(query, location + tuple(batch)):
+                found[day] = (sunrise, sunset)
+        return found
+
+    def _write_to_disk(self, computed, location):
+        """
+        This method stores the computed days of a location in the SQLite file.
+
+        :param computed: a dictionary mapping each day to its sunrise and sunset as epoch seconds
+        :param location: the latitude, the longitude and the timezone
+        """
+        if self._connection is None:
+            return
+
+        self._connection.executemany('INSERT OR REPLACE INTO sun_times VALUES (?, ?, ?, ?, ?, ?)',
+                                     [(day,) + location + value for day, value in computed.items()])
+        self._connection.commit()
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from useful_methods import correct_solar_zeros_between_sunrise_sunset
+
+# Timezone of the generated frames
+TIMEZONE = 'America/Chicago'
+
+
+def correct_solar_zeros_reference(data, sunrise, sunset):
+    """
+    This method is the loop implementation of correct_solar_zeros_between_sunrise_sunset that was replaced by the
+    vectorized one, kept as the reference of its behavior. It corrects the zeros of one day.
+
+    :param data:    the data of one day with a 'SOLAR' column
+    :param sunrise: the sunrise of the day
+    :param sunset:  the sunset of the day
+
+    :return:        the corrected data
+    """
+    # Create a mask for the time range between sunrise and sunset
+    mask = (data.index >= sunrise) & (data.index <= sunset)
+
+    # Get the indices of rows with zero 'SOLAR' values within the mask
+    zero_indices = data.loc[mask & (data['SOLAR'] == 0)].index
+
+    for idx in zero_indices:
+        # Get the previous non-zero value
+        prev_val = data.loc[:idx, 'SOLAR'].replace(0, pd.NA).dropna().iloc[-1] \
+            if not data.loc[:idx, 'SOLAR'].replace(0, pd.NA).dropna().empty else 0
+
+        # Get the next non-zero value
+        next_val = data.loc[idx:, 'SOLAR'].replace(0, pd.NA).dropna().iloc[0] \
+            if not data.loc[idx:, 'SOLAR'].replace(0, pd.NA).dropna().empty else 0
+
+        # Replace the zero value with the mean of the previous and next values
+        data.at[idx, 'SOLAR'] = (prev_val + next_val) / 2 if prev_val and next_val else prev_val or next_val
+
+    return data
+
+
+def make_day(rng, day, minutes=1440):
+    """
+    This method generates one day of solar values with runs of zeros (also at the edges of the day) and NaN values,
+    and a random sunrise and sunset.
+
+    :param rng:     the random generator
+    :param day:     the date of the day
+    :param minutes: the number of minutes of the day
+
+    :return:        the data of the day, its sunrise and its sunset
+    """
+    index = pd.date_range(pd.Timestamp(day, tz=TIMEZONE), periods=minutes, freq='min', name='localminute')
+    values = rng.uniform(0.1, 5, minutes)
+
+    # Add runs of zeros, starting at random minutes and at the first and the last minute of the day
+    starts = np.r_[rng.integers(0, minutes, rng.integers(0, 30)), 0, minutes - rng.integers(1, 20)]
+    for start in starts:
+        values[start:start + rng.integers(1, 60)] = 0
+
+    # Add NaN values
+    values[rng.random(minutes) < 0.02] = np.nan
+
+    # Leave some days without any non-zero value
+    if rng.random() < 0.05:
+        values[:] = 0
+
+    sunrise = index[0] + pd.Timedelta(minutes=int(rng.integers(0, minutes // 2)))
+    sunset = sunrise + pd.Timedelta(minutes=int(rng.integers(0, minutes // 2)))
+    return pd.DataFrame({'SOLAR': values}, index=index), sunrise, sunset
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_day_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    data, sunrise, sunset = make_day(rng, '2024-06-01', minutes=int(rng.integers(60, 1441)))
+
+    expected = correct_solar_zeros_reference(data.copy(), sunrise, sunset)
+    result = correct_solar_zeros_between_sunrise_sunset(data.copy(), sunrise, sunset)
+
+    np.testing.assert_allclose(result['SOLAR'].to_numpy(), expected['SOLAR'].to_numpy(dtype=float), rtol=1e-12)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_months_match_reference(seed):
+    rng = np.random.default_rng(seed)
+
+    # Generate the days of the weeks when the clocks change in March and November and the first day of each month in
+    # between (the reference corrects the zeros one by one, which would be too slow on every day of the months)
+    dates = pd.date_range('2024-03-03', '2024-03-17').union(pd.date_range('2024-04-01', '2024-10-01', freq='MS'))
+    dates = dates.union(pd.date_range('2024-10-27', '2024-11-10'))
+    days = [make_day(rng, day) for day in dates.date]
+    data = pd.concat([day for day, _, _ in days])
+    data = data[~data.index.duplicated()]
+
+    # Correct each day with the reference and the whole frame at once with the sunrise and sunset of each row
+    row_dates = data.index.date
+    expected = pd.concat([correct_solar_zeros_reference(data[row_dates == day.index[0].date()].copy(), sunrise, sunset)
+                          for day, sunrise, sunset in days])
+    sun_times = pd.DataFrame({'sunrise': [sunrise for _, sunrise, _ in days],
+                              'sunset': [sunset for _, _, sunset in days]},
+                             index=[day.index[0].date() for day, _, _ in days])
+    sunrise = sun_times['sunrise'].reindex(row_dates).to_numpy()
+    sunset = sun_times['sunset'].reindex(row_dates).to_numpy()
+    result = correct_solar_zeros_between_sunrise_sunset(data.copy(), pd.DatetimeIndex(sunrise),
+                                                        pd.DatetimeIndex(sunset))
+
+    np.testing.assert_allclose(result['SOLAR'].to_numpy(), expected['SOLAR'].to_numpy(dtype=float), rtol=1e-12)
@@ -0,0 +1,54 @@
+import os
+
+import pandas as pd
+
+from dataset_catalog import load_catalog
+
+
+def write_file(path, value):
+    """
+    This method writes a small solar file.
+
+    :param path:  the path of the file
+    :param value: the solar value of its readings
+    """
+    index = pd.date_range('2024-03-01', periods=10, freq='min', name='localminute')
+    pd.DataFrame({'SOLAR': [value] * 10}, index=index).to_parquet(path)
+
+
+def test_refresh_with_empty_directory(tmp_path):
+    root = tmp_path / 'dataset'
+    os.makedirs(root / 'installation1')
+    os.makedirs(root / 'installation2')
+    write_file(root / 'installation1' / 'installation1_SOLAR_20240301_20240331.parquet', 1.0)
+    path = str(tmp_path / 'catalog.parquet')
+
+    # Build the catalog and refresh it twice, with an installation directory that has no files
+    first = load_catalog(path, str(root))
+    second = load_catalog(path, str(root))
+    third = load_catalog(path, str(root))
+
+    assert first['path'].notna().sum() == 1
+    assert 'installation2' in second.index.get_level_values('installation')
+    pd.testing.assert_frame_equal(second, third)
+
+
+def test_refresh_with_file_overwritten_in_place(tmp_path):
+    root = tmp_path / 'dataset'
+    os.makedirs(root / 'installation1')
+    file = root / 'installation1' / 'installation1_SOLAR_20240301_20240331.parquet'
+    write_file(file, 1.0)
+    path = str(tmp_path / 'catalog.parquet')
+    load_catalog(path, str(root))
+
+    # Overwrite the file in place, which does not change the modification time of its directory
+    directory_mtime = os.stat(file.parent).st_mtime
+    with open(file, 'r+b') as stream:
+        stream.truncate(0)
+        pd.DataFrame({'SOLAR': [2.0] * 1000}).to_parquet(stream)
+    os.utime(file, (0, 12345.0))
+    os.utime(file.parent, (0, directory_mtime))
+
+    catalog = load_catalog(path, str(root))
+    assert catalog['mtime'].iloc[0] == 12345.0
+    assert catalog['size'].iloc[0] == os.stat(file).st_size
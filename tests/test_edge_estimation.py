@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import cleaned_dataset
+import edge_estimation
+from benchmarks.synthetic_data import write_fleet
+from capacity_estimation import SketchStore, estimate_capacity
+from dataset_catalog import build_catalog
+
+
+@pytest.fixture
+def fleet(tmp_path, monkeypatch):
+    """
+    This fixture writes one month of synthetic solar and mains files of two installations, estimates their capacities
+    as the batch does, and serves their solar values as the cleaned data that the edge models are built from.
+
+    :param tmp_path:    the temporary directory of the test
+    :param monkeypatch: the pytest monkeypatch fixture
+
+    :return:            the directory of the raw files and a dictionary mapping each installation to its capacity
+    """
+    root = str(tmp_path / 'raw')
+    installations = write_fleet(root, installations=2, months=('2024-06',), timezones=['America/Chicago'],
+                                mains=True, seed=1).installation
+
+    # Estimate the capacities from the sketches of the raw files
+    store = SketchStore(str(tmp_path / 'sketches.sqlite'))
+    catalog = build_catalog(root)
+    capacities = {installation: estimate_capacity(catalog, installation, store, years=(2024,))[0]
+                  for installation in installations}
+    store.close()
+
+    # Serve the solar values of the raw files, without the missing and the negative values, as the cleaned data
+    def read_cleaned_data(installations, columns=None):
+        installation = installations[0]
+        solar = pd.read_parquet(f'{root}/{installation}/{installation}_SOLAR_20240601_20240630.parquet')
+        return solar.clip(lower=0).fillna(0)
+
+    monkeypatch.setattr(cleaned_dataset, 'read_cleaned_data', read_cleaned_data)
+
+    return root, capacities
+
+
+def test_edge_estimates_match_batch_capacity(fleet):
+    root, capacities = fleet
+    table = pd.DataFrame({'installation_id': list(capacities), 'capacity': list(capacities.values()), 'cluster': 0})
+    model = edge_estimation.build_cluster_models(table)[0]
+
+    # The capacity of the cluster is the one of its installations in the batch estimate
+    assert model.capacity == pytest.approx(np.median(list(capacities.values())))
+
+    for installation, capacity in capacities.items():
+        solar = cleaned_dataset.read_cleaned_data([installation])['SOLAR'].to_numpy()
+        mains = pd.read_parquet(f'{root}/{installation}/{installation}_20240601_20240630_IDD.parquet')['MAINS']
+
+        # Estimate the production from the stream of mains readings with the batch capacity of the installation
+        estimator = edge_estimation.SolarEstimator(model, capacity=capacity)
+        estimates = np.array([estimator.update(timestamp, float(reading))[0]
+                              for timestamp, reading in zip(mains.index, mains.to_numpy())])
+
+        # The estimates stay within the clearness limit of the capacity and, once the estimator has converged, follow
+        # the measured production of the last week
+        assert estimates.max() <= estimator.max_clearness * capacity
+        last_week = slice(-7 * edge_estimation.MINUTES_PER_DAY, None)
+        assert estimates[last_week].sum() / solar[last_week].sum() == pytest.approx(1.0, abs=0.2)
+        assert np.abs(estimates[last_week] - solar[last_week]).mean() < 0.1 * capacity
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+import fleet_batch
+
+
+def test_read_matrix_keeps_last_reading_and_counts_dropped(tmp_path):
+    # A file with one day of readings, two readings before and after the day, and three minutes repeated with
+    # other values at the end of the file
+    index = pd.date_range('2024-03-10', periods=1440, freq='min', name='localminute')
+    data = pd.DataFrame({'SOLAR': np.arange(1440, dtype=float)}, index=index)
+    outside = pd.DataFrame({'SOLAR': [-1.0, -2.0]},
+                           index=pd.DatetimeIndex(['2024-03-09 23:59', '2024-03-11 00:00'], name='localminute'))
+    repeated = pd.DataFrame({'SOLAR': [5000.0, 5001.0, 5002.0]}, index=index[[10, 10, 700]])
+    path = str(tmp_path / 'solar.parquet')
+    pd.concat([outside.iloc[:1], data, outside.iloc[1:], repeated]).to_parquet(path)
+
+    _, columns = fleet_batch.build_grid('2024-03-10', '2024-03-10', 'America/Chicago')
+    values, present, dropped, replaced = fleet_batch.read_matrix([path], '2024-03-10', columns)
+
+    assert dropped == 2
+    assert replaced == 3 + 60
+    assert values[0, columns[10]] == 5001.0
+    assert values[0, columns[700]] == 5002.0
+    assert values[0, columns[0]] == 0.0
+
+    # The minutes that the clock skips share the column of the minute they are shifted to, which keeps its own
+    # (later) reading
+    assert values[0, columns[120]] == 180.0
+    assert present.sum() == 1440 - 60
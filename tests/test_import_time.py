@@ -0,0 +1,20 @@
+import pytest
+
+from benchmarks.check_import_time import IMPORT_BUDGETS, measure_import
+
+# Number of cold imports of each module (the best one is compared with the budget)
+REPEATS = 3
+
+
+@pytest.mark.parametrize('module', list(IMPORT_BUDGETS))
+def test_import_within_budget(module):
+    budget, forbidden = IMPORT_BUDGETS[module]
+    measurements = [measure_import(module) for _ in range(REPEATS)]
+
+    # Compare the best of the cold imports with the budget, to leave out the noise of the machine
+    milliseconds = min(milliseconds for milliseconds, _ in measurements)
+    assert milliseconds <= budget, f'{module} imports in {milliseconds:.1f} ms (budget {budget} ms)'
+
+    # Check that none of the heavy modules that the entry point does not need is imported
+    imported = sorted(name for name in forbidden if name in measurements[0][1])
+    assert not imported, f"{module} imports {', '.join(imported)}"
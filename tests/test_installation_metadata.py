@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from installation_metadata import load_metadata
+
+
+def test_blank_timezone_is_unknown(tmp_path):
+    timezones_path = tmp_path / 'timezones.csv'
+    timezones_path.write_text('installationId,timezone\n'
+                              'installation1,America/Denver\n'
+                              'installation2,\n'
+                              'installation3,  \n')
+    metadata = load_metadata(str(tmp_path / 'metadata.sqlite'), str(timezones_path), ())
+
+    # The blank cells are stored as missing values
+    assert metadata.records['installation2']['timezone'] is None
+    assert metadata.get_timezones(['installation1', 'installation2', 'installation3', 'installation4']) == \
+        {'installation1': 'America/Denver'}
+    for installation in ('installation2', 'installation3', 'installation4'):
+        with pytest.raises(KeyError):
+            metadata.get_timezone(installation)
+    metadata.close()
+
+    # The stored values are the same when the store is opened again
+    metadata = load_metadata(str(tmp_path / 'metadata.sqlite'), str(timezones_path), ())
+    assert metadata.get_timezones(['installation2', 'installation3']) == {}
+    metadata.close()
+
+
+def test_modified_timezones_are_imported_again(tmp_path):
+    timezones_path = tmp_path / 'timezones.csv'
+    timezones_path.write_text('installationId,timezone\ninstallation1,America/Denver\n')
+    load_metadata(str(tmp_path / 'metadata.sqlite'), str(timezones_path), ()).close()
+
+    timezones_path.write_text('installationId,timezone\ninstallation1,America/New_York\ninstallation2,UTC\n')
+    os.utime(timezones_path, (0, os.stat(timezones_path).st_mtime + 1))
+    metadata = load_metadata(str(tmp_path / 'metadata.sqlite'), str(timezones_path), ())
+    assert metadata.get_timezones(['installation1', 'installation2']) == {'installation1': 'America/New_York',
+                                                                          'installation2': 'UTC'}
+    metadata.close()
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from parallel_processing import is_output_up_to_date, record_input_state
+
+
+@pytest.fixture
+def output(tmp_path):
+    """
+    This fixture writes two input files and an output directory computed from them.
+
+    :param tmp_path: the temporary directory of the test
+
+    :return:         the path of the output directory and the paths of the input files
+    """
+    inputs = []
+    for name in ['a.parquet', 'b.parquet']:
+        path = str(tmp_path / name)
+        with open(path, 'wb') as file:
+            file.write(b'input')
+        os.utime(path, (1_000_000, 1_000_000))
+        inputs.append(path)
+
+    directory = tmp_path / 'installation=1' / 'month=2024-01'
+    directory.mkdir(parents=True)
+    (directory / 'a-0.parquet').write_bytes(b'output')
+    record_input_state(str(tmp_path / 'installation=1'), inputs)
+
+    return str(tmp_path / 'installation=1'), inputs
+
+
+def test_unchanged_inputs_are_up_to_date(output):
+    output_path, inputs = output
+    assert is_output_up_to_date(output_path, inputs)
+    assert is_output_up_to_date(output_path, inputs[::-1])
+
+
+def test_output_without_recorded_inputs_is_out_of_date(output, tmp_path):
+    output_path, inputs = output
+    os.remove(os.path.join(output_path, '_inputs.json'))
+    assert not is_output_up_to_date(output_path, inputs)
+    assert not is_output_up_to_date(str(tmp_path / 'installation=2'), inputs)
+
+
+def test_removed_input_is_out_of_date(output):
+    output_path, inputs = output
+    assert not is_output_up_to_date(output_path, inputs[:1])
+
+
+def test_added_input_with_older_mtime_is_out_of_date(output, tmp_path):
+    output_path, inputs = output
+    path = str(tmp_path / 'c.parquet')
+    with open(path, 'wb') as file:
+        file.write(b'input')
+    os.utime(path, (1, 1))
+    assert not is_output_up_to_date(output_path, inputs + [path])
+
+
+def test_input_replaced_with_same_mtime_is_out_of_date(output):
+    output_path, inputs = output
+    with open(inputs[0], 'wb') as file:
+        file.write(b'other input')
+    os.utime(inputs[0], (1_000_000, 1_000_000))
+    assert not is_output_up_to_date(output_path, inputs)
@@ -0,0 +1,97 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import preprocessing
+import streaming_cleaning
+from sunrise_sunset_cache import SunriseSunsetCache
+
+
+def make_raw_file(path, start, days, seed):
+    """
+    This method writes a raw solar file with random zeros, zero runs, NaN values and negative values, and with
+    readings of some minutes repeated at the end of the file (unsorted, with other values).
+
+    :param path:  the path of the file
+    :param start: the first day of the file
+    :param days:  the number of days of the file
+    :param seed:  the seed of the random generator
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=days * 1440, freq='min', name='localminute')
+    values = rng.random(len(index)) - 0.05
+    values[rng.random(len(index)) < 0.3] = 0
+    values[rng.random(len(index)) < 0.02] = np.nan
+    values[1440 + 600:1440 + 700] = 0
+    data = pd.DataFrame({'SOLAR': values}, index=index)
+
+    # Repeat some minutes at the end of the file with other values, and the hour that the local clock repeats when
+    # it goes back (the raw times are naive local times)
+    repeated = pd.concat([data.iloc[np.sort(rng.choice(len(data), 300, replace=False))],
+                          data.loc['2024-11-03 01:00':'2024-11-03 01:59']])
+    repeated['SOLAR'] = rng.random(len(repeated))
+    pd.concat([data, repeated]).to_parquet(path)
+
+
+def replay(path, timezone, max_pending=streaming_cleaning.PENDING_LIMIT):
+    """
+    This method cleans the replay of a raw file with the streaming cleaner.
+
+    :param path:        the path of the raw file
+    :param timezone:    the timezone of the installation
+    :param max_pending: the maximum number of readings that are held back
+
+    :return:            the cleaned solar values, indexed by time
+    """
+    cleaner = streaming_cleaning.StreamingCleaner(timezone, max_pending=max_pending)
+
+    async def collect():
+        return [record async for record in streaming_cleaning.clean_stream(streaming_cleaning.read_replay(path),
+                                                                           cleaner)]
+
+    records = asyncio.run(collect())
+    return pd.Series([solar for _, solar, _ in records], index=pd.DatetimeIndex([time for time, _, _ in records]))
+
+
+@pytest.mark.parametrize('start, timezone', [('2024-03-07', 'America/Chicago'),
+                                             ('2024-10-31', 'America/Los_Angeles'),
+                                             ('2024-06-01', 'America/New_York')])
+def test_replay_matches_batch(tmp_path, monkeypatch, start, timezone):
+    path = str(tmp_path / 'raw.parquet')
+    make_raw_file(path, start, 6, seed=len(timezone))
+    monkeypatch.setattr(preprocessing, 'sun_times_cache', SunriseSunsetCache())
+
+    expected, _ = preprocessing.clean_solar_file(path, timezone)
+    result = replay(path, timezone)
+
+    assert result.index.equals(expected.index)
+    np.testing.assert_allclose(result.to_numpy(), expected['SOLAR'].to_numpy(dtype=float), rtol=1e-6, atol=1e-7)
+
+
+def test_pending_readings_are_bounded(tmp_path):
+    path = str(tmp_path / 'raw.parquet')
+    make_raw_file(path, '2024-06-01', 2, seed=0)
+    cleaner = streaming_cleaning.StreamingCleaner('America/Chicago', max_pending=20)
+
+    data = pd.read_parquet(path).sort_index(kind='stable')
+    released = 0
+    for timestamp, solar in data['SOLAR'].items():
+        released += len(cleaner.push(timestamp, solar))
+        assert len(cleaner._pending) <= 20
+    released += len(cleaner.flush())
+
+    assert released == data.index.nunique()
+
+
+def test_timezone_aware_timestamps_are_converted():
+    naive = streaming_cleaning.StreamingCleaner('America/Chicago')
+    aware = streaming_cleaning.StreamingCleaner('America/Chicago')
+    times = pd.date_range('2024-06-01 12:00', periods=5, freq='min')
+
+    expected = [record for time in times for record in naive.push(time, 1.0)] + naive.flush()
+    result = [record for time in times.tz_localize('America/Chicago').tz_convert('UTC')
+              for record in aware.push(time, 1.0)] + aware.flush()
+
+    assert result == expected
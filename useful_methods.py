@@ -1,42 +1,49 @@
+import numpy as np
 import pandas as pd
-import pytz
-import glob
-from itertools import chain
-from datetime import datetime
-import requests
+
+from solar_position import compute_sunrise_sunset
 
 DEFAULT_TIMEZONE = 'America/Chicago'
 
+# Coordinates of Chicago, used when the location of an installation is unknown
+DEFAULT_LATITUDE = 41.8781
+DEFAULT_LONGITUDE = -87.6298
+
+# Coordinates of the reference city of each timezone of the dataset
+TIMEZONE_COORDINATES = {
+    'America/Chicago': (41.8781, -87.6298),
+    'America/New_York': (40.7128, -74.0060),
+    'America/Detroit': (42.3314, -83.0458),
+    'America/Denver': (39.7392, -104.9903),
+    'America/Los_Angeles': (34.0522, -118.2437),
+    'America/Puerto_Rico': (18.4655, -66.1057),
+    'America/Bogota': (4.7110, -74.0721),
+}
 
-def find_installations_with_solar_in_2023_or_2024(installationIds):
+
+def find_installations_with_solar_in_2023_or_2024(installationIds, catalog=None):
     """
     This method is responsible for finding and returning all the installations of the initial list that contain solar
     measurements in 2023 or 2024.
 
     :param   installationIds: the initial list of installation ids
+    :param   catalog:         the catalog of the dataset (loaded from disk if not given)
 
     :return: the list of installations with solar in 2023 or 2024
     """
 
-    # Initialize an empty list to store the files
-    installations = []
-
-    # Iterate over the installation ids
-    for installationId in installationIds:
+    # Import the catalog here, so that the cleaning methods do not depend on the dataset
+    from dataset_catalog import load_catalog, find_installations
 
-        # Retrieve the solar files of 2023 or 2024
-        solar_files = (glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installationId}/*_SOLAR_{2023}*.parquet',
-                                 recursive=True) +
-                       glob.glob(f'/mnt/12TB/tasos/us_dataset/1min/{installationId}/*_SOLAR_{2024}*.parquet',
-                                 recursive=True))
-        # If this list is not empty
-        if solar_files:
+    # Load the catalog of the dataset instead of scanning the directory of each installation
+    if catalog is None:
+        catalog = load_catalog()
 
-            # Add the installation under examination to the list
-            installations.append(installationId)
+    # Retrieve the installations that have solar files in 2023 or 2024
+    installations_with_solar = set(find_installations(catalog, 'SOLAR', (2023, 2024)))
 
-    # Return the list with installations
-    return installations
+    # Return the installations of the initial list that have solar files
+    return [installationId for installationId in installationIds if installationId in installations_with_solar]
 
 
 def handle_timezones(df, timezone):
@@ -50,129 +57,111 @@ def handle_timezones(df, timezone):
     :return:         The dataset after moving it to the desired timezone.
     """
 
-    # Preprocess time index
-    df.sort_index(inplace=True)
-    df = df[~df.index.duplicated(keep='last')]
+    # Preprocess time index, sorting it and removing the duplicates only when needed
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    if not df.index.is_unique:
+        df = df[~df.index.duplicated(keep='last')]
 
-    # Get the default timezone
-    tz = pytz.timezone(DEFAULT_TIMEZONE)
+    # Localize and convert index to timezone in one vectorized call. The ambiguous minutes (when the clocks go back)
+    # are resolved by position to standard time and the non-existent minutes (when the clocks go forward) are shifted
+    # by one hour, as the per-element pytz localization with is_dst=False did.
+    df.index = df.index.tz_localize(DEFAULT_TIMEZONE, ambiguous=np.zeros(len(df.index), dtype=bool),
+                                    nonexistent=pd.Timedelta(hours=1)).tz_convert(timezone)
 
-    # Handle timezone issues of NonExistentTimeError and AmbiguousTimeError
-    try:
-        # Localize and convert index to timezone
-        df.index = df.index.tz_localize(DEFAULT_TIMEZONE).tz_convert(timezone)
+    return df
 
-    except (pytz.NonExistentTimeError, pytz.AmbiguousTimeError):
+def get_timezone_coordinates(timezone):
+    """
+    This method returns the coordinates that are used for an installation whose exact location is unknown, namely the
+    coordinates of the reference city of its timezone.
 
-        # Store original time index
-        original_index = df.index.copy()
+    :param timezone: the timezone of the installation
 
-        # Fill ambiguous and non-existent values with 'NaT'
-        df.index = df.index.tz_localize(DEFAULT_TIMEZONE, ambiguous='NaT', nonexistent='NaT')
+    :return:         the latitude and the longitude of the reference city (Chicago for unknown timezones)
+    """
+    return TIMEZONE_COORDINATES.get(timezone, (DEFAULT_LATITUDE, DEFAULT_LONGITUDE))
 
-        # Find days with issues
-        nat_datetimes = original_index[df.index.date != original_index.date]
 
-        # Localize with pytz
-        df.reset_index(inplace=True)
-        df.loc[df['localminute'].isnull(), 'localminute'] = [tz.localize(dt) for dt in nat_datetimes]
-        df.set_index('localminute', inplace=True)
+def get_sunrise_sunset_series(dates, timezone_str, latitude=None, longitude=None):
+    """
+    This method computes the sunrise and the sunset of many days at once with the local solar position engine.
 
-        # Convert index to timezone
-        df.index = df.index.tz_convert(timezone)
-    return df
+    :param dates:        the dates under examination
+    :param timezone_str: the timezone of the installation
+    :param latitude:     the latitude of the installation (defaults to the reference city of the timezone)
+    :param longitude:    the longitude of the installation (defaults to the reference city of the timezone)
 
-# Function to get sunrise and sunset times from the Sunrise-Sunset API
-def get_sunrise_sunset(date, timezone_str):
-    # Convert the date to string format YYYY-MM-DD
-    date_str = date.strftime('%Y-%m-%d')
-
-    # API URL to get sunrise and sunset for a date in a given timezone
-    url = f"https://api.sunrise-sunset.org/json?lat=41.8781&lng=-87.6298&date={date_str}&formatted=0"
-
-    # Make the API request
-    response = requests.get(url)
-
-    # Check if the response is valid
-    if response.status_code == 200:
-        data = response.json()
-        if 'results' in data:
-            # Extract the sunrise and sunset times in UTC
-            sunrise_utc = data['results']['sunrise']
-            sunset_utc = data['results']['sunset']
-
-            # Convert the string timezone to a pytz timezone object
-            timezone = pytz.timezone(timezone_str)
-
-            # Convert UTC times to the desired timezone
-            sunrise = datetime.fromisoformat(sunrise_utc).astimezone(timezone)
-            sunset = datetime.fromisoformat(sunset_utc).astimezone(timezone)
-
-            return sunrise, sunset
-        else:
-            print(f"Error: Unable to retrieve sunrise/sunset times for {date_str}")
-            return None, None
-    else:
-        print(f"Error: Unable to reach API for {date_str}")
-        return None, None
+    :return:             a dataframe indexed by date with the 'sunrise' and 'sunset' columns
+    """
 
+    # Use the reference city of the timezone when the location is unknown
+    if latitude is None or longitude is None:
+        latitude, longitude = get_timezone_coordinates(timezone_str)
 
-# Function to zero out solar values between sunrise and sunset
-def zero_out_solar_between_sunrise_sunset(data, sunrise, sunset):
-    # Iterate over the unique days in the dataframe
+    # Compute the sunrise and sunset of all the days in one call
+    dates = list(dates)
+    sunrise, sunset = compute_sunrise_sunset(dates, latitude, longitude, timezone_str)
 
-    if sunrise and sunset:
-        # Mask the data for the time range between sunrise and sunset
-        mask = (data.index <= sunrise) & (data.index >= sunset)
+    return pd.DataFrame({'sunrise': sunrise, 'sunset': sunset}, index=dates)
 
-        # Set the solar values to 0 for the time range between sunrise and sunset
-        data.loc[mask, 'SOLAR'] = 0
 
-        '''
-        # Create a mask for the time range between sunrise and sunset
-        mask = (data.index >= sunrise) & (data.index <= sunset)
+# Function to get sunrise and sunset times of a day
+def get_sunrise_sunset(date, timezone_str, latitude=None, longitude=None):
+    # Compute the sunrise and sunset locally instead of requesting them from an API
+    times = get_sunrise_sunset_series([date], timezone_str, latitude, longitude)
+    sunrise, sunset = times['sunrise'].iloc[0], times['sunset'].iloc[0]
 
-        # Get only the data between sunrise and sunset
-        filtered_data = data.loc[mask]
+    # Check if the sun rises and sets on this day
+    if pd.isnull(sunrise) or pd.isnull(sunset):
+        print(f"Error: Unable to compute sunrise/sunset times for {date.strftime('%Y-%m-%d')}")
+        return None, None
 
-        # Iterate over the rows where 'SOLAR' is zero
-        for idx in filtered_data.index[filtered_data['SOLAR'] == 0]:
-            # Get the previous and next non-zero values
-            prev_val = data.loc[:idx, 'SOLAR'].iloc[:-1].replace(0, pd.NA).dropna().iloc[-1]
-            next_val = data.loc[idx:, 'SOLAR'].iloc[1:].replace(0, pd.NA).dropna().iloc[0]
+    return sunrise, sunset
 
-            # Replace the zero value with the mean of the previous and next values
-            data.at[idx, 'SOLAR'] = (prev_val + next_val) / 2
-        '''
 
-    return data
+def map_sunrise_sunset_to_index(index, sun_times):
+    """
+    This method maps each timestamp of an index to the sunrise and the sunset of its day, so that the whole series of
+    an installation can be masked at once instead of day by day.
 
-def zero_out_solar_between_sunrise_sunset(data, sunrise, sunset):
-    # Iterate over the unique days in the dataframe
+    :param index:     the timezone-aware index of the data
+    :param sun_times: a dataframe indexed by date with the 'sunrise' and 'sunset' columns
 
-    if sunrise and sunset:
-        # Mask the data for the time range between sunrise and sunset
-        mask = (data.index <= sunrise) & (data.index >= sunset)
+    :return:          the sunrise and the sunset of each timestamp as arrays aligned with the index (NaT for the days
+                      that are missing from sun_times)
+    """
 
-        # Set the solar values to 0 for the time range between sunrise and sunset
-        data.loc[mask, 'SOLAR'] = 0
+    # Find the local day of each timestamp
+    days = index.normalize().tz_localize(None)
 
-        '''
-        # Create a mask for the time range between sunrise and sunset
-        mask = (data.index >= sunrise) & (data.index <= sunset)
+    # Sort the days of the sunrise/sunset table and search the day of each timestamp
+    sun_days = pd.DatetimeIndex(pd.to_datetime(sun_times.index))
+    order = np.argsort(sun_days.asi8, kind='stable')
+    sun_days = sun_days[order]
+    positions = np.clip(sun_days.searchsorted(days), 0, len(sun_days) - 1)
 
-        # Get only the data between sunrise and sunset
-        filtered_data = data.loc[mask]
+    # Keep only the exact matches
+    found = np.asarray(sun_days[positions] == days)
+    sunrise = sun_times['sunrise'].array[order][positions]
+    sunset = sun_times['sunset'].array[order][positions]
+    sunrise[~found] = pd.NaT
+    sunset[~found] = pd.NaT
 
-        # Iterate over the rows where 'SOLAR' is zero
-        for idx in filtered_data.index[filtered_data['SOLAR'] == 0]:
-            # Get the previous and next non-zero values
-            prev_val = data.loc[:idx, 'SOLAR'].iloc[:-1].replace(0, pd.NA).dropna().iloc[-1]
-            next_val = data.loc[idx:, 'SOLAR'].iloc[1:].replace(0, pd.NA).dropna().iloc[0]
+    return sunrise, sunset
 
-            # Replace the zero value with the mean of the previous and next values
-            data.at[idx, 'SOLAR'] = (prev_val + next_val) / 2
-        '''
+
+# Function to zero out solar values before sunrise and after sunset
+def zero_out_solar_between_sunrise_sunset(data, sunrise, sunset):
+    # The sunrise and sunset are either the timestamps of one day or arrays with one timestamp per row
+    if sunrise is None or sunset is None:
+        return data
+
+    # Mask the data before sunrise and after sunset (rows without sunrise/sunset are left untouched)
+    mask = np.asarray((data.index < sunrise) | (data.index > sunset))
+
+    # Set the solar values to 0 outside the time range between sunrise and sunset
+    data.loc[mask, 'SOLAR'] = 0
 
     return data
 
@@ -210,31 +199,58 @@ def correct_solar_zeros_between_sunrise_sunset(data, sunrise, sunset):
     Correct zero values in the 'SOLAR' column between sunrise and sunset
     by replacing them with the mean of the previous and next non-zero values.
 
+    The zeros are corrected one after the other, so a corrected zero is the previous
+    non-zero value of the zero that follows it. The previous and next values are
+    searched within the same day only, which allows a frame with many days to be
+    corrected at once when the sunrise and sunset are given per row.
+
     Parameters:
-        data (pd.DataFrame): DataFrame with a datetime index and a 'SOLAR' column.
-        sunrise (str): The sunrise time as a string.
-        sunset (str): The sunset time as a string.
+        data (pd.DataFrame): DataFrame with a sorted datetime index and a 'SOLAR' column.
+        sunrise: The sunrise time, either one timestamp or one timestamp per row.
+        sunset: The sunset time, either one timestamp or one timestamp per row.
 
     Returns:
         pd.DataFrame: The updated DataFrame with corrected solar values.
     """
     # Create a mask for the time range between sunrise and sunset
-    mask = (data.index >= sunrise) & (data.index <= sunset)
-
-    # Get the indices of rows with zero 'SOLAR' values within the mask
-    zero_indices = data.loc[mask & (data['SOLAR'] == 0)].index
-
-    for idx in zero_indices:
-        # Get the previous non-zero value
-        prev_val = data.loc[:idx, 'SOLAR'].replace(0, pd.NA).dropna().iloc[-1] \
-            if not data.loc[:idx, 'SOLAR'].replace(0, pd.NA).dropna().empty else 0
-
-        # Get the next non-zero value
-        next_val = data.loc[idx:, 'SOLAR'].replace(0, pd.NA).dropna().iloc[0] \
-            if not data.loc[idx:, 'SOLAR'].replace(0, pd.NA).dropna().empty else 0
-
-        # Replace the zero value with the mean of the previous and next values
-        data.at[idx, 'SOLAR'] = (prev_val + next_val) / 2 if prev_val and next_val else prev_val or next_val
+    mask = np.asarray((data.index >= sunrise) & (data.index <= sunset))
+
+    # Find the non-zero values and the zeros that need to be corrected
+    values = data['SOLAR'].to_numpy(dtype=float, copy=True)
+    non_zero = (values != 0) & ~np.isnan(values)
+    zeros = mask & (values == 0)
+
+    if not zeros.any():
+        return data
+
+    # Find the first and last position of the day of each row
+    positions = np.arange(len(values))
+    days = data.index.normalize().asi8
+    day_start = np.r_[True, days[1:] != days[:-1]]
+    day_end = np.r_[days[1:] != days[:-1], True]
+    first_of_day = np.maximum.accumulate(np.where(day_start, positions, 0))
+    last_of_day = np.minimum.accumulate(np.where(day_end, positions, len(values))[::-1])[::-1]
+
+    # Find the position of the previous and next non-zero value of each row within its day
+    previous_position = np.maximum.accumulate(np.where(non_zero, positions, -1))
+    next_position = np.minimum.accumulate(np.where(non_zero, positions, len(values))[::-1])[::-1]
+    has_previous = previous_position >= first_of_day
+    has_next = next_position <= last_of_day
+    previous_value = values[np.clip(previous_position, 0, None)]
+    next_value = values[np.clip(next_position, None, len(values) - 1)]
+
+    # Count the zeros corrected since the previous non-zero value (or the start of the day), because each corrected
+    # zero is the previous value of the next one
+    zero_count = np.r_[0, np.cumsum(zeros)]
+    chain_start = np.maximum(previous_position + 1, first_of_day)
+    order = zero_count[positions + 1] - zero_count[chain_start]
+
+    # The k-th zero between two non-zero values converges to the next value: next + (previous - next) / 2^k
+    corrected = np.where(has_previous & has_next, next_value + np.ldexp(previous_value - next_value, -order),
+                         np.where(has_previous, previous_value, np.where(has_next, next_value, 0)))
+
+    # Replace the zero values with the corrected values
+    values[zeros] = corrected[zeros]
+    data['SOLAR'] = values
 
     return data
-